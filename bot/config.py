@@ -1,4 +1,5 @@
 import os
+import re
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -12,6 +13,113 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 # Database path
 DB_PATH = os.getenv('DATABASE_PATH', 'chat_bot.db')
 
+# Размер пула соединений с БД (число постоянных соединений и потоков)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 4))
+
+# Профиль SQLite: применяется к каждому соединению пула
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -64000))  # < 0 - в КиБ, > 0 - в страницах
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 268435456))  # байт, 0 - выключено
+SQLITE_TEMP_STORE = os.getenv('SQLITE_TEMP_STORE', 'MEMORY')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+# Обслуживание SQLite: checkpoint WAL и PRAGMA optimize (сек, 0 - выключено)
+SQLITE_CHECKPOINT_INTERVAL = int(os.getenv('SQLITE_CHECKPOINT_INTERVAL', 300))
+SQLITE_OPTIMIZE_INTERVAL = int(os.getenv('SQLITE_OPTIMIZE_INTERVAL', 3600))
+
+# Журнал сообщений: размер пакета, интервал записи и лимит очереди
+JOURNAL_BATCH_SIZE = int(os.getenv('JOURNAL_BATCH_SIZE', 200))
+JOURNAL_FLUSH_INTERVAL_MS = int(os.getenv('JOURNAL_FLUSH_INTERVAL_MS', 50))
+JOURNAL_MAX_QUEUE = int(os.getenv('JOURNAL_MAX_QUEUE', 10000))
+
+# Хранение сообщений: разделы по месяцам, сколько месяцев держать в БД (0 - все),
+# каталог сжатых архивов старых разделов и интервал проверки (сек)
+MESSAGE_RETENTION_MONTHS = int(os.getenv('MESSAGE_RETENTION_MONTHS', 3))
+MESSAGE_ARCHIVE_DIR = os.getenv('MESSAGE_ARCHIVE_DIR', 'archive')
+MESSAGE_COMPACT_INTERVAL = int(os.getenv('MESSAGE_COMPACT_INTERVAL', 3600))
+
+# Удаление данных по /delete_my_data: строк за транзакцию и пауза между транзакциями (мс)
+ERASURE_CHUNK_SIZE = int(os.getenv('ERASURE_CHUNK_SIZE', 500))
+ERASURE_PAUSE_MS = int(os.getenv('ERASURE_PAUSE_MS', 50))
+
+# Баны: жалоб до автобана, его длительность (сек) и интервал снятия истёкших банов в БД (сек)
+MAX_REPORTS_FOR_BAN = int(os.getenv('MAX_REPORTS_FOR_BAN', 5))
+BAN_DURATION = int(os.getenv('BAN_DURATION', 7 * 24 * 3600))
+BAN_EXPIRY_INTERVAL = float(os.getenv('BAN_EXPIRY_INTERVAL', 60))
+
+# Отправка сообщений: лимиты Telegram (всего/на чат), очередь и повторы
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', 30))
+SEND_PER_CHAT_RATE = float(os.getenv('SEND_PER_CHAT_RATE', 1))
+SEND_PER_CHAT_BURST = float(os.getenv('SEND_PER_CHAT_BURST', 3))
+SEND_MAX_QUEUE = int(os.getenv('SEND_MAX_QUEUE', 10000))
+SEND_WORKERS = int(os.getenv('SEND_WORKERS', 8))
+SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', 3))
+# Сколько секунд вызов может ждать очереди и повторов в сумме
+SEND_CALL_DEADLINE = float(os.getenv('SEND_CALL_DEADLINE', 60))
+
+# JSON-файл со списком запрещённых слов {категория: [слова]} (перечитывается при изменении)
+FORBIDDEN_KEYWORDS_PATH = os.getenv('FORBIDDEN_KEYWORDS_PATH')
+
+# Кеш профилей пользователей: максимум записей и время жизни (сек)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 300))
+
+# Хранилище состояний FSM: sqlite, redis или memory; кеш и интервал пакетной записи
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'sqlite')
+FSM_REDIS_URL = os.getenv('FSM_REDIS_URL', 'redis://localhost:6379/0')
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', 10000))
+FSM_FLUSH_INTERVAL_MS = int(os.getenv('FSM_FLUSH_INTERVAL_MS', 100))
+
+# Кластер: число шардов (1 - обычный режим одним процессом), роль процесса (router/shard),
+# номер шарда и брокер для очередей между процессами
+CLUSTER_SHARDS = int(os.getenv('CLUSTER_SHARDS', 1))
+CLUSTER_ROLE = os.getenv('CLUSTER_ROLE', 'shard')
+CLUSTER_SHARD_ID = int(os.getenv('CLUSTER_SHARD_ID', 0))
+CLUSTER_BROKER_URL = os.getenv('CLUSTER_BROKER_URL', 'redis://localhost:6379/1')
+
+# Вебхук: если задан публичный URL, бот принимает обновления по HTTP вместо long polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+# Обязателен при WEBHOOK_URL: у всех реплик и после перезапуска секрет один и тот же
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+
+# Обработка обновлений: число воркеров, лимит очереди и лимит очереди одного пользователя
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 64))
+UPDATE_MAX_QUEUE = int(os.getenv('UPDATE_MAX_QUEUE', 10000))
+UPDATE_MAX_PER_USER = int(os.getenv('UPDATE_MAX_PER_USER', 20))
+
+# Антиспам: сообщений, нажатий кнопок и поисков в секунду на пользователя и допустимый всплеск
+THROTTLE_MESSAGE_RATE = float(os.getenv('THROTTLE_MESSAGE_RATE', 3))
+THROTTLE_MESSAGE_BURST = int(os.getenv('THROTTLE_MESSAGE_BURST', 10))
+THROTTLE_CALLBACK_RATE = float(os.getenv('THROTTLE_CALLBACK_RATE', 2))
+THROTTLE_CALLBACK_BURST = int(os.getenv('THROTTLE_CALLBACK_BURST', 5))
+THROTTLE_SEARCH_RATE = float(os.getenv('THROTTLE_SEARCH_RATE', 0.5))
+THROTTLE_SEARCH_BURST = int(os.getenv('THROTTLE_SEARCH_BURST', 3))
+
+# Логи: уровень, файл с ротацией (размер в байтах и число архивов), JSON в файле
+# и лимит INFO-записей в секунду с одного места в коде (0 - без прореживания)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_JSON = os.getenv('LOG_JSON', '1') not in ('0', 'false', 'False', '')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 20))
+
+# Метрики Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 - выключены, без накладных расходов)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+
+# Сторож цикла событий: пауза дольше порога (мс) - снимаем стек и считаем виновника (0 - выключен)
+LOOP_LAG_THRESHOLD_MS = int(os.getenv('LOOP_LAG_THRESHOLD_MS', 100))
+LOOP_LAG_INTERVAL_MS = int(os.getenv('LOOP_LAG_INTERVAL_MS', 100))
+LOOP_LAG_TOP = int(os.getenv('LOOP_LAG_TOP', 10))
+
+# Свой сервер Bot API (локальный telegram-bot-api или заглушка для нагрузочного теста)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
 # Admin ID (optional) - преобразуем в число
 ADMIN_ID_STR = os.getenv('ADMIN_ID')
 ADMIN_ID = int(ADMIN_ID_STR) if ADMIN_ID_STR and ADMIN_ID_STR.isdigit() else None
@@ -24,6 +132,12 @@ SUBSCRIPTION_COST_LIFETIME = int(os.getenv('SUBSCRIPTION_COST_LIFETIME', 499))
 if not BOT_TOKEN:
     raise ValueError("❌ BOT_TOKEN не установлен в .env файле!")
 
+if WEBHOOK_URL and not WEBHOOK_SECRET:
+    raise ValueError("❌ WEBHOOK_SECRET не установлен: он обязателен вместе с WEBHOOK_URL!")
+
+if WEBHOOK_SECRET and not re.fullmatch(r'[A-Za-z0-9_-]{1,256}', WEBHOOK_SECRET):
+    raise ValueError("❌ WEBHOOK_SECRET: допустимы 1-256 символов A-Z, a-z, 0-9, _ и -")
+
 if ADMIN_ID:
     print(f"✅ Администратор установлен: {ADMIN_ID}")
 else:
@@ -0,0 +1,201 @@
+"""Bounded LRU cache with TTL for hot database rows
+
+Benchmark of handler throughput with and without the profile cache:
+    python -m bot.database.cache --users 50000 --handlers 20000
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """LRU cache with per-entry expiry and hit/miss/eviction counters.
+
+    Every write or invalidation bumps `version` and records it for the
+    key. A reader that loaded a row from the database passes the version
+    it saw before the query to put(), so a row read before a concurrent
+    write to the same key is never cached; reads of other keys are.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300):
+        """Initialize cache
+
+        Args:
+            max_size: Maximum number of entries
+            ttl: Seconds an entry stays valid
+        """
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.version = 0
+        self._entries: OrderedDict = OrderedDict()
+        # key -> version последней записи; вытесненные из учёта записи поднимают _floor
+        self._written: OrderedDict = OrderedDict()
+        self._floor = 0
+
+        # Счётчики
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return cached value or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any, version: Optional[int] = None):
+        """Store value unless the cache was invalidated after `version`."""
+        if version is not None and self._written.get(key, self._floor) > version:
+            return
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _written_now(self, key: Hashable):
+        self.version += 1
+        self._written[key] = self.version
+        self._written.move_to_end(key)
+        while len(self._written) > self.max_size:
+            _, version = self._written.popitem(last=False)
+            self._floor = max(self._floor, version)
+
+    def update(self, key: Hashable, **fields):
+        """Write fields through to a cached dict entry (if present)."""
+        self._written_now(key)
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[0].update(fields)
+
+    def invalidate(self, key: Hashable):
+        """Drop one entry."""
+        self._written_now(key)
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self.version += 1
+        self._floor = self.version
+        self._written.clear()
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        """Return cache counters."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': (self.hits / lookups * 100) if lookups else 0.0,
+        }
+
+
+async def benchmark(users: int, handlers: int, concurrency: int, write_share: float, directory: str):
+    """Simulated handlers (own + partner profile read, some profile writes) on Database.
+
+    Profiles are picked with a Zipf-like skew: a few users are active
+    most of the time, as in the bot.
+
+    Args:
+        users: Registered profiles
+        handlers: Handlers to run per variant
+        concurrency: Handlers running at once
+        write_share: Share of handlers that also update the profile
+        directory: Where to create the benchmark database
+    """
+    import asyncio
+    import itertools
+    import logging
+    import os
+    import random
+    import shutil
+
+    import bot.main as main
+
+    # Инициализация БД на каждый вариант пишет в лог - здесь это шум
+    logging.getLogger('bot').setLevel(logging.WARNING)
+
+    variants = {
+        # ttl=0: запись устаревает сразу, каждый get_user идёт в SQLite
+        'uncached': (1, 0),
+        'cache 1k': (1000, 300),
+        'cache 10k (default)': (10000, 300),
+    }
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, users + 1)))
+
+    def percentile(values, share):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * share))]
+
+    print(f"{users} profiles, {handlers} handlers x {concurrency} at once, {write_share:.0%} with a profile write")
+    print(f"{'variant':<20} {'handlers/s':>11} {'p50 ms':>7} {'p99 ms':>7} {'hits':>7} {'misses':>7} "
+          f"{'evictions':>10} {'hit rate':>9}")
+    for name, (max_size, ttl) in variants.items():
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        main.DB_PATH = os.path.join(directory, 'cache_bench.db')
+        main.MESSAGE_ARCHIVE_DIR = os.path.join(directory, 'archive')
+        db = main.Database()
+        await db.init_db()
+        await db.pool.run(lambda conn: conn.executemany(
+            'INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)',
+            ((user_id, f'user{user_id}', 'User') for user_id in range(users))
+        ))
+        db.user_cache = LRUCache(max_size=max_size, ttl=ttl)
+        rng = random.Random(9)
+        picks = iter(rng.choices(range(users), cum_weights=weights, k=handlers * 2))
+        latencies = []
+
+        async def handler():
+            user_id, partner_id = next(picks), next(picks)
+            started = time.perf_counter()
+            await db.get_user(user_id)
+            await db.get_user(partner_id)
+            if rng.random() < write_share:
+                await db.update_user(user_id, interests='музыка')
+            latencies.append(time.perf_counter() - started)
+
+        async def worker(count):
+            for _ in range(count):
+                await handler()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(handlers // concurrency) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stats = db.user_cache.stats()
+        db.close()
+        print(f"{name:<20} {len(latencies) / elapsed:>11.0f} {percentile(latencies, 0.5) * 1000:>7.2f} "
+              f"{percentile(latencies, 0.99) * 1000:>7.2f} {stats['hits']:>7} {stats['misses']:>7} "
+              f"{stats['evictions']:>10} {stats['hit_rate']:>8.1f}%")
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description='Profile cache handler throughput benchmark')
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--handlers', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--write-share', type=float, default=0.05)
+    parser.add_argument('--dir', default='cache_bench')
+    cli = parser.parse_args()
+    asyncio.run(benchmark(cli.users, cli.handlers, cli.concurrency, cli.write_share, cli.dir))
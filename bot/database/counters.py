@@ -0,0 +1,142 @@
+"""Trigger-maintained aggregate counters and hourly/daily rollups"""
+
+import sqlite3
+from typing import Dict, List, Tuple
+
+# Счётчик -> запрос полного пересчёта
+COUNTER_QUERIES = {
+    'total_users': 'SELECT COUNT(*) FROM users',
+    'premium_users': 'SELECT COUNT(*) FROM users WHERE is_premium = 1',
+    'active_chats': "SELECT COUNT(*) FROM chats WHERE status = 'active'",
+    'total_chats': 'SELECT COUNT(*) FROM chats',
+    'total_messages': 'SELECT COUNT(*) FROM messages',
+}
+
+# Формат корзин для агрегатов по времени
+ROLLUP_PERIODS = {
+    'hour': '%Y-%m-%d %H:00',
+    'day': '%Y-%m-%d',
+}
+
+
+def _add(name: str, delta: str) -> str:
+    return f"UPDATE stats_counters SET value = value + ({delta}) WHERE name = '{name}';"
+
+
+def _roll(name: str) -> str:
+    return ' '.join(
+        f"INSERT INTO stats_rollups (period, bucket, name, value) "
+        f"VALUES ('{period}', strftime('{fmt}', 'now'), '{name}', 1) "
+        f"ON CONFLICT (period, bucket, name) DO UPDATE SET value = value + 1;"
+        for period, fmt in ROLLUP_PERIODS.items()
+    )
+
+
+def _trigger(name: str, event: str, body: str, when: str = '') -> str:
+    when = f' WHEN {when}' if when else ''
+    return f'CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} FOR EACH ROW{when} BEGIN {body} END'
+
+
+COUNTER_SCHEMA = [
+    '''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS stats_rollups (
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket, name)
+        )
+    ''',
+    # Начальные значения - полный пересчёт один раз при миграции
+    *(
+        f"INSERT OR REPLACE INTO stats_counters (name, value) VALUES ('{name}', ({sql}))"
+        for name, sql in COUNTER_QUERIES.items()
+    ),
+    _trigger('trg_users_insert', 'INSERT ON users',
+             _add('total_users', '1') + _add('premium_users', 'NEW.is_premium IS 1') + _roll('new_users')),
+    _trigger('trg_users_delete', 'DELETE ON users',
+             _add('total_users', '-1') + _add('premium_users', '-(OLD.is_premium IS 1)')),
+    _trigger('trg_users_premium', 'UPDATE OF is_premium ON users',
+             _add('premium_users', '(NEW.is_premium IS 1) - (OLD.is_premium IS 1)'),
+             when='(NEW.is_premium IS 1) != (OLD.is_premium IS 1)'),
+    _trigger('trg_chats_insert', 'INSERT ON chats',
+             _add('total_chats', '1') + _add('active_chats', "NEW.status IS 'active'") + _roll('new_chats')),
+    _trigger('trg_chats_delete', 'DELETE ON chats',
+             _add('total_chats', '-1') + _add('active_chats', "-(OLD.status IS 'active')")),
+    _trigger('trg_chats_status', 'UPDATE OF status ON chats',
+             _add('active_chats', "(NEW.status IS 'active') - (OLD.status IS 'active')"),
+             when="(NEW.status IS 'active') != (OLD.status IS 'active')"),
+    _trigger('trg_messages_insert', 'INSERT ON messages',
+             _add('total_messages', '1') + _roll('messages')),
+    _trigger('trg_messages_delete', 'DELETE ON messages',
+             _add('total_messages', '-1')),
+]
+
+
+def message_delete_trigger(table: str) -> str:
+    """Counter trigger for deletes from a message partition."""
+    return _trigger(f'trg_{table}_delete', f'DELETE ON {table}', _add('total_messages', '-1'))
+
+
+def add_messages(conn: sqlite3.Connection, count: int):
+    """Count `count` inserted messages at once.
+
+    Message partitions have no insert trigger: the journal writes a batch
+    and bumps the counter and rollups once, in the same transaction.
+    """
+    conn.execute("UPDATE stats_counters SET value = value + ? WHERE name = 'total_messages'", (count,))
+    for period, fmt in ROLLUP_PERIODS.items():
+        conn.execute(
+            "INSERT INTO stats_rollups (period, bucket, name, value) VALUES (?, strftime(?, 'now'), 'messages', ?) "
+            "ON CONFLICT (period, bucket, name) DO UPDATE SET value = value + excluded.value",
+            (period, fmt, count)
+        )
+
+
+def read_counters(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Return every counter (a primary-key scan of a handful of rows)."""
+    return {row[0]: row[1] for row in conn.execute('SELECT name, value FROM stats_counters')}
+
+
+def read_rollups(conn: sqlite3.Connection, period: str, limit: int = 24) -> List[Tuple[str, Dict[str, int]]]:
+    """Return the latest `limit` buckets of a period as [(bucket, {name: value})], newest first."""
+    buckets = [row[0] for row in conn.execute(
+        'SELECT DISTINCT bucket FROM stats_rollups WHERE period = ? ORDER BY bucket DESC LIMIT ?',
+        (period, limit)
+    )]
+    if not buckets:
+        return []
+    result = {bucket: {} for bucket in buckets}
+    rows = conn.execute(
+        'SELECT bucket, name, value FROM stats_rollups WHERE period = ? AND bucket >= ?',
+        (period, buckets[-1])
+    )
+    for bucket, name, value in rows:
+        if bucket in result:
+            result[bucket][name] = value
+    return [(bucket, result[bucket]) for bucket in buckets]
+
+
+def recount(conn: sqlite3.Connection, fix: bool = False) -> Dict[str, Tuple[int, int]]:
+    """Compare counters with a full recount.
+
+    Returns:
+        {name: (counter, actual)} for every counter that drifted
+    """
+    counters = read_counters(conn)
+    drift = {}
+    for name, sql in COUNTER_QUERIES.items():
+        actual = conn.execute(sql).fetchone()[0]
+        if counters.get(name) != actual:
+            drift[name] = (counters.get(name), actual)
+            if fix:
+                conn.execute(
+                    'INSERT OR REPLACE INTO stats_counters (name, value) VALUES (?, ?)', (name, actual)
+                )
+    return drift
@@ -2,7 +2,8 @@ import sqlite3
 import json
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
-from config import DB_PATH, BAN_DURATION, MAX_REPORTS_FOR_BAN
+from bot.config import DB_PATH
+from bot.database.migrations import migrate, DB_SCHEMA_MIGRATIONS
 
 
 class Database:
@@ -121,6 +122,9 @@ class Database:
         ''')
         
         conn.commit()
+        
+        # Индексы и дальнейшие изменения схемы
+        migrate(conn, DB_SCHEMA_MIGRATIONS)
         conn.close()
     
     # ===== USER METHODS =====
@@ -394,6 +398,23 @@ class Database:
         
         return [dict(row) for row in rows]
     
+    async def unban_expired(self) -> int:
+        """Unban every user whose ban has expired in one UPDATE. Returns row count."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                UPDATE users 
+                SET is_banned = 0, ban_reason = NULL, ban_expires_at = NULL
+                WHERE is_banned = 1 AND ban_expires_at IS NOT NULL 
+                AND ban_expires_at < ?
+            ''', (datetime.now().isoformat(' '),))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+    
     # ===== REPORT METHODS =====
     
     async def create_report(self, chat_id: str, reporter_id: int, reported_user_id: int,
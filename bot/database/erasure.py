@@ -0,0 +1,262 @@
+"""Durable background erasure of a user's data in small chunks"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .partitions import MessagePartitions
+from .pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+ERASURE_SCHEMA = [
+    '''
+        CREATE TABLE IF NOT EXISTS erasure_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            step TEXT,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME
+        )
+    ''',
+    # Не больше одной незавершённой заявки на пользователя
+    '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_erasure_jobs_open
+        ON erasure_jobs (user_id) WHERE status IN ('pending', 'running')
+    ''',
+]
+
+# Таблица -> индексированные столбцы с ID пользователя; users - последней
+ERASURE_TABLES: List[Tuple[str, Tuple[str, ...]]] = [
+    ('votes', ('voter_id', 'votee_id')),
+    ('reports', ('reporter_id', 'reported_user_id')),
+    ('chats', ('user1_id', 'user2_id')),
+    ('users', ('user_id',)),
+]
+
+Job = Dict[str, Any]
+
+
+class ErasureWorker:
+    """Deletes users' data from a durable job queue without stalling the bot.
+
+    /delete_my_data only inserts a row into erasure_jobs. The worker takes
+    pending jobs one at a time and deletes matching rows in chunks of
+    chunk_size, each chunk a short transaction selected through an index:
+        DELETE FROM t WHERE rowid IN (SELECT rowid FROM t WHERE col = ? LIMIT n)
+    and sleeps between chunks so other writers get the lock. Progress is
+    committed with every chunk, so a restart resumes where it stopped;
+    jobs left 'running' by a dead process are picked up again after
+    stale_after seconds. Last, the compressed archives of old partitions
+    that contain the user's messages are rewritten without them.
+    """
+
+    def __init__(self, pool: ConnectionPool, partitions: MessagePartitions,
+                 chunk_size: int = 500, pause: float = 0.05, poll_interval: float = 30,
+                 stale_after: float = 300,
+                 on_done: Optional[Callable[[int, int], Awaitable[Any]]] = None):
+        """Initialize erasure worker
+
+        Args:
+            pool: Connection pool of the main database
+            partitions: Message partitions (their tables and archives are erased too)
+            chunk_size: Rows deleted per transaction
+            pause: Seconds to sleep between chunks
+            poll_interval: Seconds between checks for jobs from other processes
+            stale_after: Seconds without progress before a running job is retaken
+            on_done: Awaited with (user_id, deleted rows) when a job finishes
+        """
+        self.pool = pool
+        self.partitions = partitions
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.on_done = on_done
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.current: Optional[Job] = None
+
+        # Метрики
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.rows_deleted = 0
+        self.chunks = 0
+        self.max_chunk_latency = 0.0
+
+    async def enqueue(self, user_id: int) -> Tuple[Job, bool]:
+        """Queue erasure of a user's data.
+
+        Returns:
+            (job, created) - created is False if a job was already open
+        """
+        def _enqueue(conn):
+            created = conn.execute(
+                'INSERT OR IGNORE INTO erasure_jobs (user_id) VALUES (?)', (user_id,)
+            ).rowcount == 1
+            job = conn.execute(
+                "SELECT * FROM erasure_jobs WHERE user_id = ? AND status IN ('pending', 'running')",
+                (user_id,)
+            ).fetchone()
+            return dict(job), created
+
+        job, created = await self.pool.run(_enqueue)
+        self._wakeup.set()
+        return job, created
+
+    async def job_of(self, user_id: int) -> Optional[Job]:
+        """Latest job of a user (for progress reports)."""
+        row = await self.pool.fetchone(
+            'SELECT * FROM erasure_jobs WHERE user_id = ? ORDER BY id DESC LIMIT 1', (user_id,)
+        )
+        return dict(row) if row else None
+
+    def start(self):
+        """Start the worker task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop after the current chunk; the job resumes on the next start."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def _claim(self, conn) -> Optional[Job]:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(f'''
+                SELECT * FROM erasure_jobs
+                WHERE status = 'pending'
+                   OR (status = 'running' AND updated_at < datetime('now', '-{int(self.stale_after)} seconds'))
+                ORDER BY id LIMIT 1
+            ''').fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE erasure_jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (row['id'],)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return dict(row) if row else None
+
+    async def _run(self):
+        while True:
+            # Сбрасываем до выборки: заявка, добавленная во время выборки, разбудит снова
+            self._wakeup.clear()
+            try:
+                job = await self.pool.run(self._claim)
+            except Exception as e:
+                logger.error(f"❌ Ошибка очереди удаления данных: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._process(job)
+
+    def _targets(self, conn) -> List[Tuple[str, str]]:
+        targets = [(name, 'sender_id') for name in self.partitions.tables(conn)]
+        for table, columns in ERASURE_TABLES:
+            targets.extend((table, column) for column in columns)
+        return targets
+
+    def _delete_chunk(self, conn, job_id: int, table: str, column: str, user_id: int) -> int:
+        deleted = conn.execute(f'''
+            DELETE FROM {table} WHERE rowid IN (
+                SELECT rowid FROM {table} WHERE {column} = ? LIMIT ?
+            )
+        ''', (user_id, self.chunk_size)).rowcount
+        conn.execute('''
+            UPDATE erasure_jobs SET step = ?, deleted = deleted + ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (f'{table}.{column}', deleted, job_id))
+        return deleted
+
+    async def _process(self, job: Job):
+        user_id = job['user_id']
+        self.current = job
+        try:
+            for table, column in await self.pool.run(self._targets):
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        deleted = await self.pool.run(self._delete_chunk, job['id'], table, column, user_id)
+                    except sqlite3.OperationalError:
+                        if table in await self.pool.run(self.partitions.tables):
+                            raise
+                        # Раздел успели перенести в архив
+                        break
+                    self.chunks += 1
+                    self.rows_deleted += deleted
+                    self.max_chunk_latency = max(self.max_chunk_latency, time.perf_counter() - started)
+                    job['deleted'] += deleted
+                    job['step'] = f'{table}.{column}'
+                    if deleted < self.chunk_size:
+                        break
+                    # Отдаём блокировку записи другим запросам
+                    await asyncio.sleep(self.pause)
+
+            # Архивы старых разделов переписываются целиком, порциями тут не выйдет
+            job['step'] = 'archives'
+            deleted = await self.partitions.delete_archived_sender(user_id)
+            self.rows_deleted += deleted
+            job['deleted'] += deleted
+            await self.pool.execute('''
+                UPDATE erasure_jobs SET step = 'archives', deleted = deleted + ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (deleted, job['id']))
+
+            await self.pool.execute('''
+                UPDATE erasure_jobs SET status = 'done', step = NULL,
+                    updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (job['id'],))
+            self.jobs_done += 1
+            logger.info(f"🗑️ Данные пользователя {user_id} удалены: {job['deleted']} записей")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.jobs_failed += 1
+            logger.error(f"❌ Ошибка удаления данных {user_id}: {e}")
+            await self.pool.execute(
+                "UPDATE erasure_jobs SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (str(e), job['id'])
+            )
+            return
+        finally:
+            self.current = None
+
+        if self.on_done:
+            try:
+                await self.on_done(user_id, job['deleted'])
+            except Exception as e:
+                logger.error(f"❌ Ошибка уведомления об удалении данных {user_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return worker counters."""
+        current = self.current
+        return {
+            'current_user': current['user_id'] if current else None,
+            'current_step': current['step'] if current else None,
+            'current_deleted': current['deleted'] if current else 0,
+            'jobs_done': self.jobs_done,
+            'jobs_failed': self.jobs_failed,
+            'rows_deleted': self.rows_deleted,
+            'chunks': self.chunks,
+            'max_chunk_latency_ms': self.max_chunk_latency * 1000,
+        }
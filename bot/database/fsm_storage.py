@@ -0,0 +1,296 @@
+"""Persistent FSM storage with an in-process LRU and batched writes"""
+
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from bot.utils.resp import RespClient
+from .pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# (состояние, данные) одного ключа
+Record = Tuple[Optional[str], Dict[str, Any]]
+
+
+def storage_key(key: StorageKey) -> str:
+    """Flatten a StorageKey into a string usable by any backend."""
+    parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+    if key.thread_id:
+        parts.append(str(key.thread_id))
+    parts.append(key.destiny)
+    return ':'.join(parts)
+
+
+def key_ids(key: str) -> Tuple[int, int, int]:
+    """(bot_id, chat_id, user_id) of a key built by storage_key."""
+    bot_id, chat_id, user_id = key.split(':')[:3]
+    return int(bot_id), int(chat_id), int(user_id)
+
+
+class SQLiteBackend:
+    """FSM records in the fsm_state table of the bot database."""
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+
+    async def load(self, key: str) -> Record:
+        row = await self.pool.fetchone('SELECT state, data FROM fsm_state WHERE key = ?', (key,))
+        if row is None:
+            return None, {}
+        return row['state'], json.loads(row['data']) if row['data'] else {}
+
+    async def save_many(self, records: Dict[str, Record]):
+        upserts = [
+            (key, state, json.dumps(data, ensure_ascii=False))
+            for key, (state, data) in records.items() if state is not None or data
+        ]
+        deletes = [(key,) for key, (state, data) in records.items() if state is None and not data]
+
+        def _save(conn):
+            if upserts:
+                conn.executemany('''
+                    INSERT INTO fsm_state (key, state, data, updated_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (key) DO UPDATE SET
+                        state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+                ''', upserts)
+            if deletes:
+                conn.executemany('DELETE FROM fsm_state WHERE key = ?', deletes)
+
+        await self.pool.run(_save)
+
+    async def in_state(self, state: str) -> Dict[str, Record]:
+        rows = await self.pool.fetchall('SELECT key, state, data FROM fsm_state WHERE state = ?', (state,))
+        return {row['key']: (row['state'], json.loads(row['data']) if row['data'] else {}) for row in rows}
+
+    async def close(self):
+        pass
+
+
+class RedisBackend:
+    """FSM records in any server speaking the Redis protocol."""
+
+    def __init__(self, url: str = 'redis://localhost:6379/0', prefix: str = 'fsm'):
+        """Initialize Redis backend
+
+        Args:
+            url: redis://[:password@]host[:port][/db]
+            prefix: Prefix prepended to every key
+        """
+        self.client = RespClient(url)
+        self.prefix = prefix
+
+    async def load(self, key: str) -> Record:
+        value = await self.client.call('GET', f'{self.prefix}:{key}')
+        if value is None:
+            return None, {}
+        record = json.loads(value)
+        return record.get('state'), record.get('data') or {}
+
+    async def save_many(self, records: Dict[str, Record]):
+        commands = []
+        for key, (state, data) in records.items():
+            if state is None and not data:
+                commands.append(('DEL', f'{self.prefix}:{key}'))
+            else:
+                value = json.dumps({'state': state, 'data': data}, ensure_ascii=False)
+                commands.append(('SET', f'{self.prefix}:{key}', value))
+        if commands:
+            await self.client.execute(commands)
+
+    async def in_state(self, state: str, batch: int = 1000) -> Dict[str, Record]:
+        records = {}
+        cursor = b'0'
+        while True:
+            cursor, keys = await self.client.call('SCAN', cursor, 'MATCH', f'{self.prefix}:*', 'COUNT', batch)
+            values = await self.client.execute([('GET', key) for key in keys]) if keys else []
+            for key, value in zip(keys, values):
+                if value is None:
+                    continue
+                record = json.loads(value)
+                if record.get('state') == state:
+                    records[key.decode()[len(self.prefix) + 1:]] = (state, record.get('data') or {})
+            if cursor == b'0':
+                return records
+
+    async def close(self):
+        await self.client.close()
+
+
+class CachedStorage(BaseStorage):
+    """aiogram FSM storage: LRU cache in front of a persistent backend.
+
+    Reads are served from the cache; a miss loads the record once.
+    Writes update the cache immediately and mark the key dirty; dirty
+    keys are written to the backend in one batch every flush_interval
+    seconds, so a burst of set_state/update_data calls costs a single
+    round trip. Dirty entries are never evicted before they are flushed.
+    """
+
+    def __init__(self, backend=None, max_size: int = 10000, flush_interval: float = 0.1):
+        """Initialize cached storage
+
+        Args:
+            backend: SQLiteBackend, RedisBackend or None (memory only)
+            max_size: Clean records kept in memory (without a backend memory is
+                the only copy: nothing is evicted)
+            flush_interval: Seconds between batched writes
+        """
+        self.backend = backend
+        self.max_size = max(1, max_size)
+        self.flush_interval = flush_interval
+        self._records: OrderedDict = OrderedDict()
+        self._dirty: set = set()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.flushed_keys = 0
+        self.failed_flushes = 0
+
+    def start(self):
+        """Start the background flush task."""
+        if self._task is None and self.backend is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _record(self, key: str) -> Record:
+        record = self._records.get(key)
+        if record is not None:
+            self._records.move_to_end(key)
+            self.hits += 1
+            return record
+        self.misses += 1
+        if self.backend is None:
+            return None, {}
+
+        # Параллельные промахи по одному ключу читают бэкенд один раз
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = self._loading[key] = asyncio.ensure_future(self.backend.load(key))
+            loading.add_done_callback(lambda _: self._loading.pop(key, None))
+        record = await asyncio.shield(loading)
+
+        # Пока читали, ключ мог быть записан - запись в памяти новее
+        current = self._records.get(key)
+        if current is not None:
+            return current
+        self._store(key, record)
+        return record
+
+    def _store(self, key: str, record: Record):
+        if self.backend is None and record == (None, {}):
+            # Без бэкенда пустая запись ничем не отличается от отсутствующей
+            self._records.pop(key, None)
+            return
+        self._records[key] = record
+        self._records.move_to_end(key)
+        if len(self._records) > self.max_size:
+            self._evict()
+
+    def _evict(self):
+        if self.backend is None:
+            # Записи в памяти - единственная копия
+            return
+        excess = len(self._records) - self.max_size
+        for key in list(self._records):
+            if excess <= 0:
+                break
+            if key in self._dirty:
+                continue
+            del self._records[key]
+            excess -= 1
+
+    def _write(self, key: str, record: Record):
+        if self.backend is not None:
+            self._dirty.add(key)
+        self._store(key, record)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        skey = storage_key(key)
+        _, data = await self._record(skey)
+        state = state.state if isinstance(state, State) else state
+        self._write(skey, (state, data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._record(storage_key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        skey = storage_key(key)
+        state, _ = await self._record(skey)
+        self._write(skey, (state, dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._record(storage_key(key))
+        return dict(data)
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        skey = storage_key(key)
+        state, current = await self._record(skey)
+        current = {**current, **data}
+        self._write(skey, (state, current))
+        return dict(current)
+
+    async def in_state(self, state: StateType) -> Dict[str, Record]:
+        """Every record in a state, unflushed writes included (a full scan, for startup recovery)."""
+        state = state.state if isinstance(state, State) else state
+        records = await self.backend.in_state(state) if self.backend is not None else {}
+        for key, record in self._records.items():
+            if record[0] == state:
+                records[key] = record
+            else:
+                records.pop(key, None)
+        return records
+
+    async def flush(self):
+        """Write every dirty record to the backend in one batch."""
+        if not self._dirty or self.backend is None:
+            return
+        keys, self._dirty = self._dirty, set()
+        batch = {key: self._records[key] for key in keys if key in self._records}
+        try:
+            await self.backend.save_many(batch)
+            self.flushes += 1
+            self.flushed_keys += len(batch)
+            if len(self._records) > self.max_size:
+                self._evict()
+        except Exception as e:
+            # Вернуть ключи в очередь записи, если их не перезаписали
+            self.failed_flushes += 1
+            self._dirty |= keys
+            logger.error(f"❌ Ошибка записи FSM ({len(batch)} ключей): {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self.backend is not None:
+            await self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return storage counters."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._records),
+            'dirty': len(self._dirty),
+            'hit_rate': (self.hits / lookups * 100) if lookups else 0.0,
+            'flushes': self.flushes,
+            'flushed_keys': self.flushed_keys,
+            'failed_flushes': self.failed_flushes,
+        }
@@ -0,0 +1,130 @@
+"""Write-behind journal that batches chat message inserts"""
+
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+MessageRow = Tuple[str, int, str]
+
+
+class MessageJournal:
+    """Buffers relayed messages in memory and writes them in batches.
+
+    Messages are flushed with a single executemany() transaction once
+    batch_size rows are buffered or flush_interval seconds have passed.
+    The queue is bounded: when it is full, put() waits, which applies
+    back-pressure to the relay handler instead of growing memory.
+    """
+
+    def __init__(self, pool: ConnectionPool, batch_size: int = 200,
+                 flush_interval: float = 0.05, max_queue: int = 10000,
+                 writer: Optional[Callable[..., None]] = None):
+        """Initialize journal
+
+        Args:
+            pool: Connection pool used for flushing
+            batch_size: Maximum rows written per transaction
+            flush_interval: Seconds to wait for more rows before flushing
+            max_queue: Maximum buffered rows before put() blocks
+            writer: writer(conn, rows) storing a batch (default: INSERT INTO messages)
+        """
+        self.pool = pool
+        self.writer = writer or self._insert
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_queue))
+        self._task: Optional[asyncio.Task] = None
+
+        # Счётчики
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_rows = 0
+        self.last_flush_size = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+    @staticmethod
+    def _insert(conn, rows: List[MessageRow]):
+        conn.executemany('''
+            INSERT INTO messages (chat_id, sender_id, content)
+            VALUES (?, ?, ?)
+        ''', rows)
+
+    def start(self):
+        """Start background flushing task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything buffered and stop the background task."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def put(self, chat_id: str, sender_id: int, content: str):
+        """Buffer one message (waits while the queue is full)."""
+        if self._task is None:
+            # Журнал не запущен - пишем напрямую
+            await self._flush([(chat_id, sender_id, content)])
+            return
+        await self._queue.put((chat_id, sender_id, content))
+
+    def _drain(self, batch: List[Optional[MessageRow]]):
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            self._drain(batch)
+            if len(batch) < self.batch_size and batch[-1] is not None:
+                await asyncio.sleep(self.flush_interval)
+                self._drain(batch)
+
+            stopping = batch[-1] is None
+            rows = [row for row in batch if row is not None]
+            if rows:
+                await self._flush(rows)
+            if stopping:
+                return
+
+    async def _flush(self, rows: List[MessageRow]):
+        started = time.perf_counter()
+        try:
+            await self.pool.run(self.writer, rows)
+            self.flushed_rows += len(rows)
+        except Exception as e:
+            self.failed_rows += len(rows)
+            logger.error(f"❌ Ошибка записи журнала ({len(rows)} сообщений): {e}")
+
+        latency = time.perf_counter() - started
+        self.flushes += 1
+        self.last_flush_size = len(rows)
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, float]:
+        """Return journal counters."""
+        return {
+            'queue_depth': self.queue_depth,
+            'flushes': self.flushes,
+            'flushed_rows': self.flushed_rows,
+            'failed_rows': self.failed_rows,
+            'last_flush_size': self.last_flush_size,
+            'last_flush_latency_ms': self.last_flush_latency * 1000,
+            'max_flush_latency_ms': self.max_flush_latency * 1000,
+        }
@@ -0,0 +1,234 @@
+"""Periodic WAL checkpoints and query planner maintenance
+
+Write-heavy benchmark of SQLite pragma profiles and explicit checkpoints:
+    python -m bot.database.maintenance --seconds 10 --writers 32
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from .pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteMaintenance:
+    """Background task that keeps a WAL database healthy.
+
+    In WAL mode the write-ahead log only shrinks after a checkpoint.
+    SQLite checkpoints automatically on commit, but a long-lived reader
+    can keep it from finishing, so the log is checkpointed explicitly
+    every checkpoint_interval seconds. PRAGMA optimize refreshes the
+    planner statistics for tables whose indexes changed a lot.
+    """
+
+    def __init__(self, pool: ConnectionPool, checkpoint_interval: float = 300,
+                 optimize_interval: float = 3600, checkpoint_mode: str = 'PASSIVE'):
+        """Initialize maintenance task
+
+        Args:
+            pool: Connection pool to run maintenance on
+            checkpoint_interval: Seconds between wal_checkpoint calls (0 disables)
+            optimize_interval: Seconds between PRAGMA optimize calls (0 disables)
+            checkpoint_mode: PASSIVE, FULL, RESTART or TRUNCATE
+        """
+        self.pool = pool
+        self.checkpoint_interval = checkpoint_interval
+        self.optimize_interval = optimize_interval
+        self.checkpoint_mode = checkpoint_mode.upper()
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.checkpoints = 0
+        self.optimizations = 0
+        self.last_checkpoint: Optional[Dict[str, Any]] = None
+
+    def start(self):
+        """Start the maintenance task."""
+        if self._task is None and (self.checkpoint_interval > 0 or self.optimize_interval > 0):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def checkpoint(self) -> Dict[str, Any]:
+        """Checkpoint the WAL and return (busy, log pages, checkpointed pages)."""
+        started = time.perf_counter()
+        busy, log_pages, checkpointed = await self.pool.run(
+            lambda conn: tuple(conn.execute(f'PRAGMA wal_checkpoint({self.checkpoint_mode})').fetchone())
+        )
+        self.checkpoints += 1
+        self.last_checkpoint = {
+            'busy': bool(busy),
+            'log_pages': log_pages,
+            'checkpointed_pages': checkpointed,
+            'latency_ms': (time.perf_counter() - started) * 1000,
+        }
+        if busy:
+            logger.warning(f"⚠️ Checkpoint WAL не завершён: занято читателем ({checkpointed}/{log_pages} стр.)")
+        return self.last_checkpoint
+
+    async def optimize(self):
+        """Run PRAGMA optimize."""
+        await self.pool.run(lambda conn: conn.execute('PRAGMA optimize').fetchall())
+        self.optimizations += 1
+
+    async def _run(self):
+        now = time.monotonic()
+        next_checkpoint = now + self.checkpoint_interval if self.checkpoint_interval > 0 else None
+        next_optimize = now + self.optimize_interval if self.optimize_interval > 0 else None
+
+        while True:
+            due = min(t for t in (next_checkpoint, next_optimize) if t is not None)
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            now = time.monotonic()
+            try:
+                if next_checkpoint is not None and now >= next_checkpoint:
+                    next_checkpoint = now + self.checkpoint_interval
+                    await self.checkpoint()
+                if next_optimize is not None and now >= next_optimize:
+                    next_optimize = now + self.optimize_interval
+                    await self.optimize()
+            except Exception as e:
+                logger.error(f"❌ Ошибка обслуживания БД: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return maintenance counters."""
+        return {
+            'checkpoints': self.checkpoints,
+            'optimizations': self.optimizations,
+            'last_checkpoint': self.last_checkpoint,
+        }
+
+
+async def benchmark(seconds: float, writers: int, size: int, directory: str):
+    """Message inserts with counter updates while readers scan, per pragma profile.
+
+    A slow reader periodically holds a read transaction open (stats,
+    backups) - in rollback journal mode it blocks writers, in WAL mode
+    it keeps the log from being reset.
+
+    Args:
+        seconds: Run time per profile
+        writers: Concurrent writing handlers
+        size: Pool size
+        directory: Where to create the benchmark database
+    """
+    import os
+    import random
+    import shutil
+    import sqlite3
+    import threading
+
+    bot_profile = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -64000,
+                   'mmap_size': 268435456, 'temp_store': 'MEMORY', 'busy_timeout': 5000}
+    profiles = [
+        ('DELETE, FULL (sqlite default)', {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 5000},
+         0, 'PASSIVE'),
+        ('WAL, FULL', {'journal_mode': 'WAL', 'synchronous': 'FULL', 'busy_timeout': 5000}, 0, 'PASSIVE'),
+        ('WAL, NORMAL (bot profile)', bot_profile, 0, 'PASSIVE'),
+        ('bot profile + PASSIVE 1 s', bot_profile, 1, 'PASSIVE'),
+        ('bot profile + TRUNCATE 1 s', bot_profile, 1, 'TRUNCATE'),
+    ]
+
+    def percentile(values, share):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+    def write(conn, user_id):
+        conn.execute('INSERT INTO messages (chat_id, sender_id, content) VALUES (?, ?, ?)',
+                     (f'chat-{user_id // 2}', user_id, 'привет'))
+        conn.execute('UPDATE users SET messages_count = messages_count + 1 WHERE user_id = ?', (user_id,))
+
+    print(f"{writers} writers, pool size {size}, {seconds:g} s per profile")
+    print(f"{'profile':<30} {'writes/s':>9} {'p50 ms':>7} {'p99 ms':>8} {'busy':>5} {'WAL max MB':>11} "
+          f"{'WAL end MB':>11} {'checkpoints':>12}")
+    for name, pragmas, checkpoint_interval, checkpoint_mode in profiles:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        db_path = os.path.join(directory, 'maintenance_bench.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, messages_count INTEGER DEFAULT 0)')
+        conn.execute('CREATE TABLE messages (id INTEGER PRIMARY KEY, chat_id TEXT, sender_id INTEGER, content TEXT)')
+        conn.execute('CREATE INDEX idx_messages_chat ON messages(chat_id)')
+        conn.executemany('INSERT INTO users (user_id) VALUES (?)', ((user_id,) for user_id in range(10000)))
+        conn.commit()
+        conn.close()
+
+        pool = ConnectionPool(db_path, size=size, pragmas=pragmas)
+        pool.open()
+        maintenance = SQLiteMaintenance(pool, checkpoint_interval=checkpoint_interval, optimize_interval=0,
+                                        checkpoint_mode=checkpoint_mode)
+        maintenance.start()
+        wal_path = db_path + '-wal'
+        wal_max = [0]
+        latencies = []
+        busy = [0]
+        stop = threading.Event()
+
+        def slow_reader():
+            # Отдельное соединение: долгий SELECT держит снимок базы
+            reader = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+            try:
+                while not stop.wait(0.2):
+                    reader.execute('BEGIN')
+                    reader.execute('SELECT COUNT(*) FROM messages').fetchone()
+                    stop.wait(0.05)
+                    reader.execute('COMMIT')
+            finally:
+                reader.close()
+
+        async def writer(deadline):
+            rng = random.Random()
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    await pool.run(write, rng.randrange(10000))
+                except sqlite3.OperationalError:
+                    # database is locked: busy_timeout истёк
+                    busy[0] += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                if os.path.exists(wal_path):
+                    wal_max[0] = max(wal_max[0], os.path.getsize(wal_path))
+
+        async def reader(deadline):
+            rng = random.Random()
+            while time.perf_counter() < deadline:
+                await pool.fetchone('SELECT COUNT(*) FROM messages WHERE chat_id = ?', (f'chat-{rng.randrange(5000)}',))
+
+        reader_thread = threading.Thread(target=slow_reader)
+        reader_thread.start()
+        deadline = time.perf_counter() + seconds
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(writer(deadline) for _ in range(writers)), reader(deadline))
+        finally:
+            stop.set()
+            reader_thread.join()
+            await maintenance.stop()
+        elapsed = time.perf_counter() - started
+        wal_end = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        pool.close()
+        print(f"{name:<30} {len(latencies) / elapsed:>9.0f} {percentile(latencies, 0.5) * 1000:>7.2f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.2f} {busy[0]:>5} {wal_max[0] / 2 ** 20:>11.1f} {wal_end / 2 ** 20:>11.1f} "
+              f"{maintenance.checkpoints:>12}")
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='SQLite pragma profile write benchmark')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--writers', type=int, default=32)
+    parser.add_argument('--size', type=int, default=4)
+    parser.add_argument('--dir', default='maintenance_bench')
+    cli = parser.parse_args()
+    asyncio.run(benchmark(cli.seconds, cli.writers, cli.size, cli.dir))
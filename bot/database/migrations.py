@@ -0,0 +1,204 @@
+"""Versioned schema migrations applied idempotently at startup"""
+
+import logging
+import sqlite3
+from typing import Iterable, List, NamedTuple, Sequence, Tuple
+
+from .counters import COUNTER_SCHEMA
+from .erasure import ERASURE_SCHEMA
+from .partitions import PARTITION_MIGRATION
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    statements: Sequence[str]
+
+
+# Схема bot/main.py
+MAIN_SCHEMA_MIGRATIONS = [
+    Migration(1, 'secondary indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages (chat_id)',
+        'CREATE INDEX IF NOT EXISTS idx_messages_sender_id ON messages (sender_id)',
+        'CREATE INDEX IF NOT EXISTS idx_chats_user1_id ON chats (user1_id)',
+        'CREATE INDEX IF NOT EXISTS idx_chats_user2_id ON chats (user2_id)',
+        'CREATE INDEX IF NOT EXISTS idx_chats_status ON chats (status)',
+        'CREATE INDEX IF NOT EXISTS idx_votes_voter_id ON votes (voter_id)',
+        'CREATE INDEX IF NOT EXISTS idx_votes_votee_id ON votes (votee_id)',
+        'CREATE INDEX IF NOT EXISTS idx_reports_reporter_id ON reports (reporter_id)',
+        'CREATE INDEX IF NOT EXISTS idx_reports_reported_user_id ON reports (reported_user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_banned_users_expires_at ON banned_users (expires_at)',
+        'CREATE INDEX IF NOT EXISTS idx_users_is_premium ON users (is_premium)',
+    ]),
+    Migration(2, 'aggregate counters', COUNTER_SCHEMA),
+    Migration(3, 'one vote per chat', [
+        # Повторные голоса за тот же диалог раньше записывались - оставляем первый
+        '''
+            DELETE FROM votes WHERE id NOT IN (
+                SELECT MIN(id) FROM votes GROUP BY voter_id, chat_id
+            )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_votes_voter_chat ON votes (voter_id, chat_id)',
+        # Счётчики и рейтинг обновляются в той же транзакции, что и вставка голоса
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_votes_insert AFTER INSERT ON votes FOR EACH ROW
+            BEGIN
+                UPDATE users SET
+                    positive_votes = positive_votes + (NEW.vote_type = 'positive'),
+                    negative_votes = negative_votes + (NEW.vote_type != 'positive'),
+                    rating = (positive_votes + (NEW.vote_type = 'positive')) * 100.0
+                             / (positive_votes + negative_votes + 1)
+                WHERE user_id = NEW.votee_id;
+            END
+        ''',
+    ]),
+    Migration(4, 'fsm storage', [
+        '''
+            CREATE TABLE IF NOT EXISTS fsm_state (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+    ]),
+    Migration(5, 'monthly message partitions', PARTITION_MIGRATION),
+    Migration(6, 'erasure jobs', ERASURE_SCHEMA),
+    Migration(7, 'vote counters on delete', [
+        # Удалённые голоса (удаление данных голосовавшего) вычитаются из счётчиков и рейтинга
+        '''
+            CREATE TRIGGER IF NOT EXISTS trg_votes_delete AFTER DELETE ON votes FOR EACH ROW
+            BEGIN
+                UPDATE users SET
+                    positive_votes = positive_votes - (OLD.vote_type = 'positive'),
+                    negative_votes = negative_votes - (OLD.vote_type != 'positive'),
+                    rating = CASE WHEN positive_votes + negative_votes > 1
+                        THEN (positive_votes - (OLD.vote_type = 'positive')) * 100.0
+                             / (positive_votes + negative_votes - 1)
+                        ELSE 0.0 END
+                WHERE user_id = OLD.votee_id;
+            END
+        ''',
+        # Голоса, удалённые до триггера, остались в счётчиках - пересчитываем один раз
+        '''
+            UPDATE users SET
+                positive_votes = (SELECT COUNT(*) FROM votes WHERE votee_id = users.user_id AND vote_type = 'positive'),
+                negative_votes = (SELECT COUNT(*) FROM votes WHERE votee_id = users.user_id AND vote_type != 'positive')
+            WHERE positive_votes + negative_votes > 0
+        ''',
+        '''
+            UPDATE users SET rating = CASE WHEN positive_votes + negative_votes > 0
+                THEN positive_votes * 100.0 / (positive_votes + negative_votes) ELSE 0.0 END
+            WHERE positive_votes + negative_votes > 0 OR rating != 0
+        ''',
+    ]),
+]
+
+# Запросы горячего пути схемы bot/main.py, которые не должны сканировать таблицу
+MAIN_SCHEMA_HOT_QUERIES = [
+    ('SELECT * FROM users WHERE user_id = ?', (1,)),
+    ('SELECT user_id FROM users WHERE is_premium = 1', ()),
+    ('SELECT COUNT(*) FROM chats WHERE status = ?', ('active',)),
+    ('SELECT * FROM messages WHERE chat_id = ?', ('x',)),
+    # messages - представление над разделами; в каждом разделе нужен индекс по sender_id
+    ('SELECT id FROM messages WHERE sender_id = ?', (1,)),
+    ('DELETE FROM votes WHERE voter_id = ? OR votee_id = ?', (1, 1)),
+    ('DELETE FROM reports WHERE reporter_id = ? OR reported_user_id = ?', (1, 1)),
+    ('DELETE FROM chats WHERE user1_id = ? OR user2_id = ?', (1, 1)),
+    ('SELECT COUNT(*) FROM banned_users WHERE expires_at > ?', ('',)),
+    ("DELETE FROM banned_users WHERE expires_at > '' AND expires_at <= ?", ('',)),
+]
+
+# Схема bot/database/db.py
+DB_SCHEMA_MIGRATIONS = [
+    Migration(1, 'secondary indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_users_ban_expiry ON users (is_banned, ban_expires_at)',
+        'CREATE INDEX IF NOT EXISTS idx_users_is_premium ON users (is_premium)',
+        'CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages (chat_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_messages_sender_id ON messages (sender_id)',
+        'CREATE INDEX IF NOT EXISTS idx_chats_user1_id ON chats (user1_id)',
+        'CREATE INDEX IF NOT EXISTS idx_chats_user2_id ON chats (user2_id)',
+        'CREATE INDEX IF NOT EXISTS idx_chats_status ON chats (status)',
+        'CREATE INDEX IF NOT EXISTS idx_reports_reported_user_id ON reports (reported_user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_reports_reporter_id ON reports (reporter_id)',
+        'CREATE INDEX IF NOT EXISTS idx_bans_log_user_id ON bans_log (user_id)',
+    ]),
+]
+
+# Запросы горячего пути схемы bot/database/db.py
+DB_SCHEMA_HOT_QUERIES = [
+    ('SELECT * FROM users WHERE user_id = ?', (1,)),
+    ('SELECT user_id FROM users WHERE is_premium = 1', ()),
+    ('SELECT * FROM chats WHERE chat_id = ?', ('x',)),
+    ('SELECT * FROM chats WHERE user1_id = ? OR user2_id = ?', (1, 1)),
+    ('SELECT COUNT(*) FROM chats WHERE status = ?', ('active',)),
+    ('SELECT * FROM messages WHERE chat_id = ? ORDER BY created_at DESC LIMIT ?', ('x', 50)),
+    ('SELECT id FROM messages WHERE sender_id = ?', (1,)),
+    ('SELECT * FROM subscriptions WHERE user_id = ?', (1,)),
+    ('SELECT * FROM reports WHERE reported_user_id = ? ORDER BY created_at DESC', (1,)),
+    ('SELECT id FROM reports WHERE reporter_id = ?', (1,)),
+    ('SELECT id FROM bans_log WHERE user_id = ?', (1,)),
+    ('''
+        UPDATE users SET is_banned = 0, ban_reason = NULL, ban_expires_at = NULL
+        WHERE is_banned = 1 AND ban_expires_at IS NOT NULL AND ban_expires_at < ?
+    ''', ('',)),
+]
+
+
+def migrate(conn: sqlite3.Connection, migrations: Iterable[Migration]) -> List[int]:
+    """Apply pending migrations, each in its own transaction.
+
+    Applied versions are recorded in schema_migrations, so running this
+    on every startup only executes what is new.
+
+    Returns:
+        Versions applied by this call
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    applied = {row[0] for row in conn.execute('SELECT version FROM schema_migrations')}
+
+    done = []
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version in applied:
+            continue
+        # IMMEDIATE: несколько процессов при старте не применят одну миграцию дважды
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (migration.version,)).fetchone():
+                conn.rollback()
+                continue
+            for statement in migration.statements:
+                conn.execute(statement)
+            conn.execute(
+                'INSERT INTO schema_migrations (version, name) VALUES (?, ?)',
+                (migration.version, migration.name)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info(f"✅ Миграция {migration.version} применена: {migration.name}")
+        done.append(migration.version)
+    return done
+
+
+def full_scans(conn: sqlite3.Connection, queries: Iterable[Tuple[str, tuple]]) -> List[Tuple[str, str]]:
+    """Return (query, plan step) for every query whose plan scans a whole table.
+
+    Scans of a covering index (e.g. COUNT(*) over an index) are allowed.
+    """
+    offenders = []
+    for sql, params in queries:
+        for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params):
+            detail = row[-1]
+            if detail.startswith('SCAN') and 'COVERING INDEX' not in detail:
+                offenders.append((sql, detail))
+    return offenders
@@ -0,0 +1,429 @@
+"""Monthly message partitions with retention and compressed archives
+
+Benchmark of insert rate and file size over simulated months:
+    python -m bot.database.partitions --months 12 --rows-per-month 500000 --retention 3
+"""
+
+import asyncio
+import logging
+import lzma
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .counters import add_messages, message_delete_trigger
+from .pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+MessageRow = Tuple[str, int, str]
+
+PARTITION_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id TEXT NOT NULL,
+        sender_id INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# Миграция: прежняя таблица messages становится первым разделом, messages - представлением
+PARTITION_MIGRATION = [
+    '''
+        CREATE TABLE IF NOT EXISTS message_partitions (
+            name TEXT PRIMARY KEY,
+            month TEXT NOT NULL,
+            rows INTEGER,
+            archive_path TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            archived_at DATETIME
+        )
+    ''',
+    'ALTER TABLE messages RENAME TO messages_legacy',
+    '''
+        INSERT INTO message_partitions (name, month)
+        SELECT 'messages_legacy', COALESCE(strftime('%Y-%m', MAX(created_at)), strftime('%Y-%m', 'now'))
+        FROM messages_legacy
+    ''',
+    'CREATE VIEW messages AS SELECT id, chat_id, sender_id, content, created_at FROM messages_legacy',
+]
+
+
+def utcnow() -> datetime:
+    # CURRENT_TIMESTAMP в SQLite - тоже UTC
+    return datetime.now(timezone.utc)
+
+
+def partition_name(month: str) -> str:
+    """Table holding a month ('2026-10' -> messages_2026_10)."""
+    return 'messages_' + month.replace('-', '_')
+
+
+def months_before(month: str, count: int) -> str:
+    """Month `count` months before `month` (both 'YYYY-MM')."""
+    year, number = map(int, month.split('-'))
+    index = year * 12 + number - 1 - count
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+class MessagePartitions:
+    """Stores chat messages in one table per month.
+
+    Inserts only touch the current month's table, so its indexes stay
+    small and hot in the page cache however large the history grows.
+    `messages` is a UNION ALL view over the partitions kept in the hot
+    database, rebuilt whenever a partition is added or archived.
+
+    Partitions older than retention_months are copied into a standalone
+    SQLite file, compressed with xz into archive_dir and dropped; their
+    pages are reused by new partitions, so the database file stops
+    growing once the retention window is full. Archives open with any
+    SQLite client after `xz -d`; erasing a user rewrites the archives
+    that hold their messages (delete_archived_sender).
+    """
+
+    def __init__(self, pool: ConnectionPool, retention_months: int = 3, archive_dir: str = 'archive',
+                 compact_interval: float = 3600, clock: Callable[[], datetime] = utcnow):
+        """Initialize message partitions
+
+        Args:
+            pool: Connection pool of the main database
+            retention_months: Months kept in the hot database, current one included (0 - keep all)
+            archive_dir: Directory for compressed archives of old partitions
+            compact_interval: Seconds between retention checks
+            clock: Current UTC time (replaced in benchmarks)
+        """
+        self.pool = pool
+        self.retention_months = retention_months
+        self.archive_dir = archive_dir
+        self.compact_interval = compact_interval
+        self.clock = clock
+        self._current: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.archived = 0
+        self.archived_rows = 0
+        self.last_archive: Optional[Dict[str, Any]] = None
+
+    def current_month(self) -> str:
+        return self.clock().strftime('%Y-%m')
+
+    @staticmethod
+    def tables(conn) -> List[str]:
+        """Partitions in the hot database, oldest first."""
+        return [row[0] for row in conn.execute(
+            'SELECT name FROM message_partitions WHERE archived_at IS NULL ORDER BY month, name'
+        )]
+
+    @classmethod
+    def _rebuild_view(cls, conn):
+        selects = [f'SELECT id, chat_id, sender_id, content, created_at FROM {name}' for name in cls.tables(conn)]
+        conn.execute('DROP VIEW IF EXISTS messages')
+        conn.execute('CREATE VIEW messages AS ' + (' UNION ALL '.join(selects) or
+                     'SELECT NULL AS id, NULL AS chat_id, NULL AS sender_id, NULL AS content, NULL AS created_at WHERE 0'))
+
+    @classmethod
+    def last_id(cls, conn) -> int:
+        """Largest message id ever handed out (hot partitions and archives)."""
+        archived = conn.execute(
+            "SELECT value FROM stats_counters WHERE name = 'last_archived_message_id'"
+        ).fetchone()
+        ids = [archived[0] if archived else 0]
+        for name in cls.tables(conn):
+            ids.append(conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {name}').fetchone()[0])
+            sequence = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (name,)).fetchone()
+            if sequence:
+                ids.append(sequence[0])
+        return max(ids)
+
+    def ensure(self, conn, month: str) -> str:
+        """Create the partition of a month if it does not exist yet."""
+        name = partition_name(month)
+        if conn.execute('SELECT 1 FROM message_partitions WHERE name = ?', (name,)).fetchone():
+            return name
+
+        # IMMEDIATE: раздел может одновременно создавать другой процесс (шард)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not conn.execute('SELECT 1 FROM message_partitions WHERE name = ?', (name,)).fetchone():
+                # id продолжает нумерацию прошлых разделов: в представлении messages он уникален
+                last_id = self.last_id(conn)
+                conn.execute(PARTITION_SCHEMA.format(name=name))
+                conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (name, last_id))
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_chat_id ON {name} (chat_id)')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_sender_id ON {name} (sender_id)')
+                conn.execute(message_delete_trigger(name))
+                conn.execute('INSERT INTO message_partitions (name, month) VALUES (?, ?)', (name, month))
+                self._rebuild_view(conn)
+                logger.info(f"🗄️ Создан раздел сообщений {name}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return name
+
+    def insert(self, conn, rows: List[MessageRow]):
+        """Write a batch into the current month's partition (journal writer)."""
+        month = self.current_month()
+        if month != self._current:
+            self.ensure(conn, month)
+            self._current = month
+        conn.executemany(f'''
+            INSERT INTO {partition_name(month)} (chat_id, sender_id, content)
+            VALUES (?, ?, ?)
+        ''', rows)
+        add_messages(conn, len(rows))
+
+    def delete_sender(self, conn, sender_id: int) -> int:
+        """Delete a user's messages from every hot partition."""
+        deleted = 0
+        for name in self.tables(conn):
+            deleted += conn.execute(f'DELETE FROM {name} WHERE sender_id = ?', (sender_id,)).rowcount
+        return deleted
+
+    async def delete_archived_sender(self, sender_id: int) -> int:
+        """Delete a user's messages from every archive, rewriting the affected files."""
+        rows = await self.pool.fetchall(
+            'SELECT name, archive_path FROM message_partitions WHERE archive_path IS NOT NULL ORDER BY month'
+        )
+        deleted = 0
+        for row in rows:
+            path = row['archive_path']
+            if not os.path.exists(path):
+                logger.warning(f"⚠️ Архив раздела {row['name']} не найден: {path}")
+                continue
+            # Распаковка и сжатие - чистый CPU/диск, как и при архивации
+            removed = await asyncio.to_thread(self._rewrite_archive, path, sender_id)
+            if removed:
+                await self.pool.run(self._archive_shrunk, row['name'], removed)
+                deleted += removed
+        return deleted
+
+    @classmethod
+    def _rewrite_archive(cls, path: str, sender_id: int) -> int:
+        raw = path + '.erase.db'
+        with lzma.open(path, 'rb') as src, open(raw, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        try:
+            conn = sqlite3.connect(raw)
+            try:
+                removed = conn.execute('DELETE FROM messages WHERE sender_id = ?', (sender_id,)).rowcount
+                conn.commit()
+                if removed:
+                    # Иначе удалённый текст останется в свободных страницах файла
+                    conn.execute('VACUUM')
+            finally:
+                conn.close()
+        except Exception:
+            os.remove(raw)
+            raise
+        if removed:
+            cls._compress(raw, path)
+        else:
+            os.remove(raw)
+        return removed
+
+    @staticmethod
+    def _archive_shrunk(conn, name: str, removed: int):
+        conn.execute('UPDATE message_partitions SET rows = rows - ? WHERE name = ?', (removed, name))
+        conn.execute("UPDATE stats_counters SET value = value - ? WHERE name = 'archived_messages'", (removed,))
+        conn.commit()
+
+    def start(self):
+        """Start the background compaction task."""
+        if self._task is None and self.retention_months > 0 and self.compact_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.compact()
+            except Exception as e:
+                logger.error(f"❌ Ошибка архивации сообщений: {e}")
+            await asyncio.sleep(self.compact_interval)
+
+    async def compact(self) -> List[str]:
+        """Archive every partition that fell out of the retention window."""
+        if self.retention_months <= 0:
+            return []
+        oldest_kept = months_before(self.current_month(), self.retention_months - 1)
+        rows = await self.pool.fetchall(
+            'SELECT name FROM message_partitions WHERE archived_at IS NULL AND month < ? ORDER BY month',
+            (oldest_kept,)
+        )
+        archived = []
+        for row in rows:
+            await self.archive(row['name'])
+            archived.append(row['name'])
+        return archived
+
+    async def archive(self, name: str) -> Dict[str, Any]:
+        """Copy a partition into archive_dir/<name>.db.xz and drop it."""
+        started = time.perf_counter()
+        os.makedirs(self.archive_dir, exist_ok=True)
+        raw = os.path.join(self.archive_dir, f'{name}.db')
+        path = raw + '.xz'
+
+        exported = await self.pool.run(self._export, name, raw)
+        # Сжатие - чистый CPU/диск, соединение пула на это время не держим
+        await asyncio.to_thread(self._compress, raw, path)
+        rows = await self.pool.run(self._drop, name, path)
+
+        self.archived += 1
+        self.archived_rows += rows
+        self.last_archive = {
+            'name': name,
+            'rows': rows,
+            'bytes': os.path.getsize(path),
+            'latency_ms': (time.perf_counter() - started) * 1000,
+        }
+        if rows != exported:
+            # Между копированием и удалением кто-то удалил свои данные
+            logger.warning(f"⚠️ Раздел {name}: в архиве {exported} строк, удалено {rows}")
+        logger.info(f"🗄️ Раздел {name} перенесён в архив {path}: {rows} сообщений")
+        return self.last_archive
+
+    @staticmethod
+    def _export(conn, name: str, raw: str) -> int:
+        if os.path.exists(raw):
+            os.remove(raw)
+        conn.execute('ATTACH DATABASE ? AS archive', (raw,))
+        try:
+            # Временный файл: при сбое архивация просто повторится
+            conn.execute('PRAGMA archive.journal_mode = OFF')
+            conn.execute('PRAGMA archive.synchronous = OFF')
+            conn.execute(PARTITION_SCHEMA.format(name='archive.messages'))
+            exported = conn.execute(f'INSERT INTO archive.messages SELECT * FROM main.{name}').rowcount
+            conn.commit()
+        finally:
+            conn.execute('DETACH DATABASE archive')
+        return exported
+
+    @staticmethod
+    def _compress(raw: str, path: str):
+        tmp = path + '.tmp'
+        with open(raw, 'rb') as src, lzma.open(tmp, 'wb', preset=6) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(tmp, path)
+        os.remove(raw)
+
+    def _drop(self, conn, name: str, path: str) -> int:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(f'SELECT COUNT(*) FROM {name}').fetchone()[0]
+            # Последний id уходит вместе с таблицей - запоминаем, чтобы новые разделы его не повторили
+            conn.execute(
+                "INSERT INTO stats_counters (name, value) VALUES ('last_archived_message_id', ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)", (self.last_id(conn),)
+            )
+            conn.execute(f'DROP TABLE {name}')
+            conn.execute(
+                'UPDATE message_partitions SET rows = ?, archive_path = ?, archived_at = CURRENT_TIMESTAMP '
+                'WHERE name = ?', (rows, path, name)
+            )
+            # total_messages считает строки горячей БД, archived_messages - ушедшие в архив
+            conn.execute("UPDATE stats_counters SET value = value - ? WHERE name = 'total_messages'", (rows,))
+            conn.execute(
+                "INSERT INTO stats_counters (name, value) VALUES ('archived_messages', ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", (rows,)
+            )
+            self._rebuild_view(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return rows
+
+    def stats(self) -> Dict[str, Any]:
+        """Return compaction counters."""
+        return {
+            'current': partition_name(self._current) if self._current else None,
+            'retention_months': self.retention_months,
+            'archived': self.archived,
+            'archived_rows': self.archived_rows,
+            'last_archive': self.last_archive,
+        }
+
+
+async def benchmark(months: int, rows_per_month: int, retention: int, batch_size: int, directory: str):
+    """Insert simulated months of traffic, compacting after each month."""
+    import random
+    import string
+    from .counters import COUNTER_SCHEMA
+    from .migrations import Migration, migrate
+
+    os.makedirs(directory, exist_ok=True)
+    db_path = os.path.join(directory, 'bench.db')
+    archive_dir = os.path.join(directory, 'archive')
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(archive_dir, ignore_errors=True)
+
+    pool = ConnectionPool(db_path, size=2, pragmas={'journal_mode': 'WAL', 'synchronous': 'NORMAL'})
+    clock = [datetime(2026, 1, 15, tzinfo=timezone.utc)]
+    partitions = MessagePartitions(pool, retention_months=retention, archive_dir=archive_dir,
+                                   clock=lambda: clock[0])
+
+    def setup(conn):
+        conn.execute(PARTITION_SCHEMA.format(name='messages'))
+        for statement in COUNTER_SCHEMA[:2]:
+            conn.execute(statement)
+        conn.execute("INSERT INTO stats_counters (name, value) VALUES ('total_messages', 0)")
+        conn.commit()
+        migrate(conn, [Migration(1, 'message partitions', PARTITION_MIGRATION)])
+
+    await pool.run(setup)
+    words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))) for _ in range(2000)]
+    chats = [f'chat-{i}' for i in range(5000)]
+
+    def size_mb(*paths: str) -> float:
+        return sum(os.path.getsize(p) for p in paths if os.path.exists(p)) / 1024 / 1024
+
+    print(f"{'month':>8} {'rows/s':>10} {'db MiB':>8} {'archive MiB':>12} {'hot rows':>10}")
+    for month in range(months):
+        batches = [
+            [(random.choice(chats), random.randint(1, 100000), ' '.join(random.choices(words, k=6)))
+             for _ in range(batch_size)]
+            for _ in range(rows_per_month // batch_size)
+        ]
+        started = time.perf_counter()
+        for batch in batches:
+            await pool.run(partitions.insert, batch)
+        rate = len(batches) * batch_size / (time.perf_counter() - started)
+
+        await partitions.compact()
+        await pool.run(lambda conn: conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone())
+        hot = (await pool.fetchone("SELECT value FROM stats_counters WHERE name = 'total_messages'"))[0]
+        archive = [os.path.join(archive_dir, f) for f in os.listdir(archive_dir)] if os.path.isdir(archive_dir) else []
+        print(f"{partitions.current_month():>8} {rate:>10.0f} {size_mb(db_path, db_path + '-wal'):>8.1f} "
+              f"{size_mb(*archive):>12.1f} {hot:>10}")
+
+        year, number = divmod(clock[0].year * 12 + clock[0].month, 12)
+        clock[0] = clock[0].replace(year=year, month=number + 1)
+    pool.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Message partition benchmark')
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--rows-per-month', type=int, default=500000)
+    parser.add_argument('--retention', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--dir', default='partition_bench')
+    cli = parser.parse_args()
+    asyncio.run(benchmark(cli.months, cli.rows_per_month, cli.retention, cli.batch_size, cli.dir))
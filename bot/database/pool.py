@@ -0,0 +1,222 @@
+"""Bounded SQLite connection pool with awaitable query execution
+
+Benchmark of handler latency with 1k concurrent simulated users:
+    python -m bot.database.pool --users 1000 --actions 5
+"""
+
+import asyncio
+import queue
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+
+class ConnectionPool:
+    """Pool of persistent SQLite connections served by dedicated worker threads.
+
+    Every connection is opened once and reused, so sqlite keeps its
+    prepared statements cached between calls. Queries run on a thread
+    pool of the same size as the pool, so the event loop never waits
+    on disk I/O. Pragmas (journal mode, cache sizes, ...) are applied
+    to every connection when it is opened.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, statement_cache_size: int = 256,
+                 timeout: float = 30.0, pragmas: Optional[Dict[str, Any]] = None):
+        """Initialize connection pool
+
+        Args:
+            db_path: Path to SQLite database file
+            size: Number of persistent connections (and worker threads)
+            statement_cache_size: Prepared statements cached per connection
+            timeout: Seconds to wait for a locked database
+            pragmas: {name: value} executed as PRAGMA name = value on connect
+        """
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.statement_cache_size = statement_cache_size
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self._connections: queue.Queue = queue.Queue(maxsize=self.size)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open one persistent connection."""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+
+    @property
+    def is_open(self) -> bool:
+        return self._executor is not None
+
+    def open(self):
+        """Open all connections and start worker threads (idempotent)."""
+        if self._executor is not None:
+            return
+        for _ in range(self.size):
+            self._connections.put(self._connect())
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='db')
+
+    def _call(self, fn: Callable[..., Any], args: tuple) -> Any:
+        """Borrow a connection, run fn in one transaction and give it back."""
+        conn = self._connections.get()
+        try:
+            result = fn(conn, *args)
+            if conn.in_transaction:
+                conn.commit()
+            return result
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._connections.put(conn)
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Run fn(conn, *args) on a pooled connection without blocking the loop."""
+        if self._executor is None:
+            self.open()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, args)
+
+    async def execute(self, sql: str, params: Iterable = ()) -> int:
+        """Execute a single write statement and return affected row count."""
+        return await self.run(lambda conn: conn.execute(sql, tuple(params)).rowcount)
+
+    async def fetchone(self, sql: str, params: Iterable = ()) -> Optional[sqlite3.Row]:
+        """Execute a query and return the first row."""
+        return await self.run(lambda conn: conn.execute(sql, tuple(params)).fetchone())
+
+    async def fetchall(self, sql: str, params: Iterable = ()) -> List[sqlite3.Row]:
+        """Execute a query and return all rows."""
+        return await self.run(lambda conn: conn.execute(sql, tuple(params)).fetchall())
+
+    async def settings(self) -> Dict[str, Any]:
+        """Return the effective value of every configured pragma."""
+        return await self.run(
+            lambda conn: {name: conn.execute(f'PRAGMA {name}').fetchone()[0] for name in self.pragmas}
+        )
+
+    def close(self):
+        """Stop worker threads and close every connection."""
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        while not self._connections.empty():
+            conn = self._connections.get_nowait()
+            try:
+                # Обновить статистику планировщика запросов перед закрытием
+                conn.execute('PRAGMA optimize')
+            except sqlite3.Error:
+                pass
+            conn.close()
+
+
+async def benchmark(users: int, actions: int, size: int, directory: str):
+    """Simulated handlers (profile read + message insert) with a connection per call vs the pool."""
+    import os
+    import random
+    import time
+
+    os.makedirs(directory, exist_ok=True)
+    profiles = {
+        'per-call connect': None,
+        'pool, default pragmas': {},
+        'pool, bot profile': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -64000,
+                              'mmap_size': 268435456, 'temp_store': 'MEMORY', 'busy_timeout': 5000},
+    }
+    read_sql = 'SELECT * FROM users WHERE user_id = ?'
+    write_sql = 'INSERT INTO messages (chat_id, sender_id, content) VALUES (?, ?, ?)'
+
+    def percentile(values: List[float], share: float) -> float:
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * share))]
+
+    print(f"{users} concurrent users x {actions} handlers, pool size {size}")
+    print(f"{'variant':<24} {'p50 ms':>8} {'p99 ms':>8} {'handlers/s':>11} {'max loop lag ms':>16}")
+    for name, pragmas in profiles.items():
+        db_path = os.path.join(directory, 'pool_bench.db')
+        for path in (db_path, db_path + '-wal', db_path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        conn = sqlite3.connect(db_path)
+        conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, rating REAL DEFAULT 0)')
+        conn.execute('CREATE TABLE messages (id INTEGER PRIMARY KEY, chat_id TEXT, sender_id INTEGER, content TEXT)')
+        conn.executemany('INSERT INTO users (user_id, username) VALUES (?, ?)',
+                         ((user_id, f'user{user_id}') for user_id in range(users)))
+        conn.commit()
+        conn.close()
+
+        pool = ConnectionPool(db_path, size=size, pragmas=pragmas) if pragmas is not None else None
+
+        # Как раньше: новое соединение на каждый запрос, синхронно внутри корутины
+        def direct(sql: str, params: tuple, write: bool):
+            conn = sqlite3.connect(db_path)
+            conn.row_factory = sqlite3.Row
+            try:
+                row = conn.execute(sql, params).fetchone()
+                if write:
+                    conn.commit()
+                return row
+            finally:
+                conn.close()
+
+        async def handler(user_id: int):
+            if pool is None:
+                direct(read_sql, (user_id,), False)
+                direct(write_sql, (f'chat-{user_id // 2}', user_id, 'привет'), True)
+            else:
+                await pool.fetchone(read_sql, (user_id,))
+                await pool.execute(write_sql, (f'chat-{user_id // 2}', user_id, 'привет'))
+
+        latencies: List[float] = []
+
+        async def user(user_id: int):
+            for _ in range(actions):
+                # Задержка считается от прихода апдейта: ожидание заблокированного цикла входит в неё
+                delay = random.random() / 100
+                arrived = time.perf_counter() + delay
+                await asyncio.sleep(delay)
+                await handler(user_id)
+                latencies.append(time.perf_counter() - arrived)
+
+        lag = [0.0]
+
+        async def ticker():
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lag[0] = max(lag[0], time.perf_counter() - started - 0.01)
+
+        tick = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        await asyncio.gather(*(user(user_id) for user_id in range(users)))
+        elapsed = time.perf_counter() - started
+        tick.cancel()
+        await asyncio.gather(tick, return_exceptions=True)
+        if pool is not None:
+            pool.close()
+        print(f"{name:<24} {percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} "
+              f"{len(latencies) / elapsed:>11.0f} {lag[0] * 1000:>16.1f}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Connection pool handler latency benchmark')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--actions', type=int, default=5)
+    parser.add_argument('--size', type=int, default=4)
+    parser.add_argument('--dir', default='pool_bench')
+    cli = parser.parse_args()
+    asyncio.run(benchmark(cli.users, cli.actions, cli.size, cli.dir))
@@ -0,0 +1,137 @@
+"""In-process ban/premium status index with heap-based expiry"""
+
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+BAN = 'ban'
+PREMIUM = 'premium'
+
+Expiry = Union[None, str, datetime]
+
+
+def to_timestamp(value: Expiry) -> Optional[float]:
+    """Convert a stored expiry (ISO string or datetime) to epoch seconds."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(value).timestamp()
+
+
+class StatusIndex:
+    """Banned user IDs and premium expiries kept in memory.
+
+    Status checks are O(1) dict lookups. Expiring entries are pushed on
+    a min-heap and a background task removes them when they are due;
+    stale heap entries (status changed since) are skipped on pop.
+    """
+
+    def __init__(self, on_premium_expired: Optional[Callable[[int], Awaitable]] = None,
+                 max_sleep: float = 60):
+        """Initialize status index
+
+        Args:
+            on_premium_expired: Coroutine called with user_id when premium runs out
+            max_sleep: Longest pause between expiry checks
+        """
+        self.on_premium_expired = on_premium_expired
+        self.max_sleep = max_sleep
+        self._expiries: Dict[str, Dict[int, Optional[float]]] = {BAN: {}, PREMIUM: {}}
+        self._heap: List[Tuple[float, str, int]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self, bans: Iterable[Tuple[int, Expiry]], premiums: Iterable[Tuple[int, Expiry]]):
+        """Replace the index with rows loaded from the database."""
+        for kind in (BAN, PREMIUM):
+            self._expiries[kind].clear()
+        self._heap.clear()
+        for user_id, expires_at in bans:
+            self._set(BAN, user_id, expires_at)
+        for user_id, expires_at in premiums:
+            self._set(PREMIUM, user_id, expires_at)
+        logger.info(f"✅ Статусы загружены: банов {len(self._expiries[BAN])}, премиум {len(self._expiries[PREMIUM])}")
+
+    def _set(self, kind: str, user_id: int, expires_at: Expiry):
+        ts = to_timestamp(expires_at)
+        self._expiries[kind][user_id] = ts
+        if ts is not None:
+            heapq.heappush(self._heap, (ts, kind, user_id))
+            if self._wakeup is not None and self._heap[0][0] == ts:
+                self._wakeup.set()
+
+    def _active(self, kind: str, user_id: int) -> bool:
+        expiries = self._expiries[kind]
+        if user_id not in expiries:
+            return False
+        ts = expiries[user_id]
+        return ts is None or ts > time.time()
+
+    def set_ban(self, user_id: int, expires_at: Expiry = None):
+        self._set(BAN, user_id, expires_at)
+
+    def clear_ban(self, user_id: int):
+        self._expiries[BAN].pop(user_id, None)
+
+    def set_premium(self, user_id: int, expires_at: Expiry = None):
+        self._set(PREMIUM, user_id, expires_at)
+
+    def clear_premium(self, user_id: int):
+        self._expiries[PREMIUM].pop(user_id, None)
+
+    def is_banned(self, user_id: int) -> bool:
+        return self._active(BAN, user_id)
+
+    def is_premium(self, user_id: int) -> bool:
+        return self._active(PREMIUM, user_id)
+
+    def counts(self) -> Dict[str, int]:
+        return {kind: len(expiries) for kind, expiries in self._expiries.items()}
+
+    def start(self):
+        """Start the expiry scheduler task."""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._wakeup = None
+
+    async def _run(self):
+        while True:
+            delay = self.max_sleep
+            if self._heap:
+                delay = min(delay, max(0.0, self._heap[0][0] - time.time()))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                continue
+            except asyncio.TimeoutError:
+                pass
+            await self._expire_due()
+
+    async def _expire_due(self):
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            ts, kind, user_id = heapq.heappop(self._heap)
+            expiries = self._expiries[kind]
+            if expiries.get(user_id, -1) != ts:
+                # Статус менялся после постановки в кучу
+                continue
+            del expiries[user_id]
+            if kind == PREMIUM and self.on_premium_expired is not None:
+                try:
+                    await self.on_premium_expired(user_id)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка снятия истёкшего премиума {user_id}: {e}")
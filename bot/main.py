@@ -1,10 +1,11 @@
 import asyncio
+import atexit
+import html
 import logging
 import sys
 import os
 from collections import defaultdict
 from datetime import datetime, timedelta
-import sqlite3
 import uuid
 import aiohttp
 
@@ -12,432 +13,521 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from aiogram import Bot, Dispatcher, F, types, Router
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand, MenuButtonCommands
+from aiogram.types import Update, Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand, MenuButtonCommands
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters.command import Command
 from aiogram.exceptions import TelegramNetworkError, TelegramAPIError, TelegramBadRequest
 
-from bot.config import BOT_TOKEN, DB_PATH, ADMIN_ID
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('bot.log', encoding='utf-8')
-    ]
+from bot.config import (
+    BOT_TOKEN, DB_PATH, ADMIN_ID, DB_POOL_SIZE,
+    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE,
+    SQLITE_TEMP_STORE, SQLITE_BUSY_TIMEOUT_MS, SQLITE_CHECKPOINT_INTERVAL, SQLITE_OPTIMIZE_INTERVAL,
+    JOURNAL_BATCH_SIZE, JOURNAL_FLUSH_INTERVAL_MS, JOURNAL_MAX_QUEUE,
+    MESSAGE_RETENTION_MONTHS, MESSAGE_ARCHIVE_DIR, MESSAGE_COMPACT_INTERVAL,
+    ERASURE_CHUNK_SIZE, ERASURE_PAUSE_MS, BAN_EXPIRY_INTERVAL,
+    FORBIDDEN_KEYWORDS_PATH, USER_CACHE_SIZE, USER_CACHE_TTL,
+    FSM_STORAGE, FSM_REDIS_URL, FSM_CACHE_SIZE, FSM_FLUSH_INTERVAL_MS,
+    SEND_GLOBAL_RATE, CLUSTER_SHARDS, CLUSTER_ROLE, CLUSTER_SHARD_ID, CLUSTER_BROKER_URL,
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+    UPDATE_WORKERS, UPDATE_MAX_QUEUE, UPDATE_MAX_PER_USER, TELEGRAM_API_URL,
+    THROTTLE_MESSAGE_RATE, THROTTLE_MESSAGE_BURST, THROTTLE_CALLBACK_RATE, THROTTLE_CALLBACK_BURST,
+    THROTTLE_SEARCH_RATE, THROTTLE_SEARCH_BURST,
+    LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_JSON, LOG_SAMPLE_RATE,
+    METRICS_HOST, METRICS_PORT, LOOP_LAG_THRESHOLD_MS, LOOP_LAG_INTERVAL_MS, LOOP_LAG_TOP,
+)
+from bot.database.pool import ConnectionPool
+from bot.database.maintenance import SQLiteMaintenance
+from bot.database.journal import MessageJournal
+from bot.database.partitions import MessagePartitions
+from bot.database.erasure import ErasureWorker
+from bot.database.cache import LRUCache
+from bot.database.status import StatusIndex
+from bot.database.counters import read_counters, read_rollups, recount
+from bot.database.fsm_storage import CachedStorage, SQLiteBackend, RedisBackend, key_ids
+from bot.database.migrations import migrate, full_scans, MAIN_SCHEMA_MIGRATIONS, MAIN_SCHEMA_HOT_QUERIES
+from bot.utils.matchmaker import Matchmaker
+from bot.utils.ban import ban_expiry_worker
+from bot.utils.sender import scheduler, PRIORITY_RELAY, PRIORITY_MENU, PRIORITY_NOTICE
+from bot.utils.content_filter import ContentFilter, FORBIDDEN_KEYWORDS
+from bot.utils.cluster import Cluster, MatchmakerService, route_updates
+from bot.utils.webhook import WebhookServer
+from bot.middleware.ordering import UserOrderingMiddleware
+from bot.middleware.throttle import ThrottleMiddleware
+from bot.utils.logs import LoggingPipeline
+from bot.utils.watchdog import LoopWatchdog
+from bot.utils.metrics import Registry, MetricsServer, instrument, timed
+from bot.middleware.metrics import MetricsMiddleware, ApiMetricsMiddleware
+
+# Логи пишет отдельный поток через очередь; частые INFO с одного места прореживаются
+log_pipeline = LoggingPipeline(
+    level=LOG_LEVEL, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+    json_file=LOG_JSON, sample_rate=LOG_SAMPLE_RATE,
 )
+log_pipeline.install()
+atexit.register(log_pipeline.stop)
 logger = logging.getLogger(__name__)
 
-waiting_users = defaultdict(list)
+matchmaker = Matchmaker()
 active_chats = {}
-user_fsm_contexts = {}
 user_voted = {}
 
-# 🔐 LOCK ДЛЯ КРИТИЧЕСКИХ ОПЕРАЦИЙ (исправляет race condition)
-partner_search_lock = asyncio.Lock()
+# 🧩 КЛАСТЕР: при CLUSTER_SHARDS > 1 каждый процесс обслуживает свою часть пользователей,
+# пары подбирает роутер, а события для чужих пользователей уходят их шарду через брокер
+cluster = None
+if CLUSTER_SHARDS > 1:
+    cluster = Cluster(CLUSTER_BROKER_URL, CLUSTER_SHARDS, None if CLUSTER_ROLE == 'router' else CLUSTER_SHARD_ID)
+
+def is_local_user(user_id):
+    """Пользователь обслуживается этим процессом"""
+    return cluster is None or cluster.is_local(user_id)
+
+# 🔐 LOCK'И ПОИСКА ПО КАТЕГОРИЯМ (исправляет race condition)
+# Под lock'ом только решение о паре; запись в БД и уведомления - после него
+partner_search_locks = defaultdict(asyncio.Lock)
 
 # 🚫 FORBIDDEN CONTENT FILTER
-FORBIDDEN_KEYWORDS = {
-    'csam': ['child sex', 'minor porn', 'cp', 'children porn', 'kid porn', 'underage', 'pedophilia'],
-    'drugs': ['cocaine', 'heroin', 'meth', 'fentanyl', 'mdma', 'lsd', 'mushrooms', 'weed dealer', 'sell drugs'],
-    'violence': ['kill yourself', 'kys', 'commit suicide', 'bomb', 'attack plan', 'shoot up'],
-    'scam': ['money transfer', 'send money', 'western union', 'gift card', 'paypal verify', 'bitcoin transfer'],
-}
+# Один скомпилированный regex на все слова; список можно обновлять через файл без перезапуска
+content_filter = ContentFilter(FORBIDDEN_KEYWORDS, path=FORBIDDEN_KEYWORDS_PATH)
 
 class Database:
     def __init__(self):
         self.db_path = DB_PATH
+        self.pool = ConnectionPool(self.db_path, size=DB_POOL_SIZE, pragmas={
+            'journal_mode': SQLITE_JOURNAL_MODE,
+            'synchronous': SQLITE_SYNCHRONOUS,
+            'cache_size': SQLITE_CACHE_SIZE,
+            'mmap_size': SQLITE_MMAP_SIZE,
+            'temp_store': SQLITE_TEMP_STORE,
+            'busy_timeout': SQLITE_BUSY_TIMEOUT_MS,
+        })
+        self.maintenance = SQLiteMaintenance(
+            self.pool,
+            checkpoint_interval=SQLITE_CHECKPOINT_INTERVAL,
+            optimize_interval=SQLITE_OPTIMIZE_INTERVAL,
+        )
+        # Сообщения - в разделах по месяцам, старые уходят в архив
+        self.partitions = MessagePartitions(
+            self.pool,
+            retention_months=MESSAGE_RETENTION_MONTHS,
+            archive_dir=MESSAGE_ARCHIVE_DIR,
+            compact_interval=MESSAGE_COMPACT_INTERVAL,
+        )
+        self.journal = MessageJournal(
+            self.pool,
+            batch_size=JOURNAL_BATCH_SIZE,
+            flush_interval=JOURNAL_FLUSH_INTERVAL_MS / 1000,
+            max_queue=JOURNAL_MAX_QUEUE,
+            writer=self.partitions.insert,
+        )
+        # /delete_my_data: заявка в таблице, удаление - фоном небольшими порциями
+        self.erasure = ErasureWorker(
+            self.pool, self.partitions,
+            chunk_size=ERASURE_CHUNK_SIZE,
+            pause=ERASURE_PAUSE_MS / 1000,
+            on_done=self.data_erased,
+        )
+        # Кеш профилей: get_user вызывается почти в каждом обработчике
+        self.user_cache = LRUCache(max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+        # Баны и сроки премиума в памяти: проверки статуса без SQL
+        self.status = StatusIndex(on_premium_expired=self.remove_premium)
+        # Вызывается при смене бана/премиума/рейтинга (кластер уведомляет шард-владельца)
+        self.on_user_changed = None
+        # Вызывается после удаления данных пользователя (уведомление)
+        self.on_data_erased = None
     
     async def init_db(self):
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            await self.pool.run(self._create_tables)
+            await self.pool.run(migrate, MAIN_SCHEMA_MIGRATIONS)
             
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    gender TEXT,
-                    age INTEGER,
-                    interests TEXT,
-                    is_premium BOOLEAN DEFAULT 0,
-                    premium_expires_at DATETIME,
-                    is_banned BOOLEAN DEFAULT 0,
-                    ban_reason TEXT,
-                    ban_expires_at DATETIME,
-                    chats_count INTEGER DEFAULT 0,
-                    positive_votes INTEGER DEFAULT 0,
-                    negative_votes INTEGER DEFAULT 0,
-                    reports_count INTEGER DEFAULT 0,
-                    rating REAL DEFAULT 0.0,
-                    status TEXT DEFAULT 'offline',
-                    last_activity DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS chats (
-                    chat_id TEXT PRIMARY KEY,
-                    user1_id INTEGER NOT NULL,
-                    user2_id INTEGER NOT NULL,
-                    category TEXT,
-                    status TEXT DEFAULT 'active',
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    ended_at DATETIME
-                )
-            ''')
+            # Горячие запросы не должны деградировать до полного сканирования
+            for sql, detail in await self.pool.run(full_scans, MAIN_SCHEMA_HOT_QUERIES):
+                logger.warning(f"⚠️ Полное сканирование: {sql} -> {detail}")
             
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id TEXT NOT NULL,
-                    sender_id INTEGER NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (chat_id) REFERENCES chats(chat_id)
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS reports (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id TEXT NOT NULL,
-                    reporter_id INTEGER NOT NULL,
-                    reported_user_id INTEGER NOT NULL,
-                    reason TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS votes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    voter_id INTEGER NOT NULL,
-                    votee_id INTEGER NOT NULL,
-                    chat_id TEXT NOT NULL,
-                    vote_type TEXT NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS payments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    amount INTEGER,
-                    plan TEXT,
-                    status TEXT DEFAULT 'pending',
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    expires_at DATETIME
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS banned_users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL UNIQUE,
-                    reason TEXT,
-                    banned_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    expires_at DATETIME
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            logger.info("✅ БД инициализирована")
+            await self.load_status()
+            logger.info(f"✅ БД инициализирована: {await self.pool.settings()}")
         except Exception as e:
             logger.error(f"❌ Ошибка БД: {e}")
     
-    def create_user(self, user_id, username, first_name):
+    async def user_changed(self, user_id):
+        if self.on_user_changed is None:
+            return
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
+            await self.on_user_changed(user_id)
+        except Exception as e:
+            logger.error(f"❌ Ошибка уведомления об изменении {user_id}: {e}")
+    
+    async def refresh_user(self, user_id):
+        """Перечитать статус пользователя из БД (его изменил другой процесс)"""
+        self.user_cache.invalidate(user_id)
+        ban = await self.pool.fetchone('SELECT expires_at FROM banned_users WHERE user_id = ?', (user_id,))
+        user = await self.pool.fetchone('SELECT is_premium, premium_expires_at FROM users WHERE user_id = ?', (user_id,))
+        self.status.clear_ban(user_id)
+        if ban:
+            self.status.set_ban(user_id, ban['expires_at'])
+        self.status.clear_premium(user_id)
+        if user and user['is_premium']:
+            self.status.set_premium(user_id, user['premium_expires_at'])
+    
+    async def load_status(self):
+        """Загрузить активные баны и премиум в индекс статусов"""
+        bans = await self.pool.fetchall('SELECT user_id, expires_at FROM banned_users')
+        premiums = await self.pool.fetchall('SELECT user_id, premium_expires_at FROM users WHERE is_premium = 1')
+        self.status.load(
+            [(row['user_id'], row['expires_at']) for row in bans],
+            [(row['user_id'], row['premium_expires_at']) for row in premiums]
+        )
+    
+    @staticmethod
+    def _create_tables(conn):
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                gender TEXT,
+                age INTEGER,
+                interests TEXT,
+                is_premium BOOLEAN DEFAULT 0,
+                premium_expires_at DATETIME,
+                is_banned BOOLEAN DEFAULT 0,
+                ban_reason TEXT,
+                ban_expires_at DATETIME,
+                chats_count INTEGER DEFAULT 0,
+                positive_votes INTEGER DEFAULT 0,
+                negative_votes INTEGER DEFAULT 0,
+                reports_count INTEGER DEFAULT 0,
+                rating REAL DEFAULT 0.0,
+                status TEXT DEFAULT 'offline',
+                last_activity DATETIME DEFAULT CURRENT_TIMESTAMP,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chats (
+                chat_id TEXT PRIMARY KEY,
+                user1_id INTEGER NOT NULL,
+                user2_id INTEGER NOT NULL,
+                category TEXT,
+                status TEXT DEFAULT 'active',
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                ended_at DATETIME
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id TEXT NOT NULL,
+                sender_id INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (chat_id) REFERENCES chats(chat_id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reports (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id TEXT NOT NULL,
+                reporter_id INTEGER NOT NULL,
+                reported_user_id INTEGER NOT NULL,
+                reason TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS votes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                voter_id INTEGER NOT NULL,
+                votee_id INTEGER NOT NULL,
+                chat_id TEXT NOT NULL,
+                vote_type TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                amount INTEGER,
+                plan TEXT,
+                status TEXT DEFAULT 'pending',
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                expires_at DATETIME
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS banned_users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL UNIQUE,
+                reason TEXT,
+                banned_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                expires_at DATETIME
+            )
+        ''')
+    
+    def close(self):
+        self.pool.close()
+    
+    async def create_user(self, user_id, username, first_name):
+        try:
+            await self.pool.execute('''
                 INSERT OR IGNORE INTO users (user_id, username, first_name)
                 VALUES (?, ?, ?)
             ''', (user_id, username, first_name))
-            conn.commit()
-            conn.close()
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
     
-    def get_user(self, user_id):
+    async def get_user(self, user_id):
+        cached = self.user_cache.get(user_id)
+        if cached is not None:
+            return dict(cached)
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-            user = cursor.fetchone()
-            conn.close()
-            return dict(user) if user else None
+            version = self.user_cache.version
+            user = await self.pool.fetchone('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            if not user:
+                return None
+            user = dict(user)
+            self.user_cache.put(user_id, user, version)
+            return dict(user)
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
             return None
     
-    def is_user_banned(self, user_id):
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT expires_at FROM banned_users 
-                WHERE user_id = ? AND (expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP)
-            ''', (user_id,))
-            result = cursor.fetchone()
-            conn.close()
-            return result is not None
-        except Exception as e:
-            logger.error(f"❌ Ошибка: {e}")
-            return False
+    async def is_user_banned(self, user_id):
+        return self.status.is_banned(user_id)
     
-    def is_premium_active(self, user_id):
+    async def is_premium_active(self, user_id):
         """✅ НОВАЯ ФУНКЦИЯ: Проверка активности премиума с учётом срока"""
-        try:
-            user = self.get_user(user_id)
-            if not user or not user['is_premium']:
-                return False
-            
-            if user['premium_expires_at']:
-                expires = datetime.fromisoformat(user['premium_expires_at'])
-                if datetime.now() > expires:
-                    # Премиум истёк - обновляем БД
-                    self.remove_premium(user_id)
-                    return False
-            
-            return True
-        except Exception as e:
-            logger.error(f"❌ Ошибка: {e}")
-            return False
+        # Истёкший премиум снимается в БД фоновой задачей индекса статусов
+        return self.status.is_premium(user_id)
     
-    def ban_user(self, user_id, reason, duration_days=None):
+    async def ban_user(self, user_id, reason, duration_days=None):
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             expires_at = None
             if duration_days:
                 expires_at = (datetime.now() + timedelta(days=duration_days)).isoformat()
             
-            cursor.execute('''
+            await self.pool.execute('''
                 INSERT OR REPLACE INTO banned_users (user_id, reason, expires_at)
                 VALUES (?, ?, ?)
             ''', (user_id, reason, expires_at))
+            self.user_cache.invalidate(user_id)
+            self.status.set_ban(user_id, expires_at)
+            await self.user_changed(user_id)
             
-            conn.commit()
-            conn.close()
             logger.warning(f"🚫 Пользователь {user_id} банен: {reason}")
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
     
-    def update_user(self, user_id, **kwargs):
+    async def unban_user(self, user_id):
+        """Снять бан с пользователя"""
+        try:
+            await self.pool.execute('DELETE FROM banned_users WHERE user_id = ?', (user_id,))
+            self.status.clear_ban(user_id)
+            await self.user_changed(user_id)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка: {e}")
+            return False
+    
+    async def unban_expired(self):
+        """Удалить истёкшие баны одним DELETE по индексу expires_at (из памяти их убирает индекс статусов)"""
+        return await self.pool.execute(
+            "DELETE FROM banned_users WHERE expires_at > '' AND expires_at <= ?",
+            (datetime.now().isoformat(),)
+        )
+    
+    async def update_user(self, user_id, **kwargs):
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
             fields = ', '.join([f"{k} = ?" for k in kwargs.keys()])
             values = list(kwargs.values()) + [user_id]
-            cursor.execute(f'UPDATE users SET {fields} WHERE user_id = ?', values)
-            conn.commit()
-            conn.close()
+            await self.pool.execute(f'UPDATE users SET {fields} WHERE user_id = ?', values)
+            self.user_cache.update(user_id, **kwargs)
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
     
-    def give_premium(self, user_id, months):
+    async def give_premium(self, user_id, months):
         """Выдать премиум на N месяцев"""
         try:
             expires_at = (datetime.now() + timedelta(days=months * 30)).isoformat()
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
+            await self.pool.execute('''
                 UPDATE users SET is_premium = 1, premium_expires_at = ?
                 WHERE user_id = ?
             ''', (expires_at, user_id))
-            conn.commit()
-            conn.close()
+            self.user_cache.update(user_id, is_premium=1, premium_expires_at=expires_at)
+            self.status.set_premium(user_id, expires_at)
+            await self.user_changed(user_id)
             logger.info(f"✅ Премиум выдан {user_id} на {months} месяцев до {expires_at}")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
             return False
     
-    def remove_premium(self, user_id):
+    async def remove_premium(self, user_id):
         """Забрать премиум"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
+            await self.pool.execute('''
                 UPDATE users SET is_premium = 0, premium_expires_at = NULL
                 WHERE user_id = ?
             ''', (user_id,))
-            conn.commit()
-            conn.close()
+            self.user_cache.update(user_id, is_premium=0, premium_expires_at=None)
+            self.status.clear_premium(user_id)
+            await self.user_changed(user_id)
             logger.info(f"✅ Премиум забран у {user_id}")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
             return False
     
-    def delete_user_data(self, user_id):
+    async def delete_user_data(self, user_id):
+        """🗑️ Поставить удаление данных в очередь; возвращает (заявка, создана ли новая)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
-            cursor.execute('DELETE FROM messages WHERE sender_id = ?', (user_id,))
-            cursor.execute('DELETE FROM votes WHERE voter_id = ? OR votee_id = ?', (user_id, user_id))
-            cursor.execute('DELETE FROM reports WHERE reporter_id = ? OR reported_user_id = ?', (user_id, user_id))
-            cursor.execute('DELETE FROM chats WHERE user1_id = ? OR user2_id = ?', (user_id, user_id))
-            
-            conn.commit()
-            conn.close()
-            logger.info(f"🗑️ Очищены все данные пользователя {user_id}")
-            return True
+            job, created = await self.erasure.enqueue(user_id)
+            logger.info(f"🗑️ Заявка на удаление данных {user_id}: #{job['id']} ({job['status']})")
+            return job, created
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
-            return False
+            return None
+    
+    async def data_erased(self, user_id, deleted):
+        self.user_cache.invalidate(user_id)
+        self.status.clear_premium(user_id)
+        await self.user_changed(user_id)
+        if self.on_data_erased is None:
+            return
+        await self.on_data_erased(user_id, deleted)
     
-    def create_chat(self, user1_id, user2_id, category):
+    async def create_chat(self, user1_id, user2_id, category, chat_id=None):
         try:
-            chat_id = str(uuid.uuid4())
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
+            chat_id = chat_id or str(uuid.uuid4())
+            await self.pool.execute('''
                 INSERT INTO chats (chat_id, user1_id, user2_id, category, status)
                 VALUES (?, ?, ?, ?, 'active')
             ''', (chat_id, user1_id, user2_id, category))
-            conn.commit()
-            conn.close()
             return chat_id
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
             return None
     
-    def save_message(self, chat_id, sender_id, content):
+    async def save_message(self, chat_id, sender_id, content):
+        """Поставить сообщение в журнал (запись в БД пакетами)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO messages (chat_id, sender_id, content)
-                VALUES (?, ?, ?)
-            ''', (chat_id, sender_id, content))
-            conn.commit()
-            conn.close()
+            await self.journal.put(chat_id, sender_id, content)
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
     
-    def end_chat(self, chat_id):
+    async def end_chat(self, chat_id):
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
+            await self.pool.execute('''
                 UPDATE chats SET status = "ended", ended_at = CURRENT_TIMESTAMP
                 WHERE chat_id = ?
             ''', (chat_id,))
-            conn.commit()
-            conn.close()
-            logger.info(f"✅ Чат {chat_id} завершён")
+            logger.info("✅ Чат %s завершён", chat_id)
         except Exception as e:
             logger.error(f"❌ Ошибка end_chat: {e}")
     
-    def save_report(self, chat_id, reporter_id, reported_user_id, reason):
+    async def save_report(self, chat_id, reporter_id, reported_user_id, reason):
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
+            await self.pool.execute('''
                 INSERT INTO reports (chat_id, reporter_id, reported_user_id, reason)
                 VALUES (?, ?, ?, ?)
             ''', (chat_id, reporter_id, reported_user_id, reason))
-            conn.commit()
-            conn.close()
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
     
-    def save_vote(self, voter_id, votee_id, chat_id, vote_type):
+    async def save_vote(self, voter_id, votee_id, chat_id, vote_type):
+        """Записать голос; False если пользователь уже голосовал в этом диалоге"""
+        return await self.save_votes([(voter_id, votee_id, chat_id, vote_type)]) == 1
+    
+    async def save_votes(self, votes):
+        """Записать пачку голосов одной транзакцией, вернуть число принятых
+        
+        Повторные голоса (voter_id, chat_id) отбрасывает уникальный индекс,
+        счётчики и рейтинг обновляет триггер trg_votes_insert.
+        """
+        votes = [vote for vote in votes if vote[3] in ('positive', 'negative')]
+        if not votes:
+            return 0
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO votes (voter_id, votee_id, chat_id, vote_type)
+            recorded = await self.pool.run(lambda conn: conn.executemany('''
+                INSERT OR IGNORE INTO votes (voter_id, votee_id, chat_id, vote_type)
                 VALUES (?, ?, ?, ?)
-            ''', (voter_id, votee_id, chat_id, vote_type))
-            
-            if vote_type == 'positive':
-                cursor.execute('UPDATE users SET positive_votes = positive_votes + 1 WHERE user_id = ?', (votee_id,))
-            else:
-                cursor.execute('UPDATE users SET negative_votes = negative_votes + 1 WHERE user_id = ?', (votee_id,))
-            
-            cursor.execute('SELECT positive_votes, negative_votes FROM users WHERE user_id = ?', (votee_id,))
-            result = cursor.fetchone()
-            if result:
-                positive, negative = result
-                total = positive + negative
-                rating = (positive / total * 100) if total > 0 else 0
-                cursor.execute('UPDATE users SET rating = ? WHERE user_id = ?', (rating, votee_id))
-            
-            conn.commit()
-            conn.close()
+            ''', votes).rowcount)
+            for votee_id in {vote[1] for vote in votes}:
+                self.user_cache.invalidate(votee_id)
+                await self.user_changed(votee_id)
+            return recorded
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
+            return 0
     
-    def get_stats(self):
-        """📊 Получить статистику бота"""
+    async def create_payment(self, user_id, amount, plan):
+        """Записать заявку на оплату"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT COUNT(*) FROM users')
-            total_users = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM users WHERE is_premium = 1')
-            premium_users = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM banned_users WHERE expires_at IS NULL OR expires_at > CURRENT_TIMESTAMP')
-            banned_users = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM chats WHERE status = "active"')
-            active_chats_count = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM chats')
-            total_chats = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM messages')
-            total_messages = cursor.fetchone()[0]
-            
-            conn.close()
-            
+            await self.pool.execute('''
+                INSERT INTO payments (user_id, amount, plan, status)
+                VALUES (?, ?, ?, 'pending')
+            ''', (user_id, amount, plan))
+        except Exception as e:
+            logger.error(f"❌ Ошибка: {e}")
+    
+    async def get_stats(self):
+        """📊 Получить статистику бота (счётчики поддерживаются триггерами)"""
+        def _stats(conn):
+            counters = read_counters(conn)
             return {
-                'total_users': total_users,
-                'premium_users': premium_users,
-                'banned_users': banned_users,
-                'active_chats': active_chats_count,
-                'total_chats': total_chats,
-                'total_messages': total_messages
+                'total_users': counters.get('total_users', 0),
+                'premium_users': counters.get('premium_users', 0),
+                # Активные баны с учётом срока - из индекса статусов
+                'banned_users': self.status.counts()['ban'],
+                'active_chats': counters.get('active_chats', 0),
+                'total_chats': counters.get('total_chats', 0),
+                # В БД + перенесённые в архив
+                'total_messages': counters.get('total_messages', 0) + counters.get('archived_messages', 0),
+                'archived_messages': counters.get('archived_messages', 0),
+                'hourly': read_rollups(conn, 'hour', 24),
+                'daily': read_rollups(conn, 'day', 7),
             }
+        
+        try:
+            return await self.pool.run(_stats)
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
             return None
     
-    def get_premium_users(self):
+    async def recount_stats(self, fix: bool = False):
+        """🔢 Сверить счётчики с полным пересчётом (медленно на больших таблицах)"""
+        try:
+            return await self.pool.run(recount, fix)
+        except Exception as e:
+            logger.error(f"❌ Ошибка: {e}")
+            return None
+    
+    async def get_premium_users(self):
         """📋 Получить список премиум пользователей"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            cursor.execute('''
+            rows = await self.pool.fetchall('''
                 SELECT user_id, username, first_name, premium_expires_at
                 FROM users
                 WHERE is_premium = 1
                 ORDER BY premium_expires_at DESC
             ''')
-            
-            users = [dict(row) for row in cursor.fetchall()]
-            conn.close()
-            
-            return users
+            return [dict(row) for row in rows]
         except Exception as e:
             logger.error(f"❌ Ошибка: {e}")
             return []
@@ -456,88 +546,246 @@ class UserStates(StatesGroup):
 
 db = Database()
 bot_instance = None
+webhook_server = None
+user_ordering = UserOrderingMiddleware(max_depth=UPDATE_MAX_PER_USER)
+throttle = ThrottleMiddleware(
+    message_rate=THROTTLE_MESSAGE_RATE, message_burst=THROTTLE_MESSAGE_BURST,
+    callback_rate=THROTTLE_CALLBACK_RATE, callback_burst=THROTTLE_CALLBACK_BURST,
+    search_rate=THROTTLE_SEARCH_RATE, search_burst=THROTTLE_SEARCH_BURST,
+)
+metrics_server = None
+# Сторож цикла событий: кто держит цикл дольше порога
+watchdog = LoopWatchdog(
+    threshold=LOOP_LAG_THRESHOLD_MS / 1000, interval=LOOP_LAG_INTERVAL_MS / 1000, top_n=LOOP_LAG_TOP,
+) if LOOP_LAG_THRESHOLD_MS > 0 else None
+
+def setup_metrics(dp: Dispatcher, bot: Bot) -> MetricsServer:
+    """📈 Метрики: вызывается только при METRICS_PORT, иначе ничего не оборачивается"""
+    global find_partner
+    registry = Registry()
+    handlers = MetricsMiddleware(registry)
+    # Внешний - всё обновление (с ожиданием в очереди пользователя), внутренние - конкретный обработчик
+    dp.update.outer_middleware(handlers)
+    dp.message.middleware(handlers)
+    dp.callback_query.middleware(handlers)
+    find_partner = timed(handlers.duration, 'find_partner')(find_partner)
+    
+    instrument(db, registry.histogram('bot_db_call_duration_seconds', 'Database method latency', ('method',)))
+    bot.session.middleware(ApiMetricsMiddleware(registry))
+    
+    registry.gauge(
+        'bot_waiting_users', 'Users waiting for a partner',
+        lambda: {(category,): size for category, size in matchmaker.sizes().items()}, ('category',)
+    )
+    registry.gauge('bot_active_chats', 'Users in a chat on this process (active_chats)', lambda: len(active_chats))
+    registry.gauge('bot_send_queue_depth', 'Outgoing messages waiting to be sent', lambda: scheduler.queue_depth)
+    registry.gauge('bot_journal_queue_depth', 'Messages waiting to be written', lambda: db.journal.stats()['queue_depth'])
+    registry.gauge('bot_update_waiting', 'Updates waiting behind the same user', lambda: user_ordering.stats()['waiting'])
+    if watchdog:
+        registry.gauge('bot_event_loop_lag_seconds', 'Last measured event-loop lag', lambda: max(watchdog.last_lag, 0.0))
+    return MetricsServer(registry, host=METRICS_HOST, port=METRICS_PORT)
+
+def create_bot():
+    """Bot с HTML-разметкой; TELEGRAM_API_URL - свой сервер Bot API"""
+    session = None
+    if TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    return Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+def create_fsm_storage():
+    """Хранилище FSM по настройке FSM_STORAGE"""
+    if FSM_STORAGE == 'redis':
+        backend = RedisBackend(FSM_REDIS_URL)
+    elif FSM_STORAGE == 'memory':
+        backend = None
+    else:
+        backend = SQLiteBackend(db.pool)
+    return CachedStorage(backend, max_size=FSM_CACHE_SIZE, flush_interval=FSM_FLUSH_INTERVAL_MS / 1000)
+
+# Состояния переживают перезапуск; состояние собеседника меняется по ключу, а не через его FSMContext
+fsm_storage = create_fsm_storage()
+
+def user_state(bot: Bot, user_id: int) -> FSMContext:
+    """FSMContext личного чата пользователя"""
+    return FSMContext(storage=fsm_storage, key=StorageKey(bot_id=bot.id, chat_id=user_id, user_id=user_id))
 
 def check_forbidden_content(text: str) -> tuple[bool, str]:
     """🚫 Проверка на запрещённый контент"""
-    text_lower = text.lower()
+    found = content_filter.find(text)
+    if found is None:
+        return False, ""
     
-    for category, keywords in FORBIDDEN_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword.lower() in text_lower:
-                logger.warning(f"🚫 Открыт {category}: {keyword}")
-                return True, category
-    
-    return False, ""
+    category, offset, fragment = found
+    logger.warning(f"🚫 Открыт {category}: '{fragment}' (позиция {offset})")
+    return True, category
 
 def is_admin(user_id: int) -> bool:
     """Проверка, является ли пользователь администратором"""
     if ADMIN_ID is None:
-        logger.warning(f"⚠️  ADMIN_ID не установлен")
+        logger.debug("⚠️ ADMIN_ID не установлен")
         return False
     
-    result = user_id == ADMIN_ID
-    if result:
-        logger.info(f"✅ Пользователь {user_id} является администратором")
-    else:
-        logger.debug(f"❌ Пользователь {user_id} - не администратор (ADMIN_ID={ADMIN_ID})")
-    return result
+    return user_id == ADMIN_ID
 
 async def find_partner(user_id: int, category: str, search_filters: dict, bot: Bot, state: FSMContext):
     """✅ ИСПРАВЛЕНО: Добавлена защита от race condition"""
-    global waiting_users, active_chats, user_fsm_contexts
+    global active_chats
     
-    async with partner_search_lock:
-        user = db.get_user(user_id)
-        user_interests = user.get('interests', '') if user else ''
+    user = await db.get_user(user_id)
+    user_gender = user.get('gender') if user else None
+    user_interests = (user.get('interests') or '') if user else ''
+    
+    wanted_gender = search_filters.get('gender')
+    if wanted_gender == 'any':
+        wanted_gender = None
+    
+    if cluster is not None:
+        # Очередь и пары ведёт центральный матчмейкер; собеседника уведомит его шард
+        if user_id in active_chats:
+            current = active_chats[user_id]
+            return current['partner_id'], current['chat_id']
         
-        for cat in list(waiting_users.keys()):
-            if user_id in waiting_users[cat]:
-                waiting_users[cat].remove(user_id)
+        partner_id, chat_id = await cluster.match(user_id, category, user_gender, user_interests, wanted_gender)
+        if partner_id is None:
+            return None, None
         
-        if waiting_users[category]:
-            partner_id = waiting_users[category].pop(0)
-            partner = db.get_user(partner_id)
-            
-            if search_filters.get('gender') and search_filters['gender'] != 'any':
-                partner_gender = partner.get('gender') if partner else None
-                if partner_gender != search_filters['gender']:
-                    waiting_users[category].append(partner_id)
-                    waiting_users[category].append(user_id)
-                    logger.info(f"❌ Пол не совпадает: ищет {search_filters['gender']}, партнёр {partner_gender}")
-                    return None, None
-            
-            partner_interests = partner.get('interests', '') if partner else ''
-            
-            if user_interests and partner_interests and user_interests != partner_interests:
-                waiting_users[category].append(partner_id)
-                waiting_users[category].append(user_id)
-                logger.info(f"🎯 {user_id} и {partner_id} имеют разные интересы: '{user_interests}' vs '{partner_interests}'")
-                return None, None
-            
-            chat_id = db.create_chat(user_id, partner_id, category)
-            active_chats[user_id] = {'partner_id': partner_id, 'chat_id': chat_id}
-            active_chats[partner_id] = {'partner_id': user_id, 'chat_id': chat_id}
-            
-            logger.info(f"✅ Матч: {user_id} <-> {partner_id} (интересы: {user_interests})")
-            
-            if partner_id in user_fsm_contexts:
-                partner_state = user_fsm_contexts[partner_id]
-                await partner_state.set_state(UserStates.in_chat)
-                await partner_state.update_data(chat_id=chat_id, partner_id=user_id, category=category)
-                
-                try:
-                    await bot.send_message(
-                        partner_id,
-                        "🌟 <b>Новый собеседник найден!</b>\n\n🏳️ Диалог начат. Напишите /next чтобы перейти к следующему собеседнику",
-                        reply_markup=get_chat_actions_keyboard()
-                    )
-                except:
-                    pass
-            
-            return partner_id, chat_id
-        else:
-            waiting_users[category].append(user_id)
+        active_chats[user_id] = {'partner_id': partner_id, 'chat_id': chat_id}
+        await db.create_chat(user_id, partner_id, category, chat_id=chat_id)
+        logger.info("✅ Матч: %s <-> %s (интересы: %s)", user_id, partner_id, user_interests)
+        return partner_id, chat_id
+    
+    async with partner_search_locks[category]:
+        # Повторный поиск уже сматченного пользователя - не создаём второй диалог
+        if user_id in active_chats:
+            current = active_chats[user_id]
+            return current['partner_id'], current['chat_id']
+        
+        # Профиль кешируется в индексе при постановке в очередь,
+        # поэтому партнёр подбирается без чтения его записи из БД
+        matchmaker.cancel(user_id)
+        partner_id = matchmaker.match(category, user_gender, user_interests, wanted_gender)
+        
+        if partner_id is None:
+            matchmaker.enqueue(user_id, category, user_gender, user_interests, wanted_gender)
             return None, None
+        
+        chat_id = str(uuid.uuid4())
+        active_chats[user_id] = {'partner_id': partner_id, 'chat_id': chat_id}
+        active_chats[partner_id] = {'partner_id': user_id, 'chat_id': chat_id}
+    
+    await db.create_chat(user_id, partner_id, category, chat_id=chat_id)
+    logger.info("✅ Матч: %s <-> %s (интересы: %s)", user_id, partner_id, user_interests)
+    
+    await start_partner_chat(bot, partner_id, user_id, chat_id, category)
+    return partner_id, chat_id
+
+async def start_partner_chat(bot: Bot, partner_id: int, user_id: int, chat_id: str, category: str):
+    """Перевести найденного собеседника в диалог и уведомить его"""
+    active_chats[partner_id] = {'partner_id': user_id, 'chat_id': chat_id}
+    
+    partner_state = user_state(bot, partner_id)
+    await partner_state.set_state(UserStates.in_chat)
+    await partner_state.update_data(chat_id=chat_id, partner_id=user_id, category=category)
+    
+    try:
+        await scheduler.call(
+            partner_id,
+            lambda: bot.send_message(
+                partner_id,
+                "🌟 <b>Новый собеседник найден!</b>\n\n🏳️ Диалог начат. Напишите /next чтобы перейти к следующему собеседнику",
+                reply_markup=get_chat_actions_keyboard()
+            ),
+            priority=PRIORITY_RELAY
+        )
+    except:
+        pass
+
+async def accept_remote_match(bot: Bot, user_id: int, partner_id: int, chat_id: str, category: str):
+    """Начать диалог, найденный матчмейкером кластера, если пользователь всё ещё ждёт собеседника"""
+    current = active_chats.get(user_id)
+    if current and current['chat_id'] == chat_id:
+        # Повторная доставка события
+        return
+    
+    # Ожидание в очереди - in_chat без chat_id; состояние ещё может быть не записано,
+    # если событие обогнало обработчик поиска
+    state = user_state(bot, user_id)
+    data = await state.get_data()
+    moved_on = (current is not None or data.get('chat_id') is not None
+                or await state.get_state() not in (None, UserStates.in_chat.state))
+    if not moved_on:
+        await start_partner_chat(bot, user_id, partner_id, chat_id, category)
+        return
+    
+    # Пока событие шло до шарда, пользователь ушёл в другой диалог или меню -
+    # его состояние не трогаем, а пару разрываем и у второго собеседника
+    logger.info("↩️ Матч %s <-> %s устарел: пользователь уже не ищет", user_id, partner_id)
+    await cluster.release(user_id, partner_id)
+    await cluster.send_to_user(partner_id, {'type': 'match_cancelled', 'user_id': partner_id, 'chat_id': chat_id})
+
+async def drop_cancelled_match(bot: Bot, user_id: int, chat_id: str):
+    """Закрыть диалог, от которого собеседник ушёл раньше, чем узнал о нём"""
+    current = active_chats.get(user_id)
+    if current and current['chat_id'] == chat_id:
+        active_chats.pop(user_id, None)
+    await db.end_chat(chat_id)
+    
+    state = user_state(bot, user_id)
+    if (await state.get_data()).get('chat_id') != chat_id:
+        # Пользователь уже в другом диалоге или вышел сам
+        return
+    await state.clear()
+    await safe_send_message(user_id, "😔 <b>Собеседник ушёл до начала диалога</b>\n\n🔍 Нажмите /search, чтобы найти нового")
+
+async def resume_waiting_searches(bot: Bot):
+    """Вернуть в очередь тех, кто ждал собеседника до перезапуска: состояние FSM сохранилось, очередь - нет"""
+    resumed = matched = 0
+    for key, (_, data) in (await fsm_storage.in_state(UserStates.in_chat)).items():
+        bot_id, chat_id, user_id = key_ids(key)
+        if bot_id != bot.id or chat_id != user_id or not is_local_user(user_id):
+            continue
+        if not data.get('waiting') or data.get('chat_id'):
+            continue
+        
+        category = data.get('category') or 'random'
+        search_filters = {'gender': data['search_gender']} if data.get('search_gender') else {}
+        state = user_state(bot, user_id)
+        try:
+            partner_id, chat_id = await find_partner(user_id, category, search_filters, bot, state)
+        except Exception as e:
+            logger.error(f"❌ Ошибка возобновления поиска {user_id}: {e}")
+            continue
+        resumed += 1
+        if partner_id:
+            matched += 1
+            await state.update_data(chat_id=chat_id, partner_id=partner_id)
+            await safe_send_message(
+                user_id,
+                "🌟 <b>Новый собеседник найден!</b>\n\n💬 Диалог начат. Напишите /next чтобы перейти к следующему собеседнику",
+                reply_markup=get_chat_actions_keyboard(),
+                priority=PRIORITY_RELAY
+            )
+    if resumed:
+        logger.info(f"🔍 Поиск возобновлён для {resumed} пользователей, сразу найдено пар: {matched}")
+
+async def cancel_search(user_id: int):
+    """Убрать пользователя из очереди ожидания"""
+    if cluster is not None:
+        await cluster.cancel(user_id)
+    else:
+        matchmaker.cancel(user_id)
+
+async def release_pair(user_id: int, partner_id: int):
+    """Разорвать пару: убрать обоих из активных диалогов и из очереди"""
+    active_chats.pop(user_id, None)
+    active_chats.pop(partner_id, None)
+    if cluster is not None:
+        await cluster.release(user_id, partner_id)
+        if not cluster.is_local(partner_id):
+            await cluster.send_to_user(partner_id, {'type': 'ended', 'user_id': partner_id})
+    else:
+        matchmaker.cancel(user_id)
+        matchmaker.cancel(partner_id)
 
 def get_main_menu():
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -598,11 +846,13 @@ def get_premium_keyboard():
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_menu")],
     ])
 
-async def safe_send_message(chat_id, text, reply_markup=None, timeout=30):
+async def safe_send_message(chat_id, text, reply_markup=None, timeout=30, priority=PRIORITY_MENU):
     global bot_instance
     try:
-        await asyncio.wait_for(
-            bot_instance.send_message(chat_id, text, reply_markup=reply_markup),
+        await scheduler.call(
+            chat_id,
+            lambda: bot_instance.send_message(chat_id, text, reply_markup=reply_markup),
+            priority=priority,
             timeout=timeout
         )
         return True
@@ -635,10 +885,10 @@ async def cmd_admin_give_premium(message: Message):
         if months >= 100:
             months = 3650
         
-        success = db.give_premium(user_id, months)
+        success = await db.give_premium(user_id, months)
         
         if success:
-            user = db.get_user(user_id)
+            user = await db.get_user(user_id)
             username = f"@{user['username']}" if user and user['username'] else "ID: " + str(user_id)
             
             await safe_send_message(
@@ -646,11 +896,8 @@ async def cmd_admin_give_premium(message: Message):
                 f"✅ <b>Премиум выдан!</b>\n\n👤 {username}\n⏱️ На {months} месяцев\n✨ Срок действия обновлён"
             )
             
-            try:
-                premium_text = "✨ <b>Поздравляем!</b>\n\nВам выдан ПРЕМИУМ статус!\n🎉 Теперь вам доступны все преимущества!"
-                await bot_instance.send_message(user_id, premium_text)
-            except:
-                pass
+            premium_text = "✨ <b>Поздравляем!</b>\n\nВам выдан ПРЕМИУМ статус!\n🎉 Теперь вам доступны все преимущества!"
+            await safe_send_message(user_id, premium_text, priority=PRIORITY_NOTICE)
             
             logger.info(f"✅ АДМИН: Премиум выдан пользователю {user_id} на {months} месяцев")
         else:
@@ -678,10 +925,10 @@ async def cmd_admin_remove_premium(message: Message):
             return
         
         user_id = int(args[1])
-        success = db.remove_premium(user_id)
+        success = await db.remove_premium(user_id)
         
         if success:
-            user = db.get_user(user_id)
+            user = await db.get_user(user_id)
             username = f"@{user['username']}" if user and user['username'] else str(user_id)
             
             await safe_send_message(
@@ -718,9 +965,9 @@ async def cmd_admin_ban_user(message: Message):
         days = int(parts[2])
         reason = parts[3] if len(parts) > 3 else "Нарушение правил"
         
-        db.ban_user(user_id, reason, days if days > 0 else None)
+        await db.ban_user(user_id, reason, days if days > 0 else None)
         
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         username = f"@{user['username']}" if user and user['username'] else str(user_id)
         
         expire_text = f"на {days} дней" if days > 0 else "навсегда"
@@ -730,11 +977,8 @@ async def cmd_admin_ban_user(message: Message):
             f"✅ <b>Пользователь забанен!</b>\n\n👤 {username}\n⏱️ {expire_text}\n📝 Причина: {reason}"
         )
         
-        try:
-            ban_msg = f"🚫 <b>Вы забанены!</b>\n\n📝 Причина: {reason}\n⏱️ {expire_text}"
-            await bot_instance.send_message(user_id, ban_msg)
-        except:
-            pass
+        ban_msg = f"🚫 <b>Вы забанены!</b>\n\n📝 Причина: {reason}\n⏱️ {expire_text}"
+        await safe_send_message(user_id, ban_msg, priority=PRIORITY_NOTICE)
         
         logger.warning(f"✅ АДМИН: Пользователь {user_id} забанен {expire_text}. Причина: {reason}")
     
@@ -761,13 +1005,9 @@ async def cmd_admin_unban_user(message: Message):
         
         user_id = int(args[1])
         
-        conn = sqlite3.connect(db.db_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM banned_users WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
+        await db.unban_user(user_id)
         
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         username = f"@{user['username']}" if user and user['username'] else str(user_id)
         
         await safe_send_message(
@@ -775,11 +1015,8 @@ async def cmd_admin_unban_user(message: Message):
             f"✅ <b>Пользователь разбанен!</b>\n\n👤 {username}\n✨ Доступ восстановлен"
         )
         
-        try:
-            unban_msg = "✅ <b>Вас разбанили!</b>\n\n🎉 Добро пожаловать обратно! Вы снова можете использовать бота."
-            await bot_instance.send_message(user_id, unban_msg)
-        except:
-            pass
+        unban_msg = "✅ <b>Вас разбанили!</b>\n\n🎉 Добро пожаловать обратно! Вы снова можете использовать бота."
+        await safe_send_message(user_id, unban_msg, priority=PRIORITY_NOTICE)
         
         logger.info(f"✅ АДМИН: Пользователь {user_id} разбанен")
     
@@ -805,14 +1042,14 @@ async def cmd_admin_user_info(message: Message):
             return
         
         user_id = int(args[1])
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         
         if not user:
             await safe_send_message(message.from_user.id, f"❌ <b>Пользователь не найден!</b>\n\nID: {user_id}")
             return
         
-        is_banned = db.is_user_banned(user_id)
-        is_premium = db.is_premium_active(user_id)
+        is_banned = await db.is_user_banned(user_id)
+        is_premium = await db.is_premium_active(user_id)
         premium_status = "✅ ДА" if is_premium else "❌ НЕТ"
         ban_status = "🚫 ЗАБАНЕН" if is_banned else "✅ Активен"
         
@@ -855,12 +1092,37 @@ async def cmd_admin_stats(message: Message):
         return
     
     try:
-        stats = db.get_stats()
+        stats = await db.get_stats()
         
         if not stats:
             await safe_send_message(message.from_user.id, "❌ <b>Ошибка при получении статистики!</b>")
             return
         
+        journal = db.journal.stats()
+        user_cache = db.user_cache.stats()
+        fsm = fsm_storage.stats()
+        sending = scheduler.stats()
+        maintenance = db.maintenance.stats()
+        partitions = db.partitions.stats()
+        erasure = db.erasure.stats()
+        logs = log_pipeline.stats()
+        lag = watchdog.stats() if watchdog else None
+        webhook_text = ""
+        if webhook_server:
+            webhook = webhook_server.stats()
+            webhook_text = f"""
+🌐 <b>ВЕБХУК:</b>
+📥 Получено: {webhook['received']} | ⏳ В очереди: {webhook['pending']} | 🗑️ Отклонено: {webhook['rejected']}
+⏱️ Ожидание обработки: {webhook['avg_wait_ms']:.1f} мс (макс. {webhook['max_wait_ms']:.1f} мс)
+🗑️ Сверх лимита пользователя: {webhook['dropped']}
+"""
+        ordering = user_ordering.stats()
+        throttled = throttle.stats()
+        deepest = ", ".join(f"<code>{user_id}</code>: {depth}" for user_id, depth in ordering['deepest']) or "—"
+        checkpoint = maintenance['last_checkpoint']
+        last_day = stats['hourly']
+        today = stats['daily'][0][1] if stats['daily'] else {}
+        
         stats_text = f"""
 📊 <b>СТАТИСТИКА БОТА</b>
 
@@ -878,7 +1140,39 @@ async def cmd_admin_stats(message: Message):
 💬 Среднее сообщения на диалог: {stats['total_messages'] // max(stats['total_chats'], 1) if stats['total_chats'] > 0 else 0}
 📊 Процент премиум: {(stats['premium_users'] / max(stats['total_users'], 1) * 100):.1f}%
 🚷 Процент забанено: {(stats['banned_users'] / max(stats['total_users'], 1) * 100):.1f}%
-"""
+
+🕐 <b>АКТИВНОСТЬ:</b>
+📅 Сегодня: 👤 {today.get('new_users', 0)} новых | 💬 {today.get('new_chats', 0)} диалогов | 💭 {today.get('messages', 0)} сообщений
+⏱️ За 24 часа: 💭 {sum(bucket.get('messages', 0) for _, bucket in last_day)} сообщений | 💬 {sum(bucket.get('new_chats', 0) for _, bucket in last_day)} диалогов
+
+📝 <b>ЖУРНАЛ СООБЩЕНИЙ:</b>
+📥 В очереди: {journal['queue_depth']}
+💾 Последняя запись: {journal['last_flush_size']} сообщ. за {journal['last_flush_latency_ms']:.1f} мс
+⏱️ Макс. время записи: {journal['max_flush_latency_ms']:.1f} мс
+🪵 Логи: в очереди {logs['queue_depth']} | прорежено {logs['sampled_out']} | потеряно {logs['queue_dropped']}
+📈 Метрики: {f"<code>http://{METRICS_HOST}:{METRICS_PORT}/metrics</code>" if metrics_server else "выключены"}
+🐢 Задержка цикла: {f"{lag['last_lag_ms']:.1f} мс (макс. {lag['max_lag_ms']:.0f} мс) | остановок {lag['stalls']} — /admin_lag" if lag else "сторож выключен"}
+🧹 Checkpoint WAL: {maintenance['checkpoints']} | Последний: {f"{checkpoint['checkpointed_pages']}/{checkpoint['log_pages']} стр. за {checkpoint['latency_ms']:.1f} мс" if checkpoint else "—"}
+🗄️ Раздел: {partitions['current'] or "—"} | В архиве: {stats['archived_messages']} сообщ. | Хранится: {partitions['retention_months'] or "∞"} мес.
+🗑️ Удаление данных: ✅ {erasure['jobs_done']} | ❌ {erasure['jobs_failed']} | Сейчас: {f"<code>{erasure['current_user']}</code> ({erasure['current_deleted']} записей)" if erasure['current_user'] else "—"}
+
+🗂️ <b>КЕШ ПРОФИЛЕЙ:</b>
+📦 Записей: {user_cache['size']} | 🎯 Попаданий: {user_cache['hit_rate']:.1f}%
+✅ {user_cache['hits']} / ❌ {user_cache['misses']} / 🗑️ Вытеснено: {user_cache['evictions']}
+🧭 Состояния FSM: {fsm['size']} в памяти ({fsm['hit_rate']:.1f}%) | ⏳ Не записано: {fsm['dirty']}
+
+📤 <b>ОТПРАВКА:</b>
+📥 В очереди: {sending['queue_depth']}
+✅ Отправлено: {sending['sent']} | ❌ Ошибок: {sending['failed']} | 🗑️ Отброшено: {sending['dropped']} | ⌛ Просрочено: {sending['expired']}
+⏳ Флуд-лимитов: {sending['retry_after_hits']} | 🔁 Повторов: {sending['retries']}
+⏱️ Ожидание пересылки: {sending['lanes']['relay']['avg_wait_ms']:.1f} мс (макс. {sending['lanes']['relay']['max_wait_ms']:.1f} мс)
+
+🧵 <b>ОЧЕРЕДИ ПОЛЬЗОВАТЕЛЕЙ:</b>
+👥 Активных: {ordering['active_users']} | ⏳ Ждут: {ordering['waiting']} | 📏 Глубина: {ordering['max_depth']} (пик {ordering['peak_depth']})
+🔗 Объединено: {ordering['merged']} | 🗑️ Отброшено: {ordering['dropped']}
+📊 Самые длинные: {deepest}
+🚦 Антиспам: 💬 {throttled['message']['limited']} | 🔘 {throttled['callback']['limited']} | 🔎 {throttled['search']['limited']} отклонено | 👥 Отслеживается: {throttled['message']['keys']}
+""" + webhook_text
         
         await safe_send_message(message.from_user.id, stats_text)
         logger.info(f"✅ АДМИН: Статистика запрошена администратором {message.from_user.id}")
@@ -887,6 +1181,78 @@ async def cmd_admin_stats(message: Message):
         logger.error(f"❌ Ошибка команды: {e}")
         await safe_send_message(message.from_user.id, f"❌ <b>Ошибка!</b>\n\n{str(e)}")
 
+async def cmd_admin_recount(message: Message):
+    """👑 /admin_recount - Сверить счётчики статистики с полным пересчётом"""
+    if not is_admin(message.from_user.id):
+        await safe_send_message(message.from_user.id, "❌ <b>Доступ запрещён!</b>")
+        return
+    
+    try:
+        drift = await db.recount_stats(fix=True)
+        
+        if drift is None:
+            await safe_send_message(message.from_user.id, "❌ <b>Ошибка при пересчёте статистики!</b>")
+            return
+        
+        if not drift:
+            await safe_send_message(message.from_user.id, "✅ <b>Счётчики совпадают с пересчётом</b>")
+            return
+        
+        lines = "\n".join(f"• {name}: {counter} → {actual}" for name, (counter, actual) in drift.items())
+        await safe_send_message(message.from_user.id, f"🔧 <b>Счётчики исправлены:</b>\n\n{lines}")
+        logger.warning(f"⚠️ АДМИН: Расхождение счётчиков исправлено: {drift}")
+    
+    except Exception as e:
+        logger.error(f"❌ Ошибка команды: {e}")
+        await safe_send_message(message.from_user.id, f"❌ <b>Ошибка!</b>\n\n{str(e)}")
+
+async def cmd_admin_lag(message: Message):
+    """👑 /admin_lag [номер | reset] - Кто останавливает цикл событий"""
+    if not is_admin(message.from_user.id):
+        await safe_send_message(message.from_user.id, "❌ <b>Доступ запрещён!</b>")
+        return
+    
+    if watchdog is None:
+        await safe_send_message(message.from_user.id, "❌ <b>Сторож цикла выключен</b> (LOOP_LAG_THRESHOLD_MS=0)")
+        return
+    
+    args = message.text.split()
+    if len(args) > 1 and args[1] == 'reset':
+        watchdog.reset()
+        await safe_send_message(message.from_user.id, "✅ <b>Статистика остановок сброшена</b>")
+        return
+    
+    offenders = watchdog.top()
+    if len(args) > 1:
+        if not args[1].isdigit() or not 1 <= int(args[1]) <= len(offenders):
+            await safe_send_message(message.from_user.id, f"❌ <b>Нет остановки с номером {html.escape(args[1])}</b>")
+            return
+        offender = offenders[int(args[1]) - 1]
+        # Лимит сообщения Telegram - 4096 символов; важнее внутренние кадры
+        stack = offender['stack'][-3500:]
+        await safe_send_message(
+            message.from_user.id,
+            f"🐢 <b>{html.escape(offender['location'])}</b>\n\n<pre>{html.escape(stack)}</pre>"
+        )
+        return
+    
+    lag = watchdog.stats()
+    lines = [
+        f"{i}. <code>{html.escape(offender['location'])}</code>\n"
+        f"   ⏱️ {offender['count']} раз, всего {offender['total_lag_ms']:.0f} мс, макс. {offender['max_lag_ms']:.0f} мс\n"
+        f"   🎯 {html.escape(offender['handler'] or '—')} | 🗄️ {html.escape(offender['db_method'] or '—')}"
+        for i, offender in enumerate(offenders, 1)
+    ]
+    text = f"""🐢 <b>ЗАДЕРЖКА ЦИКЛА СОБЫТИЙ</b>
+
+⏱️ Сейчас: {lag['last_lag_ms']:.1f} мс | Макс.: {lag['max_lag_ms']:.0f} мс | Порог: {lag['threshold_ms']:.0f} мс
+🛑 Остановок: {lag['stalls']} | Со стеком: {lag['captured']}
+
+{chr(10).join(lines) or "✅ Остановок не было"}
+
+Стек: <code>/admin_lag 1</code> | Сброс: <code>/admin_lag reset</code>"""
+    await safe_send_message(message.from_user.id, text)
+
 async def cmd_admin_list_premium(message: Message):
     """👑 /admin_list_premium - Список премиум пользователей"""
     if not is_admin(message.from_user.id):
@@ -894,7 +1260,7 @@ async def cmd_admin_list_premium(message: Message):
         return
     
     try:
-        premium_users = db.get_premium_users()
+        premium_users = await db.get_premium_users()
         
         if not premium_users:
             await safe_send_message(message.from_user.id, "❌ <b>Нет премиум пользователей!</b>")
@@ -952,6 +1318,12 @@ async def cmd_admin_help(message: Message):
 /admin_stats - Общая статистика бота
 → Показывает всех пользователей, премиум пользователей, забанено, диалогов и сообщений
 
+/admin_recount - Сверить счётчики с полным пересчётом
+→ Исправляет расхождения (медленно на большой базе)
+
+/admin_lag - Что останавливает цикл событий дольше порога
+→ <code>/admin_lag 1</code> - стек, <code>/admin_lag reset</code> - сброс
+
 📋 <b>СПИСОК ПРЕМИУМА:</b>
 /admin_list_premium - Список всех премиум пользователей
 → Показывает всех премиум пользователей с датами истечения подписки
@@ -965,19 +1337,17 @@ async def cmd_admin_help(message: Message):
 # ═══════════════════════════════════════════════════════════════════════════════════════════
 
 async def cmd_start(message: Message, state: FSMContext):
-    global user_fsm_contexts
     try:
         user_id = message.from_user.id
         
-        if db.is_user_banned(user_id):
+        if await db.is_user_banned(user_id):
             await safe_send_message(user_id, "❌ <b>Вы банны в этом боте</b>\n\nЕсли это ошибка, отправьте /appeal")
             return
         
-        user = db.get_user(user_id)
-        user_fsm_contexts[user_id] = state
+        user = await db.get_user(user_id)
         
         if not user:
-            db.create_user(user_id, message.from_user.username, message.from_user.first_name)
+            await db.create_user(user_id, message.from_user.username, message.from_user.first_name)
             await safe_send_message(
                 user_id,
                 "👋 <b>Привет! Добро пожаловать!</b>\n\n👨‍👩 <b>Сначала укажите ваш пол:</b>",
@@ -1008,7 +1378,7 @@ async def register_gender_callback(callback: CallbackQuery, state: FSMContext):
         if not gender_text:
             return
         
-        db.update_user(user_id, gender=gender_text)
+        await db.update_user(user_id, gender=gender_text)
         
         await callback.answer()
         await callback.message.edit_text(
@@ -1050,7 +1420,7 @@ async def handle_age_input(message: Message, state: FSMContext):
             )
             return
         
-        db.update_user(user_id, age=age)
+        await db.update_user(user_id, age=age)
         
         await safe_send_message(
             user_id,
@@ -1124,6 +1494,8 @@ async def cmd_help(message: Message):
 • 🎬 Видеосообщения
 • 😊 Стикеры
 • 🎬 Гифки
+• 📎 Файлы и музыка
+• 🖼️ Альбомы
 
 📞 <b>ПОДДЕРЖКА:</b>
 По любым вопросам обращаться к @Dontonu
@@ -1164,6 +1536,8 @@ async def help_callback(callback: CallbackQuery):
 • 🎬 Видеосообщения
 • 😊 Стикеры
 • 🎬 Гифки
+• 📎 Файлы и музыка
+• 🖼️ Альбомы
 
 📞 <b>ПОДДЕРЖКА:</b>
 По любым вопросам обращаться к @Dontonu
@@ -1209,31 +1583,47 @@ async def cmd_delete_my_data(message: Message):
     user_id = message.from_user.id
     
     try:
-        success = db.delete_user_data(user_id)
+        result = await db.delete_user_data(user_id)
         
-        if success:
+        if result is None:
+            await safe_send_message(user_id, "❌ Ошибка при удалении данных")
+            return
+        
+        job, created = result
+        if created:
             await safe_send_message(
                 user_id,
-                "🗑️ <b>Успех!</b>\n\nВсе ваши данные удалены из базы данных."
+                "🗑️ <b>Запрос принят!</b>\n\nВаши данные удаляются в фоне. Мы сообщим, когда всё будет готово."
             )
-            logger.info(f"✅ Пользователь {user_id} удалил свои данные")
+            logger.info(f"✅ Пользователь {user_id} запросил удаление данных")
         else:
-            await safe_send_message(user_id, "❌ Ошибка при удалении данных")
+            await safe_send_message(
+                user_id,
+                f"⏳ <b>Удаление уже идёт</b>\n\nУдалено записей: {job['deleted']}. Мы сообщим, когда всё будет готово."
+            )
     except Exception as e:
         logger.error(f"❌ Ошибка: {e}")
         await safe_send_message(user_id, "❌ Ошибка при удалении данных")
 
+async def notify_data_erased(user_id, deleted):
+    """🗑️ Сообщить пользователю, что фоновое удаление данных завершено"""
+    await safe_send_message(
+        user_id,
+        f"🗑️ <b>Готово!</b>\n\nУдалены ваш профиль, сообщения (в том числе из архива), история диалогов, "
+        f"оценки и жалобы (записей: {deleted}).\n\n"
+        f"Записи о платежах и блокировках хранятся для учёта и защиты от злоупотреблений."
+    )
+
 async def search_start_callback(callback: CallbackQuery, state: FSMContext):
     """🔍 Начать поиск с главного меню"""
     try:
         user_id = callback.from_user.id
         
-        if db.is_user_banned(user_id):
+        if await db.is_user_banned(user_id):
             await callback.answer("❌ Вы банны в этом боте", show_alert=True)
             return
         
-        user = db.get_user(user_id)
-        user_fsm_contexts[user_id] = state
+        user = await db.get_user(user_id)
         
         if user_id in active_chats:
             await callback.answer("⚠️ Вы уже в диалоге! Используйте /next или /stop")
@@ -1271,10 +1661,10 @@ async def search_gender_check_callback(callback: CallbackQuery, state: FSMContex
     """Проверка наличия премиума и выбор пола для поиска"""
     try:
         user_id = callback.from_user.id
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         
         # ✅ ИСПРАВЛЕНО: Используем новую функцию проверки активного премиума
-        if not user or not db.is_premium_active(user_id):
+        if not user or not await db.is_premium_active(user_id):
             await callback.answer("💳 ПОИСК ПО ПОЛУ Доступен только для ПРЕМИУМ!", show_alert=True)
             return
         
@@ -1342,7 +1732,7 @@ async def interest_select_callback(callback: CallbackQuery):
         }
         
         interest_text = interest_map.get(callback.data, "Неизвестно")
-        db.update_user(user_id, interests=interest_text)
+        await db.update_user(user_id, interests=interest_text)
         
         await callback.answer()
         await callback.message.edit_text(
@@ -1357,9 +1747,9 @@ async def premium_callback(callback: CallbackQuery):
     """Показать планы премиума"""
     try:
         user_id = callback.from_user.id
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         
-        if user and db.is_premium_active(user_id):
+        if user and await db.is_premium_active(user_id):
             await callback.answer("🎉 У вас уже есть ПРЕМИУМ!", show_alert=True)
             return
         
@@ -1407,14 +1797,7 @@ async def premium_plan_callback(callback: CallbackQuery):
         if not plan_info:
             return
         
-        conn = sqlite3.connect(db.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO payments (user_id, amount, plan, status)
-            VALUES (?, ?, ?, 'pending')
-        ''', (user_id, plan_info["price"], plan_info["name"]))
-        conn.commit()
-        conn.close()
+        await db.create_payment(user_id, plan_info["price"], plan_info["name"])
         
         payment_text = f"""
 📈 <b>ПЛАН: {plan_info['name']}</b>
@@ -1431,12 +1814,9 @@ async def premium_plan_callback(callback: CallbackQuery):
         await callback.answer()
         await callback.message.edit_text(payment_text, reply_markup=get_main_menu())
         
-        try:
-            admin_msg = f"📈 НОВАЯ ПОДПИСКА\nПользователь ID: {user_id}\nПлан: {plan_info['name']} - {plan_info['price']}₽"
-            if ADMIN_ID:
-                await bot_instance.send_message(ADMIN_ID, admin_msg)
-        except:
-            pass
+        admin_msg = f"📈 НОВАЯ ПОДПИСКА\nПользователь ID: {user_id}\nПлан: {plan_info['name']} - {plan_info['price']}₽"
+        if ADMIN_ID:
+            await safe_send_message(ADMIN_ID, admin_msg, priority=PRIORITY_NOTICE)
     except Exception as e:
         logger.error(f"❌ Ошибка: {e}")
 
@@ -1452,16 +1832,14 @@ async def back_to_menu_callback(callback: CallbackQuery):
         logger.error(f"❌ Ошибка: {e}")
 
 async def cmd_search(message: Message, state: FSMContext):
-    global user_fsm_contexts
     try:
         user_id = message.from_user.id
         
-        if db.is_user_banned(user_id):
+        if await db.is_user_banned(user_id):
             await safe_send_message(user_id, "❌ <b>Вы банны в этом боте</b>")
             return
         
-        user = db.get_user(user_id)
-        user_fsm_contexts[user_id] = state
+        user = await db.get_user(user_id)
         
         if user_id in active_chats:
             await safe_send_message(user_id, "⚠️ <b>Вы уже в диалоге!</b>\n\nНапишите /next чтобы перейти к следующему собеседнику")
@@ -1503,7 +1881,7 @@ async def cmd_link(message: Message):
     """Отправить ссылку на себя"""
     try:
         user_id = message.from_user.id
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         
         if not user or not user['username']:
             await safe_send_message(user_id, "❌ У вас нет юзернейма в Телеграме. Установите его в настройках профиля.")
@@ -1525,16 +1903,9 @@ async def next_partner_callback(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
         
         if chat_id and partner_id:
-            db.end_chat(chat_id)
-            active_chats.pop(user_id, None)
-            active_chats.pop(partner_id, None)
-            
-            # ✅ ИСПРАВЛЕНО: Удалить пользователя из очереди ожидания
-            for cat in list(waiting_users.keys()):
-                if user_id in waiting_users[cat]:
-                    waiting_users[cat].remove(user_id)
-                if partner_id in waiting_users[cat]:
-                    waiting_users[cat].remove(partner_id)
+            await db.end_chat(chat_id)
+            # ✅ ИСПРАВЛЕНО: Удалить пользователей из очереди ожидания
+            await release_pair(user_id, partner_id)
             
             voting_message = "📋 <b>Оцените собеседника</b>\n\n👍 Нравится или Не нравится? Ваша оценка важна!"
             
@@ -1565,17 +1936,14 @@ async def end_chat_callback(callback: CallbackQuery, state: FSMContext):
         
         await callback.answer()
         
+        # Выйти из очереди, если собеседник ещё не найден
+        await cancel_search(user_id)
+        
         if chat_id and partner_id:
-            db.end_chat(chat_id)
-            active_chats.pop(user_id, None)
-            active_chats.pop(partner_id, None)
+            await db.end_chat(chat_id)
             
             # ✅ ИСПРАВЛЕНО: Удалить пользователей из очереди ожидания
-            for cat in list(waiting_users.keys()):
-                if user_id in waiting_users[cat]:
-                    waiting_users[cat].remove(user_id)
-                if partner_id in waiting_users[cat]:
-                    waiting_users[cat].remove(partner_id)
+            await release_pair(user_id, partner_id)
             
             voting_message = "📋 <b>Оцените собеседника</b>\n\n👍 Нравится или Не нравится? Ваша оценка важна!"
             
@@ -1595,7 +1963,7 @@ async def end_chat_callback(callback: CallbackQuery, state: FSMContext):
         logger.error(f"❌ Ошибка: {e}")
 
 async def cmd_next(message: Message, state: FSMContext):
-    global active_chats, waiting_users
+    global active_chats
     try:
         user_id = message.from_user.id
         data = await state.get_data()
@@ -1603,16 +1971,9 @@ async def cmd_next(message: Message, state: FSMContext):
         partner_id = data.get('partner_id')
         
         if chat_id and partner_id:
-            db.end_chat(chat_id)
-            active_chats.pop(user_id, None)
-            active_chats.pop(partner_id, None)
-            
-            # ✅ ИСПРАВЛЕНО: Удалить пользователя из очереди ожидания
-            for cat in list(waiting_users.keys()):
-                if user_id in waiting_users[cat]:
-                    waiting_users[cat].remove(user_id)
-                if partner_id in waiting_users[cat]:
-                    waiting_users[cat].remove(partner_id)
+            await db.end_chat(chat_id)
+            # ✅ ИСПРАВЛЕНО: Удалить пользователей из очереди ожидания
+            await release_pair(user_id, partner_id)
             
             voting_message = "📋 <b>Оцените собеседника</b>\n\n👍 Нравится или Не нравится? Ваша оценка важна!"
             
@@ -1628,7 +1989,7 @@ async def cmd_next(message: Message, state: FSMContext):
                 reply_markup=get_vote_keyboard(chat_id, user_id)
             )
             
-            logger.info(f"📢 /next: ОБА пользователя видят новое сообщение")
+            logger.info("📢 /next: ОБА пользователя видят новое сообщение")
         
         await state.clear()
         await cmd_search(message, state)
@@ -1636,24 +1997,21 @@ async def cmd_next(message: Message, state: FSMContext):
         logger.error(f"❌ Ошибка: {e}")
 
 async def cmd_stop(message: Message, state: FSMContext):
-    global active_chats, bot_instance, waiting_users
+    global active_chats, bot_instance
     try:
         user_id = message.from_user.id
         data = await state.get_data()
         partner_id = data.get('partner_id')
         chat_id = data.get('chat_id')
         
+        # Выйти из очереди, если собеседник ещё не найден
+        await cancel_search(user_id)
+        
         if chat_id and partner_id:
-            db.end_chat(chat_id)
-            active_chats.pop(user_id, None)
-            active_chats.pop(partner_id, None)
+            await db.end_chat(chat_id)
             
             # ✅ ИСПРАВЛЕНО: Удалить пользователя из очереди ожидания
-            for cat in list(waiting_users.keys()):
-                if user_id in waiting_users[cat]:
-                    waiting_users[cat].remove(user_id)
-                if partner_id in waiting_users[cat]:
-                    waiting_users[cat].remove(partner_id)
+            await release_pair(user_id, partner_id)
             
             voting_message = "📋 <b>Оцените собеседника</b>\n\n👍 Нравится или Не нравится? Ваша оценка важна!"
             
@@ -1669,93 +2027,139 @@ async def cmd_stop(message: Message, state: FSMContext):
                 reply_markup=get_vote_keyboard(chat_id, partner_id)
             )
             
-            logger.info(f"📢 /stop: ОБА пользователя видят новое сообщение")
+            logger.info("📢 /stop: ОБА пользователя видят новое сообщение")
         
         await state.clear()
     except Exception as e:
         logger.error(f"❌ Ошибка: {e}")
 
-async def send_text(bot, partner_id, user_id, message):
-    try:
-        await asyncio.wait_for(
-            bot.send_message(chat_id=partner_id, text=message.text),
-            timeout=40
-        )
-        logger.info(f"✅ ТЕКСТ: {user_id} -> {partner_id}")
-    except asyncio.TimeoutError:
-        logger.warning(f"⏱️ Тайм-аут отправки текста")
-    except Exception as e:
-        logger.error(f"❌ Ошибка отправки текста: {e}")
-
-async def send_photo(bot, partner_id, user_id, message):
-    try:
-        await asyncio.wait_for(
-            bot.send_photo(
-                chat_id=partner_id,
-                photo=message.photo[-1].file_id,
-                caption=message.caption if message.caption else None
-            ),
-            timeout=40
-        )
-        logger.info(f"📷 ФОТО: {user_id} -> {partner_id}")
-    except asyncio.TimeoutError:
-        logger.warning(f"⏱️ Тайм-аут отправки фото")
-    except Exception as e:
-        logger.error(f"❌ Ошибка отправки фото: {e}")
-
-async def send_voice(bot, partner_id, user_id, message):
-    try:
-        await asyncio.wait_for(
-            bot.send_voice(chat_id=partner_id, voice=message.voice.file_id),
-            timeout=40
-        )
-        logger.info(f"🎤 ГОЛОС: {user_id} -> {partner_id}")
-    except asyncio.TimeoutError:
-        logger.warning(f"⏱️ Тайм-аут отправки голоса")
-    except Exception as e:
-        logger.error(f"❌ Ошибка отправки голоса: {e}")
+# 📝 Подписи медиа для журнала сообщений (текст сохраняется как есть)
+MEDIA_LABELS = {
+    'photo': "[📷 Фото]",
+    'voice': "[🎤 Голос]",
+    'video': "[🎬 Обычное видео]",
+    'video_note': "[📹 Видеокруг]",
+    'sticker': "[😊 Стикер]",
+    'animation': "[🎞️ Гифка]",
+    'audio': "[🎵 Аудио]",
+    'document': "[📎 Файл]",
+    'location': "[📍 Локация]",
+    'venue': "[📍 Место]",
+    'contact': "[👤 Контакт]",
+    'poll': "[📊 Опрос]",
+    'dice': "[🎲 Кубик]",
+}
 
-async def send_video(bot, partner_id, user_id, message):
-    """✅ ИСПРАВЛЕНО: Удалены дублированные except блоки"""
+# Сколько ждать остальные элементы альбома перед пересылкой
+MEDIA_GROUP_WAIT = 0.5
+
+# media_group_id -> альбом, ожидающий пересылки: ID сообщений, куда слать и таймер
+pending_media_groups = {}
+# user_id -> media_group_id альбома, который пользователь сейчас отправляет
+user_media_groups = {}
+
+async def relay_message(bot, partner_id, user_id, message):
+    """Переслать сообщение любого типа одним вызовом copy_message"""
+    # Альбом, отправленный раньше, должен дойти раньше
+    await flush_user_media_group(user_id)
+    await deliver_relay(bot, partner_id, user_id, message.chat.id, [message.message_id], message.content_type)
+
+async def relay_media_group(bot, partner_id, user_id, message):
+    """Добавить элемент в альбом; альбом уйдёт одним copy_messages через MEDIA_GROUP_WAIT
+
+    Обработчик не ждёт: обновления пользователя идут по очереди, и остальные
+    элементы альбома иначе стояли бы за этим ожиданием и пересылались по одному.
+    """
+    group_id = message.media_group_id
+    album = pending_media_groups.get(group_id)
+    if album is not None:
+        album['message_ids'].append(message.message_id)
+        return
+    
+    await flush_user_media_group(user_id)
+    pending_media_groups[group_id] = {
+        'bot': bot,
+        'partner_id': partner_id,
+        'user_id': user_id,
+        'from_chat_id': message.chat.id,
+        'message_ids': [message.message_id],
+        'timer': asyncio.create_task(flush_media_group_later(group_id)),
+    }
+    user_media_groups[user_id] = group_id
+
+async def flush_media_group_later(group_id):
+    await asyncio.sleep(MEDIA_GROUP_WAIT)
+    await flush_media_group(group_id, cancel_timer=False)
+
+async def flush_user_media_group(user_id):
+    """Переслать недособранный альбом пользователя сейчас"""
+    group_id = user_media_groups.get(user_id)
+    if group_id is not None:
+        await flush_media_group(group_id)
+
+async def flush_media_group(group_id, cancel_timer=True):
+    album = pending_media_groups.pop(group_id, None)
+    if album is None:
+        return
+    if user_media_groups.get(album['user_id']) == group_id:
+        del user_media_groups[album['user_id']]
+    if cancel_timer:
+        album['timer'].cancel()
+    
+    await deliver_relay(
+        album['bot'], album['partner_id'], album['user_id'], album['from_chat_id'],
+        sorted(album['message_ids']), 'media_group'
+    )
+
+async def deliver_relay(bot, partner_id, user_id, from_chat_id, message_ids, content_type):
+    """Скопировать сообщения собеседнику (в кластере - силами шарда, которому он принадлежит)"""
+    if not is_local_user(partner_id):
+        # Отправки одному получателю идут из одного процесса: порядок и лимиты на чат соблюдаются
+        await cluster.send_to_user(partner_id, {
+            'type': 'relay',
+            'partner_id': partner_id,
+            'user_id': user_id,
+            'from_chat_id': from_chat_id,
+            'message_ids': message_ids,
+            'content_type': content_type,
+        })
+        return
+    
+    if content_type == 'media_group':
+        try:
+            await scheduler.call(
+                partner_id,
+                lambda: bot.copy_messages(
+                    chat_id=partner_id,
+                    from_chat_id=from_chat_id,
+                    message_ids=message_ids
+                ),
+                priority=PRIORITY_RELAY,
+                timeout=40
+            )
+            logger.info("🖼️ АЛЬБОМ (%s): %s -> %s", len(message_ids), user_id, partner_id)
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱️ Тайм-аут пересылки альбома")
+        except Exception as e:
+            logger.error(f"❌ Ошибка пересылки альбома: {e}")
+        return
+    
     try:
-        await asyncio.wait_for(
-            bot.send_video(
+        await scheduler.call(
+            partner_id,
+            lambda: bot.copy_message(
                 chat_id=partner_id,
-                video=message.video.file_id,
-                caption=message.caption if message.caption else None
+                from_chat_id=from_chat_id,
+                message_id=message_ids[0]
             ),
+            priority=PRIORITY_RELAY,
             timeout=40
         )
-        logger.info(f"🎬 ВИДЕО: {user_id} -> {partner_id}")
+        logger.info("✅ %s: %s -> %s", content_type, user_id, partner_id)
     except asyncio.TimeoutError:
-        logger.warning(f"⏱️ Тайм-аут отправки видео")
+        logger.warning(f"⏱️ Тайм-аут пересылки {content_type}")
     except Exception as e:
-        logger.error(f"❌ Ошибка отправки видео: {e}")
-
-async def send_video_note(bot, partner_id, user_id, message):
-    """✅ ИСПРАВЛЕНО: Удалены дублированные except блоки"""
-    try:
-        await asyncio.wait_for(
-            bot.send_video_note(chat_id=partner_id, video_note=message.video_note.file_id),
-            timeout=40
-        )
-        logger.info(f"📹 ВИДЕОКРУГ: {user_id} -> {partner_id}")
-    except asyncio.TimeoutError:
-        logger.warning(f"⏱️ Тайм-аут отправки видеокруга")
-    except Exception as e:
-        logger.error(f"❌ Ошибка отправки видеокруга: {e}")
-
-async def send_sticker(bot, partner_id, user_id, message):
-    try:
-        await asyncio.wait_for(
-            bot.send_sticker(chat_id=partner_id, sticker=message.sticker.file_id),
-            timeout=40
-        )
-        logger.info(f"😊 СТИКЕР: {user_id} -> {partner_id}")
-    except asyncio.TimeoutError:
-        logger.warning(f"⏱️ Тайм-аут отправки стикера")
-    except Exception as e:
-        logger.error(f"❌ Ошибка отправки стикера: {e}")
+        logger.error(f"❌ Ошибка пересылки {content_type}: {e}")
 
 async def handle_chat_message(message: Message, state: FSMContext):
     global bot_instance, active_chats
@@ -1770,14 +2174,16 @@ async def handle_chat_message(message: Message, state: FSMContext):
             await state.clear()
             return
         
-        if partner_id not in active_chats:
+        # Собеседник с другого шарда: о его выходе сообщит событие ended
+        if is_local_user(partner_id) and partner_id not in active_chats:
             await safe_send_message(user_id, "❌ <b>Он/она вышел/а</b>", reply_markup=get_main_menu())
             await state.clear()
             active_chats.pop(user_id, None)
             return
         
-        if message.text:
-            is_forbidden, category = check_forbidden_content(message.text)
+        text = message.text or message.caption
+        if text:
+            is_forbidden, category = check_forbidden_content(text)
             if is_forbidden:
                 await safe_send_message(
                     user_id,
@@ -1787,36 +2193,15 @@ async def handle_chat_message(message: Message, state: FSMContext):
                 return
         
         if message.text:
-            db.save_message(chat_id, user_id, message.text)
-        elif message.photo:
-            db.save_message(chat_id, user_id, "[📷 Фото]")
-        elif message.voice:
-            db.save_message(chat_id, user_id, "[🎤 Голос]")
-        elif message.video:
-            db.save_message(chat_id, user_id, "[🎬 Обычное видео]")
-        elif message.video_note:
-            db.save_message(chat_id, user_id, "[📹 Видеокруг]")
-        elif message.sticker:
-            db.save_message(chat_id, user_id, "[😊 Стикер]")
-        
-        try:
-            if message.text:
-                await send_text(bot_instance, partner_id, user_id, message)
-            elif message.photo:
-                await send_photo(bot_instance, partner_id, user_id, message)
-            elif message.voice:
-                await send_voice(bot_instance, partner_id, user_id, message)
-            elif message.video:
-                await send_video(bot_instance, partner_id, user_id, message)
-            elif message.video_note:
-                await send_video_note(bot_instance, partner_id, user_id, message)
-            elif message.sticker:
-                await send_sticker(bot_instance, partner_id, user_id, message)
+            await db.save_message(chat_id, user_id, message.text)
+        else:
+            label = MEDIA_LABELS.get(message.content_type, f"[{message.content_type}]")
+            await db.save_message(chat_id, user_id, label)
         
-        except asyncio.TimeoutError:
-            logger.warning(f"⏱️ Тайм-аут отправки")
-        except Exception as send_error:
-            logger.error(f"❌ Ошибка отправки: {send_error}")
+        if message.media_group_id:
+            await relay_media_group(bot_instance, partner_id, user_id, message)
+        else:
+            await relay_message(bot_instance, partner_id, user_id, message)
     
     except Exception as e:
         logger.error(f"❌ Критическая: {e}")
@@ -1829,9 +2214,14 @@ async def vote_callback(callback: CallbackQuery, state: FSMContext):
         chat_id = data_parts[2]
         partner_id = int(data_parts[3])
         
-        db.save_vote(user_id, partner_id, chat_id, vote_type)
+        recorded = await db.save_vote(user_id, partner_id, chat_id, vote_type)
         
-        vote_text = "👍 Вы оценили собеседника позитивно" if vote_type == "positive" else "👎 Вы оценили собеседника негативно"
+        if not recorded:
+            vote_text = "ℹ️ Вы уже оценили этого собеседника"
+        elif vote_type == "positive":
+            vote_text = "👍 Вы оценили собеседника позитивно"
+        else:
+            vote_text = "👎 Вы оценили собеседника негативно"
         
         await callback.message.edit_text(
             f"📋 <b>Оценка принята!</b>\n\n{vote_text}\n\n🌟 Оценки пользователей помогают нам определить наилучших собеседников!",
@@ -1865,16 +2255,93 @@ async def setup_menu_button(bot: Bot):
     except Exception as e:
         logger.error(f"❌ Ошибка при установке меню: {e}")
 
-async def main():
+async def handle_cluster_message(dp: Dispatcher, message: dict):
+    """Обработать сообщение из очереди шарда: обновление Telegram или событие другого шарда"""
+    kind = message.get('type')
+    if kind == 'update':
+        update = Update.model_validate(message['update'], context={'bot': bot_instance})
+        await dp.feed_update(bot_instance, update)
+    elif kind == 'matched':
+        await accept_remote_match(bot_instance, message['user_id'], message['partner_id'], message['chat_id'], message['category'])
+    elif kind == 'match_cancelled':
+        await drop_cancelled_match(bot_instance, message['user_id'], message['chat_id'])
+    elif kind == 'ended':
+        active_chats.pop(message['user_id'], None)
+    elif kind == 'relay':
+        await deliver_relay(
+            bot_instance, message['partner_id'], message['user_id'],
+            message['from_chat_id'], message['message_ids'], message['content_type']
+        )
+    elif kind == 'refresh':
+        await db.refresh_user(message['user_id'])
+
+async def notify_owner_shard(user_id):
+    """Попросить шард-владельца перечитать статус пользователя"""
+    if not is_local_user(user_id):
+        await cluster.send_to_user(user_id, {'type': 'refresh', 'user_id': user_id})
+
+async def run_router():
+    """🧩 Роутер кластера: единственный процесс, получающий обновления от Telegram"""
     global bot_instance
+    matchmaker_service = MatchmakerService(cluster)
+    matchmaker_task = None
     try:
-        await db.init_db()
-        
-        bot_instance = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-        dp = Dispatcher()
-        
+        bot_instance = create_bot()
         await setup_menu_button(bot_instance)
         
+        matchmaker_task = asyncio.create_task(matchmaker_service.run())
+        logger.info(f"🧩 РОУТЕР: обновления распределяются по {CLUSTER_SHARDS} шардам")
+        await route_updates(bot_instance, cluster)
+    except Exception as e:
+        logger.error(f"❌ Критическая: {e}")
+    finally:
+        if matchmaker_task:
+            matchmaker_task.cancel()
+            await asyncio.gather(matchmaker_task, return_exceptions=True)
+        await cluster.close()
+        if bot_instance:
+            await bot_instance.session.close()
+
+async def main():
+    global bot_instance, webhook_server, metrics_server
+    if cluster is not None and CLUSTER_ROLE == 'router':
+        await run_router()
+        return
+    
+    ban_expiry_task = resume_task = None
+    try:
+        if watchdog:
+            watchdog.start()
+        await db.init_db()
+        db.journal.start()
+        db.status.start()
+        db.maintenance.start()
+        db.partitions.start()
+        db.on_data_erased = notify_data_erased
+        db.erasure.start()
+        ban_expiry_task = asyncio.create_task(ban_expiry_worker(db, BAN_EXPIRY_INTERVAL))
+        fsm_storage.start()
+        
+        bot_instance = create_bot()
+        dp = Dispatcher(storage=fsm_storage)
+        if METRICS_PORT:
+            metrics_server = setup_metrics(dp, bot_instance)
+            await metrics_server.start()
+        # Обновления одного пользователя - строго по очереди, разных - параллельно
+        dp.update.outer_middleware(user_ordering)
+        # Антиспам до фильтров и обработчиков
+        dp.message.outer_middleware(throttle)
+        dp.callback_query.outer_middleware(throttle)
+        
+        if cluster is not None:
+            # Лимит Telegram общий для бота - делим его между шардами
+            scheduler.set_global_rate(SEND_GLOBAL_RATE / CLUSTER_SHARDS)
+            db.on_user_changed = notify_owner_shard
+        
+        scheduler.start()
+        if cluster is None:
+            await setup_menu_button(bot_instance)
+        
         # Регистрация команд
         dp.message.register(cmd_start, Command("start"))
         dp.message.register(cmd_rules, Command("rules"))
@@ -1894,6 +2361,8 @@ async def main():
         dp.message.register(cmd_admin_unban_user, Command("admin_unban"))
         dp.message.register(cmd_admin_user_info, Command("admin_info"))
         dp.message.register(cmd_admin_stats, Command("admin_stats"))
+        dp.message.register(cmd_admin_recount, Command("admin_recount"))
+        dp.message.register(cmd_admin_lag, Command("admin_lag"))
         dp.message.register(cmd_admin_list_premium, Command("admin_list_premium"))
         dp.message.register(cmd_admin_help, Command("admin_help"))
         
@@ -1920,16 +2389,58 @@ async def main():
         # Обработка сообщений в чате
         dp.message.register(handle_chat_message, UserStates.in_chat)
         
+        if watchdog:
+            # По этим функциям в стеке остановка приписывается обработчику и методу БД
+            watchdog.track('handler', [h.callback for h in dp.message.handlers + dp.callback_query.handlers])
+            watchdog.track('db', vars(Database).values())
+        
         logger.info("📱 BOT STARTED - ✨ АДМИН КОМАНДЫ АКТИВИРОВАНЫ ✨")
         logger.info("✅ БЕЗОПАСНОСТЬ: Проверка возраста (18+) активирована")
         logger.info("✅ ФИЛЬТРАЦИЯ: Проверка на запрещённый контент активирована")
         logger.info("✅ ИСПРАВЛЕНИЯ: Все ошибки исправлены, включая race condition и проверку премиума")
-        await dp.start_polling(bot_instance)
+        # Задачей: в кластере ответы матчмейкера читает цикл consume ниже
+        resume_task = asyncio.create_task(resume_waiting_searches(bot_instance))
+        if cluster is not None:
+            logger.info(f"🧩 ШАРД {CLUSTER_SHARD_ID}/{CLUSTER_SHARDS}: обновления из очереди {cluster.queue(CLUSTER_SHARD_ID)}")
+            await cluster.consume(cluster.queue(CLUSTER_SHARD_ID), lambda message: handle_cluster_message(dp, message))
+        elif WEBHOOK_URL:
+            webhook_server = WebhookServer(
+                dp, bot_instance, WEBHOOK_URL, WEBHOOK_SECRET,
+                path=WEBHOOK_PATH, host=WEBHOOK_HOST, port=WEBHOOK_PORT,
+                workers=UPDATE_WORKERS, max_queue=UPDATE_MAX_QUEUE, max_per_user=UPDATE_MAX_PER_USER,
+                ready_check=lambda: db.pool.is_open,
+            )
+            await webhook_server.start()
+            # Обновления обрабатывает сервер; ждём остановки процесса
+            await asyncio.Event().wait()
+        else:
+            await bot_instance.delete_webhook()
+            await dp.start_polling(bot_instance)
     except Exception as e:
         logger.error(f"❌ Критическая: {e}")
     finally:
+        if webhook_server:
+            await webhook_server.stop()
+        if metrics_server:
+            await metrics_server.stop()
+        if watchdog:
+            await watchdog.stop()
+        await scheduler.stop()
+        await db.journal.stop()
+        await db.status.stop()
+        await db.maintenance.stop()
+        await db.partitions.stop()
+        await db.erasure.stop()
+        for task in (ban_expiry_task, resume_task):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        await fsm_storage.close()
+        if cluster is not None:
+            await cluster.close()
         if bot_instance:
             await bot_instance.session.close()
+        db.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
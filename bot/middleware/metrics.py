@@ -0,0 +1,78 @@
+"""Metrics middlewares: handler latency and Bot API call latency"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from bot.utils.metrics import Registry
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Records how long updates and handlers take.
+
+    Register one instance as an outer middleware on dp.update (label
+    "update:<type>", includes waiting behind the user's earlier updates)
+    and as an inner middleware on dp.message and dp.callback_query: only
+    there aiogram has already picked the handler, so the label is the
+    handler's function name (handle_chat_message, vote_callback, ...).
+    """
+
+    def __init__(self, registry: Registry):
+        self.duration = registry.histogram(
+            'bot_handler_duration_seconds', 'Time spent in update handlers', ('handler',)
+        )
+        self.errors = registry.counter(
+            'bot_handler_errors_total', 'Exceptions raised by update handlers', ('handler', 'error')
+        )
+
+    @staticmethod
+    def label_of(event: TelegramObject, data: Dict[str, Any]) -> str:
+        handler = data.get('handler')
+        if handler is not None:
+            return getattr(handler.callback, '__name__', 'unknown')
+        if isinstance(event, Update):
+            return f'update:{event.event_type}'
+        return f'update:{type(event).__name__}'
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            self.errors.inc(self.label_of(event, data), type(e).__name__)
+            raise
+        finally:
+            self.duration.observe(time.perf_counter() - started, self.label_of(event, data))
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Records Bot API call latency and errors by method (bot.session.middleware(...))."""
+
+    def __init__(self, registry: Registry):
+        self.duration = registry.histogram(
+            'bot_api_request_duration_seconds', 'Bot API call latency', ('method',)
+        )
+        self.errors = registry.counter(
+            'bot_api_errors_total', 'Failed Bot API calls', ('method', 'error')
+        )
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot, method: TelegramMethod):
+        name = getattr(method, '__api_method__', type(method).__name__)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            # Ошибки API (TelegramRetryAfter, TelegramForbiddenError, ...) и сети
+            self.errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            self.duration.observe(time.perf_counter() - started, name)
@@ -0,0 +1,124 @@
+"""Ordering middleware: serial updates per user, parallel across users"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+
+class UserOrderingMiddleware(BaseMiddleware):
+    """Outer update middleware that runs each user's updates one at a time.
+
+    aiogram handles every update in its own task, so two messages of one
+    user can reach the partner out of order. Each update waits here until
+    the previous update of the same user has finished; other users are not
+    affected. A user's backlog is bounded: a callback repeating one that is
+    already waiting is merged into it, and updates beyond max_depth are
+    dropped.
+    """
+
+    def __init__(self, max_depth: int = 20):
+        """Initialize ordering middleware
+
+        Args:
+            max_depth: Updates of one user allowed to run or wait at once
+        """
+        self.max_depth = max_depth
+        # user_id -> очередь (future-очередь хода, update); первый элемент выполняется
+        self._queues: Dict[int, Deque[Tuple[asyncio.Future, Update]]] = {}
+
+        # Метрики
+        self.processed = 0
+        self.merged = 0
+        self.dropped = 0
+        self.peak_depth = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        """Wait for the user's previous updates, then process this one"""
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        queue = self._queues.get(user.id)
+        if queue is None:
+            queue = self._queues[user.id] = deque()
+        elif self._is_duplicate(queue, event):
+            self.merged += 1
+            await self._discard(event)
+            return None
+        elif len(queue) >= self.max_depth:
+            self.dropped += 1
+            await self._discard(event)
+            return None
+
+        entry = (asyncio.get_running_loop().create_future(), event)
+        queue.append(entry)
+        self.peak_depth = max(self.peak_depth, len(queue))
+        if len(queue) == 1:
+            entry[0].set_result(None)
+
+        try:
+            await entry[0]
+            return await handler(event, data)
+        finally:
+            self.processed += 1
+            self._leave(user.id, queue, entry)
+
+    def _leave(self, user_id: int, queue: Deque, entry: Tuple[asyncio.Future, Update]):
+        was_running = queue[0] is entry
+        queue.remove(entry)
+        if not queue:
+            del self._queues[user_id]
+        elif was_running:
+            queue[0][0].set_result(None)
+
+    @staticmethod
+    def _is_duplicate(queue: Deque[Tuple[asyncio.Future, Update]], event: Update) -> bool:
+        """Same button pressed again on the same message while the first press still waits"""
+        callback = event.callback_query
+        if callback is None or callback.message is None:
+            return False
+        for _, waiting in list(queue)[1:]:
+            other = waiting.callback_query
+            if (other is not None and other.message is not None and other.data == callback.data
+                    and other.message.message_id == callback.message.message_id):
+                return True
+        return False
+
+    @staticmethod
+    async def _discard(event: Update):
+        # Иначе у нажатой кнопки крутится индикатор загрузки
+        if event.callback_query is not None:
+            try:
+                await event.callback_query.answer()
+            except Exception as e:
+                logger.debug(f"Не удалось ответить на отброшенный callback: {e}")
+
+    def depth(self, user_id: int) -> int:
+        """Updates of a user currently running or waiting"""
+        queue = self._queues.get(user_id)
+        return len(queue) if queue else 0
+
+    def stats(self, top: int = 5) -> Dict[str, Any]:
+        """Return queue depth metrics and the users with the deepest backlog"""
+        depths = sorted(((len(q), user_id) for user_id, q in self._queues.items()), reverse=True)
+        return {
+            'active_users': len(depths),
+            'waiting': sum(depth - 1 for depth, _ in depths),
+            'max_depth': depths[0][0] if depths else 0,
+            'peak_depth': self.peak_depth,
+            'deepest': [(user_id, depth) for depth, user_id in depths[:top]],
+            'processed': self.processed,
+            'merged': self.merged,
+            'dropped': self.dropped,
+        }
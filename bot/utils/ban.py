@@ -1,7 +1,19 @@
+"""Report-based bans and background expiry of timed bans
+
+Benchmark of the expiry sweep and ban checks (1M users, 50k bans):
+    python -m bot.utils.ban --users 1000000 --bans 50000
+"""
+
+import asyncio
+import logging
+import os
+import time
 from datetime import datetime, timedelta
-from bot.config import BAN_DURATION, MAX_REPORTS_FOR_BAN, AUTO_BAN_RESET
+from bot.config import BAN_DURATION, MAX_REPORTS_FOR_BAN
 from bot.database.db import Database
 
+logger = logging.getLogger(__name__)
+
 
 async def check_and_apply_ban(user_id: int, db: Database) -> bool:
     """
@@ -25,23 +37,33 @@ async def check_and_apply_ban(user_id: int, db: Database) -> bool:
     return False
 
 
-async def auto_unban_expired(db: Database):
+async def auto_unban_expired(db: Database) -> int:
     """
-    Автоматически разбанить пользователей по истечению времени.
+    Разбанить всех пользователей с истёкшим баном одним UPDATE.
     """
-    expired_bans = await db.get_expired_bans()
-    
-    for ban_user in expired_bans:
-        await db.unban_user(ban_user['user_id'])
+    return await db.unban_expired()
+
+
+async def ban_expiry_worker(db: Database, interval: float = 60):
+    """
+    Фоновая задача: снимать истёкшие баны раз в interval секунд.
+    Подходит любая БД с методом unban_expired() (bot.database.db и bot.main).
+    """
+    while True:
+        try:
+            unbanned = await auto_unban_expired(db)
+            if unbanned:
+                logger.info(f"✅ Снято истёкших банов: {unbanned}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка снятия истёкших банов: {e}")
+        await asyncio.sleep(interval)
 
 
 async def is_user_banned(user_id: int, db: Database) -> bool:
     """
     Проверить, забанен ли пользователь.
     """
-    # Также автоматически разбанить если время истекло
-    await auto_unban_expired(db)
-    
+    # Истёкшие баны снимает ban_expiry_worker, здесь только чтение по ключу
     user = await db.get_user(user_id)
     
     if not user:
@@ -50,11 +72,10 @@ async def is_user_banned(user_id: int, db: Database) -> bool:
     if not user['is_banned']:
         return False
     
-    # Проверить время бана
+    # Бан истёк, но фоновая задача ещё не успела его снять
     if user['ban_expires_at']:
-        ban_expires = datetime.fromisoformat(user['ban_expires_at'])
+        ban_expires = datetime.fromisoformat(str(user['ban_expires_at']))
         if datetime.now() > ban_expires:
-            await db.unban_user(user_id)
             return False
     
     return True
@@ -74,3 +95,102 @@ async def get_ban_info(user_id: int, db: Database) -> dict:
         'expires_at': user['ban_expires_at'],
         'is_banned': True
     }
+
+
+async def benchmark(users: int, bans: int, checks: int, directory: str):
+    """Compare the old per-check sweep with the indexed bulk expiry."""
+    import random
+    import sqlite3
+
+    os.makedirs(directory, exist_ok=True)
+    db_path = os.path.join(directory, 'ban_bench.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    db = Database(db_path)
+    await db.init_db()
+
+    now = datetime.now()
+    banned = random.sample(range(1, users + 1), bans)
+    expired, active = banned[:bans // 2], banned[bans // 2:]
+
+    def fill(conn: sqlite3.Connection):
+        conn.executemany('INSERT INTO users (user_id, username) VALUES (?, ?)',
+                         ((user_id, f'user{user_id}') for user_id in range(1, users + 1)))
+        conn.executemany('UPDATE users SET is_banned = 1, ban_expires_at = ? WHERE user_id = ?',
+                         (((now + timedelta(days=1)).isoformat(' '), user_id) for user_id in active))
+        conn.commit()
+
+    def expire(conn: sqlite3.Connection):
+        conn.executemany('UPDATE users SET is_banned = 1, ban_expires_at = ? WHERE user_id = ?',
+                         (((now - timedelta(hours=1)).isoformat(' '), user_id) for user_id in expired))
+        conn.commit()
+
+    def with_conn(fn, *args):
+        conn = sqlite3.connect(db_path)
+        try:
+            return fn(conn, *args)
+        finally:
+            conn.close()
+
+    started = time.perf_counter()
+    with_conn(fill)
+    print(f"Setup: {users} users, {bans} bans ({len(expired)} expired) in {time.perf_counter() - started:.1f} s")
+
+    # Было: без индекса, SELECT * истёкших и по соединению на каждый снятый бан
+    with_conn(lambda conn: conn.execute('DROP INDEX idx_users_ban_expiry'))
+    with_conn(expire)
+    started = time.perf_counter()
+    for row in await db.get_expired_bans():
+        await db.unban_user(row['user_id'])
+    old_sweep = time.perf_counter() - started
+
+    # Проверка бана делала тот же проход перед каждым чтением (истёкших уже нет)
+    sample = [random.choice(banned) for _ in range(checks)]
+    old_checks = max(checks // 50, 1)
+    started = time.perf_counter()
+    for user_id in sample[:old_checks]:
+        for row in await db.get_expired_bans():
+            await db.unban_user(row['user_id'])
+        await db.get_user(user_id)
+    old_check = (time.perf_counter() - started) / old_checks
+
+    # Стало: индекс (is_banned, ban_expires_at) и один UPDATE за проход
+    with_conn(lambda conn: conn.execute(
+        'CREATE INDEX idx_users_ban_expiry ON users (is_banned, ban_expires_at)'
+    ))
+    with_conn(expire)
+    started = time.perf_counter()
+    unbanned = await auto_unban_expired(db)
+    new_sweep = time.perf_counter() - started
+    started = time.perf_counter()
+    idle = await auto_unban_expired(db)
+    idle_sweep = time.perf_counter() - started
+
+    started = time.perf_counter()
+    still_banned = 0
+    for user_id in sample:
+        still_banned += await is_user_banned(user_id, db)
+    new_check = (time.perf_counter() - started) / checks
+
+    plan = with_conn(lambda conn: conn.execute(
+        'EXPLAIN QUERY PLAN UPDATE users SET is_banned = 0 '
+        'WHERE is_banned = 1 AND ban_expires_at IS NOT NULL AND ban_expires_at < ?', ('',)
+    ).fetchall())
+    print(f"Expiry sweep ({len(expired)} expired): {old_sweep * 1000:,.0f} ms per-row unban without index, "
+          f"{new_sweep * 1000:,.1f} ms bulk UPDATE ({unbanned} rows), {idle_sweep * 1000:.2f} ms when nothing is due")
+    print(f"Ban check: {old_check * 1000:,.2f} ms with sweep ({old_checks} checks), "
+          f"{new_check * 1000:.3f} ms indexed read ({checks} checks, {still_banned} banned)")
+    print(f"Sweep plan: {plan[0][-1]}")
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Ban expiry benchmark')
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--bans', type=int, default=50000)
+    parser.add_argument('--checks', type=int, default=10000)
+    parser.add_argument('--dir', default='ban_bench')
+    cli = parser.parse_args()
+    asyncio.run(benchmark(cli.users, cli.bans, cli.checks, cli.dir))
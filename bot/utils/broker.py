@@ -0,0 +1,164 @@
+"""Local stand-in for Redis: enough of the protocol for FSM storage and cluster queues
+
+Run with: python -m bot.utils.broker --port 6379
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import logging
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Broker:
+    """In-memory key/value and list server speaking RESP.
+
+    Supports PING, AUTH, SELECT, GET, SET, DEL, SCAN, RPUSH, LLEN and BLPOP.
+    Data lives in memory only and every database number shares one
+    keyspace; it is meant for local runs and tests, not production.
+    """
+
+    def __init__(self):
+        self.strings: Dict[bytes, bytes] = {}
+        self.lists: Dict[bytes, Deque[bytes]] = defaultdict(deque)
+        self._waiters: Dict[bytes, Deque[asyncio.Future]] = defaultdict(deque)
+
+    # ===== ПРОТОКОЛ =====
+
+    @staticmethod
+    def _bulk(value: Optional[bytes]) -> bytes:
+        if value is None:
+            return b'$-1\r\n'
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # Inline-команда (например, из telnet)
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                if not command:
+                    continue
+                writer.write(await self.execute(command))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # ===== КОМАНДЫ =====
+
+    async def execute(self, command: List[bytes]) -> bytes:
+        name, args = command[0].upper(), command[1:]
+        if name == b'PING':
+            return b'+PONG\r\n'
+        if name in (b'AUTH', b'SELECT'):
+            return b'+OK\r\n'
+        if name == b'GET':
+            return self._bulk(self.strings.get(args[0]))
+        if name == b'SET':
+            self.strings[args[0]] = args[1]
+            return b'+OK\r\n'
+        if name == b'DEL':
+            removed = 0
+            for key in args:
+                removed += self.strings.pop(key, None) is not None
+                removed += self.lists.pop(key, None) is not None
+            return b':%d\r\n' % removed
+        if name == b'SCAN':
+            return self._scan(args)
+        if name == b'RPUSH':
+            return b':%d\r\n' % self._push(args[0], args[1:])
+        if name == b'LLEN':
+            return b':%d\r\n' % len(self.lists.get(args[0], ()))
+        if name == b'BLPOP':
+            return await self._blpop(args[:-1], float(args[-1]))
+        return b'-ERR unknown command %s\r\n' % name
+
+    def _scan(self, args: List[bytes]) -> bytes:
+        # Курсор - номер ключа в отсортированном списке (ключи, добавленные во время обхода, могут не попасть)
+        cursor, options = int(args[0]), dict(zip((a.upper() for a in args[1::2]), args[2::2]))
+        pattern = options.get(b'MATCH', b'*').decode('latin-1')
+        count = int(options.get(b'COUNT', 10))
+        keys = sorted(set(self.strings) | set(self.lists))
+        page = keys[cursor:cursor + count]
+        cursor = cursor + count if cursor + count < len(keys) else 0
+        found = [key for key in page if fnmatch.fnmatchcase(key.decode('latin-1'), pattern)]
+        return (b'*2\r\n' + self._bulk(str(cursor).encode()) + b'*%d\r\n' % len(found)
+                + b''.join(self._bulk(key) for key in found))
+
+    def _push(self, key: bytes, values: List[bytes]) -> int:
+        items = self.lists[key]
+        items.extend(values)
+        length = len(items)
+        # Отдать элементы ожидающим BLPOP по порядку
+        waiters = self._waiters.get(key)
+        while waiters and items:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result((key, items.popleft()))
+        if not items:
+            del self.lists[key]
+        return length
+
+    async def _blpop(self, keys: List[bytes], timeout: float) -> bytes:
+        for key in keys:
+            items = self.lists.get(key)
+            if items:
+                value = items.popleft()
+                if not items:
+                    del self.lists[key]
+                return b'*2\r\n' + self._bulk(key) + self._bulk(value)
+
+        waiter = asyncio.get_running_loop().create_future()
+        for key in keys:
+            self._waiters[key].append(waiter)
+        try:
+            key, value = await asyncio.wait_for(waiter, timeout=timeout or None)
+            return b'*2\r\n' + self._bulk(key) + self._bulk(value)
+        except asyncio.TimeoutError:
+            return b'*-1\r\n'
+        finally:
+            for key in keys:
+                waiters = self._waiters.get(key)
+                if waiters and waiter in waiters:
+                    waiters.remove(waiter)
+                if not waiters:
+                    self._waiters.pop(key, None)
+
+
+async def serve(host: str = '127.0.0.1', port: int = 6379):
+    broker = Broker()
+    server = await asyncio.start_server(broker.handle, host, port)
+    logger.info(f"✅ Брокер слушает {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Redis protocol stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    cli = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(serve(cli.host, cli.port))
+    except KeyboardInterrupt:
+        pass
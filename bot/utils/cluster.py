@@ -0,0 +1,259 @@
+"""Sharded deployment: update routing, central matchmaking and cross-shard events
+
+Layout (CLUSTER_SHARDS > 1):
+    router   - the only process polling Telegram; pushes every update to the
+               queue of the shard owning its user and runs the matchmaker
+    shard N  - runs all handlers for users with shard_of(user_id) == N
+
+Processes talk through lists on a Redis-protocol broker (Redis itself or
+the stand-in in bot.utils.broker).
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram.types.update import UpdateTypeLookupError
+
+from bot.utils.matchmaker import Matchmaker
+from bot.utils.resp import RespClient
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, Any]
+
+
+def shard_of(user_id: int, shards: int) -> int:
+    """Shard owning a user (Telegram IDs are spread evenly enough for modulo)."""
+    return user_id % shards
+
+
+class Cluster:
+    """One process's view of the cluster.
+
+    Messages are JSON objects pushed with RPUSH to a per-shard list and
+    consumed with BLPOP, so a shard receives them in the order they
+    were sent. Match requests go to the matchmaker list and are answered
+    with a match_result message on the requesting shard's list.
+    """
+
+    def __init__(self, url: str, shards: int, shard_id: Optional[int] = None,
+                 prefix: str = 'cluster', request_timeout: float = 10):
+        """Initialize cluster
+
+        Args:
+            url: Broker URL (redis://host:port/db)
+            shards: Number of shard processes
+            shard_id: This process's shard, None for the router
+            prefix: Prefix of every broker key
+            request_timeout: Seconds to wait for the matchmaker
+        """
+        self.shards = shards
+        self.shard_id = shard_id
+        self.prefix = prefix
+        self.request_timeout = request_timeout
+        self.client = RespClient(url)
+        # BLPOP блокирует соединение - у потребителя своё
+        self._consumer = RespClient(url)
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    @property
+    def matchmaker_queue(self) -> str:
+        return f'{self.prefix}:matchmaker'
+
+    def queue(self, shard: int) -> str:
+        return f'{self.prefix}:shard:{shard}'
+
+    def owner(self, user_id: int) -> int:
+        return shard_of(user_id, self.shards)
+
+    def is_local(self, user_id: int) -> bool:
+        return self.owner(user_id) == self.shard_id
+
+    async def send(self, shard: int, message: Message):
+        await self.client.call('RPUSH', self.queue(shard), json.dumps(message, ensure_ascii=False))
+
+    async def send_to_user(self, user_id: int, message: Message):
+        """Deliver a message to the shard owning user_id."""
+        await self.send(self.owner(user_id), message)
+
+    async def match(self, user_id: int, category: str, gender: Optional[str], interests: str,
+                    wanted_gender: Optional[str]) -> Tuple[Optional[int], Optional[str]]:
+        """Ask the matchmaker for a partner; enqueues the user if none is waiting."""
+        request_id = uuid.uuid4().hex
+        future = self._pending[request_id] = asyncio.get_running_loop().create_future()
+        try:
+            await self.client.call('RPUSH', self.matchmaker_queue, json.dumps({
+                'op': 'match',
+                'request_id': request_id,
+                'reply_shard': self.shard_id,
+                'user_id': user_id,
+                'category': category,
+                'gender': gender,
+                'interests': interests,
+                'wanted_gender': wanted_gender,
+            }))
+            result = await asyncio.wait_for(future, timeout=self.request_timeout)
+        finally:
+            self._pending.pop(request_id, None)
+        return result.get('partner_id'), result.get('chat_id')
+
+    async def cancel(self, user_id: int):
+        """Remove a user from the matchmaker queue."""
+        await self.client.call('RPUSH', self.matchmaker_queue, json.dumps({'op': 'cancel', 'user_id': user_id}))
+
+    async def release(self, user_id: int, partner_id: int):
+        """Tell the matchmaker a pair has ended."""
+        await self.client.call('RPUSH', self.matchmaker_queue, json.dumps({
+            'op': 'release', 'user_id': user_id, 'partner_id': partner_id,
+        }))
+
+    async def consume(self, queue: str, handler: Callable[[Message], Awaitable[Any]], concurrent: bool = True):
+        """Pop messages from a queue forever and pass them to handler.
+
+        match_result messages resolve pending match() calls instead.
+        With concurrent=True every message is handled in its own task
+        (like aiogram polling); otherwise messages are handled one by one.
+        """
+        while True:
+            try:
+                reply = await self._consumer.call('BLPOP', queue, 1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка чтения очереди {queue}: {e}")
+                await asyncio.sleep(1)
+                continue
+            if reply is None:
+                continue
+
+            message = json.loads(reply[1])
+            if message.get('type') == 'match_result':
+                future = self._pending.get(message['request_id'])
+                if future is not None and not future.done():
+                    future.set_result(message)
+                continue
+
+            if concurrent:
+                asyncio.create_task(self._handle(handler, message))
+            else:
+                await self._handle(handler, message)
+
+    @staticmethod
+    async def _handle(handler: Callable[[Message], Awaitable[Any]], message: Message):
+        try:
+            await handler(message)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки {message.get('type') or message.get('op')}: {e}")
+
+    async def close(self):
+        await self.client.close()
+        await self._consumer.close()
+
+
+class MatchmakerService:
+    """Central matchmaker run by the router process.
+
+    Requests are handled one at a time from a single queue, so no lock
+    is needed to keep two shards from pairing the same waiting user.
+    """
+
+    def __init__(self, cluster: Cluster):
+        self.cluster = cluster
+        self.matchmaker = Matchmaker()
+        # user_id -> (partner_id, chat_id) для текущих пар
+        self.pairs: Dict[int, Tuple[int, str]] = {}
+
+    async def run(self):
+        await self.cluster.consume(self.cluster.matchmaker_queue, self.handle, concurrent=False)
+
+    async def handle(self, request: Message):
+        op = request.get('op')
+        if op == 'cancel':
+            self.matchmaker.cancel(request['user_id'])
+        elif op == 'release':
+            for user_id in (request['user_id'], request['partner_id']):
+                self.matchmaker.cancel(user_id)
+                self.pairs.pop(user_id, None)
+        elif op == 'match':
+            await self._match(request)
+
+    async def _match(self, request: Message):
+        user_id = request['user_id']
+        category = request['category']
+        reply = {'type': 'match_result', 'request_id': request['request_id']}
+
+        if user_id in self.pairs:
+            # Повторный поиск уже сматченного пользователя - не создаём второй диалог
+            reply['partner_id'], reply['chat_id'] = self.pairs[user_id]
+            await self.cluster.send(request['reply_shard'], reply)
+            return
+
+        self.matchmaker.cancel(user_id)
+        partner_id = self.matchmaker.match(category, request['gender'], request['interests'], request['wanted_gender'])
+        if partner_id is None:
+            self.matchmaker.enqueue(user_id, category, request['gender'], request['interests'], request['wanted_gender'])
+            await self.cluster.send(request['reply_shard'], reply)
+            return
+
+        chat_id = str(uuid.uuid4())
+        self.pairs[user_id] = (partner_id, chat_id)
+        self.pairs[partner_id] = (user_id, chat_id)
+        reply['partner_id'], reply['chat_id'] = partner_id, chat_id
+
+        await self.cluster.send(request['reply_shard'], reply)
+        await self.cluster.send_to_user(partner_id, {
+            'type': 'matched',
+            'user_id': partner_id,
+            'partner_id': user_id,
+            'chat_id': chat_id,
+            'category': category,
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        return {'waiting': len(self.matchmaker), 'pairs': len(self.pairs) // 2}
+
+
+async def route_updates(bot, cluster: Cluster, timeout: int = 30):
+    """Router loop: long-poll Telegram and push each update to its owner shard.
+
+    Updates of one poll are pushed in one pipelined round trip; the
+    offset is only advanced after the push succeeds, so a broker outage
+    makes Telegram resend the updates instead of losing them. Updates of
+    a type this aiogram version does not know are logged and skipped.
+    """
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения обновлений: {e}")
+            await asyncio.sleep(1)
+            continue
+        if not updates:
+            continue
+
+        commands = []
+        for update in updates:
+            try:
+                event = update.event
+            except UpdateTypeLookupError:
+                # Тип обновления новее aiogram: шард его тоже не разберёт, а цикл роутера не должен падать
+                logger.warning(f"⚠️ Пропущено обновление {update.update_id} неизвестного типа")
+                continue
+            user = getattr(event, 'from_user', None)
+            shard = cluster.owner(user.id) if user else 0
+            message = {'type': 'update', 'update': update.model_dump(mode='json', exclude_unset=True)}
+            commands.append(('RPUSH', cluster.queue(shard), json.dumps(message, ensure_ascii=False)))
+        if commands:
+            try:
+                await cluster.client.execute(commands)
+            except Exception as e:
+                logger.error(f"❌ Ошибка передачи {len(commands)} обновлений шардам: {e}")
+                await asyncio.sleep(1)
+                continue
+        offset = updates[-1].update_id + 1
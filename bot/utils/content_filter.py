@@ -0,0 +1,230 @@
+"""Compiled forbidden-content matcher with normalization and hot reload
+
+Benchmark over a generated chat corpus (chars/sec and per-message latency):
+    python -m bot.utils.content_filter --messages 100000
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 🚫 Встроенный список; FORBIDDEN_KEYWORDS_PATH заменяет его файлом
+FORBIDDEN_KEYWORDS = {
+    'csam': ['child sex', 'minor porn', 'cp', 'children porn', 'kid porn', 'underage', 'pedophilia'],
+    'drugs': ['cocaine', 'heroin', 'meth', 'fentanyl', 'mdma', 'lsd', 'mushrooms', 'weed dealer', 'sell drugs'],
+    'violence': ['kill yourself', 'kys', 'commit suicide', 'bomb', 'attack plan', 'shoot up'],
+    'scam': ['money transfer', 'send money', 'western union', 'gift card', 'paypal verify', 'bitcoin transfer'],
+}
+
+# Похожие символы -> латиница (замена 1:1, смещения в тексте сохраняются)
+HOMOGLYPHS = str.maketrans({
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o',
+    'р': 'p', 'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'і': 'i', 'ј': 'j', 'ѕ': 's',
+    'А': 'a', 'В': 'b', 'Е': 'e', 'Ё': 'e', 'К': 'k', 'М': 'm', 'Н': 'h', 'О': 'o',
+    'Р': 'p', 'С': 'c', 'Т': 't', 'У': 'y', 'Х': 'x', 'І': 'i', 'Ј': 'j', 'Ѕ': 's',
+    '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '@': 'a', '$': 's',
+})
+
+# Заменяем только в словах, где уже есть латиница: обычное русское «ср» (среда) - не «cp»
+_MIXED_TOKEN = re.compile(r'\S*[a-zA-Z]\S*')
+_LATIN = re.compile(r'[a-zA-Z]')
+
+# Разделители внутри слова ("k.y.s", "c-o-c-a-i-n-e") и между словами
+INNER_SEPARATOR = r'[^\w\s]*'
+WORD_SEPARATOR = r'[\W_]+'
+
+
+def _fold(match: re.Match) -> str:
+    return match.group().translate(HOMOGLYPHS)
+
+
+def _lower(text: str) -> str:
+    """Lowercase without changing the length ('İ'.lower() is two code points)."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def normalize(text: str) -> str:
+    """Map homoglyphs and leetspeak to plain latin letters in mixed-script words.
+
+    Words without latin letters are only lowercased, so ordinary Russian
+    text never turns into latin keywords. Replacements are 1:1, offsets
+    into the original text stay valid.
+    """
+    if not _LATIN.search(text):
+        return _lower(text)
+    if text.isascii():
+        # Кириллицы нет - заменяются только цифры и символы leetspeak
+        return text.translate(HOMOGLYPHS).lower()
+    return _lower(_MIXED_TOKEN.sub(_fold, text))
+
+
+class ContentFilter:
+    """Single precompiled regex over all forbidden keywords.
+
+    Each category is a named group, so one search returns the category,
+    offset and matched fragment. Keywords match on word boundaries and
+    tolerate punctuation inserted between letters. When a JSON file
+    path is given, the keyword list is reloaded whenever the file
+    changes, checked at most once per reload_interval seconds.
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]], path: Optional[str] = None,
+                 reload_interval: float = 5.0):
+        """Initialize content filter
+
+        Args:
+            keywords: Default {category: [keyword, ...]} mapping
+            path: Optional JSON file with the same structure
+            reload_interval: Minimum seconds between file checks
+        """
+        self.path = path
+        self.reload_interval = reload_interval
+        self._mtime = None
+        self._checked_at = 0.0
+        self._group_categories: Dict[str, str] = {}
+        self._pattern = None
+        self.load(keywords)
+        self.maybe_reload(force=True)
+
+    @staticmethod
+    def _keyword_pattern(keyword: str) -> str:
+        words = keyword.lower().split()
+        return WORD_SEPARATOR.join(
+            INNER_SEPARATOR.join(re.escape(char) for char in word) for word in words
+        )
+
+    @staticmethod
+    def _variants(keyword: str) -> set:
+        """Keyword as written and as it looks inside a folded mixed-script word."""
+        return {keyword.lower(), keyword.translate(HOMOGLYPHS).lower()}
+
+    def load(self, keywords: Dict[str, List[str]]):
+        """Compile a new keyword mapping."""
+        groups = []
+        group_categories = {}
+        first_chars = set()
+        for index, (category, words) in enumerate(keywords.items()):
+            words = sorted({v for w in words if w.strip() for v in self._variants(w)}, key=len, reverse=True)
+            if not words:
+                continue
+            first_chars.update(word.strip()[0] for word in words)
+            group = f'c{index}'
+            group_categories[group] = category
+            alternatives = '|'.join(self._keyword_pattern(w) for w in words)
+            groups.append(f'(?P<{group}>{alternatives})')
+
+        if groups:
+            # Опережающая проверка первой буквы: re не перебирает все варианты в каждой позиции
+            first = '[' + ''.join(re.escape(char) for char in sorted(first_chars)) + ']'
+            pattern = re.compile(r'(?<!\w)(?=' + first + r')(?:' + '|'.join(groups) + r')(?!\w)')
+        else:
+            pattern = None
+        self._pattern = pattern
+        self._group_categories = group_categories
+        self.keywords = keywords
+
+    def maybe_reload(self, force: bool = False):
+        """Reload keywords from file if it changed."""
+        if not self.path:
+            return
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                keywords = json.load(f)
+            self.load(keywords)
+            self._mtime = mtime
+            logger.info(f"✅ Список запрещённых слов загружен из {self.path}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки запрещённых слов из {self.path}: {e}")
+
+    def find(self, text: str) -> Optional[Tuple[str, int, str]]:
+        """Return (category, offset, fragment) of the first forbidden match."""
+        self.maybe_reload()
+        if self._pattern is None or not text:
+            return None
+        match = self._pattern.search(normalize(text))
+        if match is None:
+            return None
+        category = self._group_categories[match.lastgroup]
+        return category, match.start(), text[match.start():match.end()]
+
+
+def benchmark(messages: int, extra_keywords: int = 0, seed: int = 1):
+    """Compare the compiled matcher with the old per-keyword substring loop."""
+    import random
+    import string
+
+    rng = random.Random(seed)
+    keywords = {category: list(words) for category, words in FORBIDDEN_KEYWORDS.items()}
+    # Список из файла бывает намного длиннее встроенного: добавляем случайные слова
+    keywords['extra'] = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 10)))
+                         for _ in range(extra_keywords)]
+    phrases = [
+        'привет', 'как дела?', 'откуда ты', 'мне 19, а тебе', 'давай встретимся в ср',
+        'скинь фото', 'что слушаешь?', 'хаха да', 'я из Москвы', 'сорри, отошёл',
+        'hi there', 'where are you from', 'lol same', 'what music do you like', 'brb',
+        'работаю в IT, пишу на python', 'ну такое', 'спокойной ночи 😴', 'ok', 'my cpu is too hot',
+    ]
+    flagged = ['send money to my card', 'кто хочет c0caine', 'k.y.s', 'бомба - это bomb']
+    corpus = []
+    for _ in range(messages):
+        # ~1% сообщений с запрещёнными словами, длина - от одной фразы до небольшого абзаца
+        parts = rng.choices(phrases, k=rng.choice((1, 1, 1, 2, 3, 6)))
+        if rng.random() < 0.01:
+            parts.append(rng.choice(flagged))
+        corpus.append(' '.join(parts))
+    chars = sum(len(text) for text in corpus)
+
+    def before(text: str):
+        # Прежний check_forbidden_content: lower() и `in` по каждому слову
+        text_lower = text.lower()
+        for category, words in keywords.items():
+            for keyword in words:
+                if keyword in text_lower:
+                    return category
+        return None
+
+    content_filter = ContentFilter(keywords)
+    print(f"{messages} messages, {chars} chars, {sum(map(len, keywords.values()))} keywords")
+    for label, check in (('substring loop (before)', before), ('compiled regex', content_filter.find)):
+        timings = []
+        hits = 0
+        clock = time.perf_counter_ns
+        for text in corpus:
+            started = clock()
+            found = check(text)
+            timings.append(clock() - started)
+            hits += found is not None
+        total = sum(timings) / 1e9
+        timings.sort()
+        print(f"{label:<24} {chars / total / 1e6:>6.1f} M chars/s | mean {total / messages * 1e6:>5.2f} us | "
+              f"p99 {timings[int(messages * 0.99)] / 1000:>5.2f} us | flagged {hits}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Content filter benchmark')
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--extra-keywords', type=int, default=0)
+    cli = parser.parse_args()
+    benchmark(cli.messages, cli.extra_keywords)
@@ -0,0 +1,127 @@
+"""Bounded worker pool that keeps jobs with the same key in order"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class OrderedExecutor:
+    """Runs jobs on a fixed number of workers, serially per key.
+
+    Every key (a user ID) has its own FIFO. A key is handed to a worker
+    only while no other worker runs it, so jobs of one user execute in
+    submission order while different users run in parallel. After each
+    job the key goes to the back of the ready queue, so one busy user
+    cannot monopolise a worker. The total backlog is bounded, and so is
+    the backlog of a single key: jobs beyond max_per_key are dropped.
+    """
+
+    def __init__(self, workers: int = 64, max_queue: int = 10000, max_per_key: int = 0):
+        """Initialize executor
+
+        Args:
+            workers: Number of concurrent worker tasks
+            max_queue: Jobs allowed to wait across all keys
+            max_per_key: Jobs allowed to wait for one key (0 - no limit)
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_per_key = max_per_key
+        self._queues: Dict[Hashable, Deque] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.pending = 0
+
+        # Метрики
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self):
+        """Start worker tasks."""
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10):
+        """Give queued jobs up to timeout seconds to finish, then stop workers."""
+        if not self._tasks:
+            return
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, key: Hashable, job: Job) -> bool:
+        """Queue a job; returns False if the backlog is full.
+
+        A job over the per-key limit is dropped but still reported as
+        accepted: redelivering a flood would not help.
+        """
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            return False
+        queue = self._queues.get(key)
+        if queue is not None and self.max_per_key and len(queue) >= self.max_per_key:
+            self.dropped += 1
+            return True
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._ready.put_nowait(key)
+        queue.append((job, time.monotonic()))
+        self.pending += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._queues[key]
+            job, queued_at = queue.popleft()
+            waited = time.monotonic() - queued_at
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            try:
+                await job()
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Ошибка обработки обновления {key}: {e}")
+            finally:
+                self.pending -= 1
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._queues[key]
+
+    @property
+    def saturation(self) -> float:
+        return self.pending / self.max_queue if self.max_queue else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return executor counters."""
+        done = self.processed + self.failed
+        return {
+            'pending': self.pending,
+            'active_keys': len(self._queues),
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'dropped': self.dropped,
+            'avg_wait_ms': (self.wait_total / done * 1000) if done else 0.0,
+            'max_wait_ms': self.wait_max * 1000,
+        }
@@ -0,0 +1,214 @@
+"""Local load generator for webhook mode
+
+Starts a stand-in Bot API server, registers and pairs synthetic users by
+POSTing updates to the bot's webhook, then sends chat messages and
+reports ingest throughput and end-to-end relay latency (webhook POST ->
+copyMessage reaching the Bot API).
+
+Start the generator first (it serves the Bot API the bot registers its
+webhook with), then the bot; the generator waits for /readyz:
+    python -m bot.utils.loadgen --secret secret --users 200 --messages 20
+    WEBHOOK_URL=http://127.0.0.1:8080 WEBHOOK_SECRET=secret
+    TELEGRAM_API_URL=http://127.0.0.1:8081 SEND_PER_CHAT_RATE=100 python -m bot
+"""
+
+import argparse
+import asyncio
+import itertools
+import time
+from typing import Dict, List, Tuple
+from urllib.parse import urljoin
+
+import aiohttp
+from aiohttp import web
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+FIRST_USER_ID = 9_000_000_000
+
+
+def percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class FakeBotAPI:
+    """Answers every Bot API method with a plausible result and records relays."""
+
+    def __init__(self):
+        self.message_ids = itertools.count(1)
+        self.calls: Dict[str, int] = {}
+        # (from_chat_id, message_id) -> время получения copyMessage
+        self.relayed: Dict[Tuple[int, int], float] = {}
+
+    def _message(self, chat_id) -> dict:
+        return {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id or 0), 'type': 'private'},
+            'text': '',
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = dict(await request.post()) if request.can_read_body else {}
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'loadgen', 'username': 'loadgen_bot'}
+        elif method == 'copyMessage':
+            self.relayed[(int(params['from_chat_id']), int(params['message_id']))] = time.perf_counter()
+            result = {'message_id': next(self.message_ids)}
+        elif method == 'copyMessages':
+            result = [{'message_id': next(self.message_ids)}]
+        elif method in ('sendMessage', 'editMessageText'):
+            result = self._message(params.get('chat_id'))
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+
+class LoadGenerator:
+    def __init__(self, webhook_url: str, secret: str, users: int, concurrency: int):
+        self.webhook_url = webhook_url
+        self.secret = secret
+        self.user_ids = [FIRST_USER_ID + i for i in range(users)]
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.post_latencies: List[float] = []
+        self.errors = 0
+        # (from_chat_id, message_id) -> время отправки
+        self.sent: Dict[Tuple[int, int], float] = {}
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f'load{user_id}'}
+
+    def message_update(self, user_id: int, text: str) -> Tuple[dict, int]:
+        message_id = next(self.message_ids)
+        return {
+            'update_id': next(self.update_ids),
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': self._user(user_id),
+                'text': text,
+            },
+        }, message_id
+
+    def callback_update(self, user_id: int, data: str) -> dict:
+        update_id = next(self.update_ids)
+        return {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': self._user(user_id),
+                'chat_instance': str(user_id),
+                'data': data,
+                'message': {
+                    'message_id': next(self.message_ids),
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'text': '',
+                },
+            },
+        }
+
+    async def post(self, session: aiohttp.ClientSession, update: dict):
+        async with self.semaphore:
+            started = time.perf_counter()
+            try:
+                async with session.post(self.webhook_url, json=update, headers={SECRET_HEADER: self.secret}) as response:
+                    if response.status != 200:
+                        self.errors += 1
+            except aiohttp.ClientError:
+                self.errors += 1
+            self.post_latencies.append(time.perf_counter() - started)
+
+    async def wait_ready(self, session: aiohttp.ClientSession, timeout: float):
+        deadline = time.monotonic() + timeout
+        url = urljoin(self.webhook_url, '/readyz')
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+        raise TimeoutError(f'{url} is not ready after {timeout}s')
+
+    async def setup(self, session: aiohttp.ClientSession, settle: float):
+        """Register every user and put them into random search so they pair up."""
+        await asyncio.gather(*(self.post(session, self.message_update(u, '/start')[0]) for u in self.user_ids))
+        await asyncio.sleep(settle)
+        for user_id in self.user_ids:
+            await self.post(session, self.callback_update(user_id, 'search_random'))
+        await asyncio.sleep(settle)
+        self.post_latencies.clear()
+
+    async def run(self, session: aiohttp.ClientSession, messages: int, interval: float) -> float:
+        """Every user sends `messages` texts, one per interval; returns elapsed seconds."""
+        async def user_loop(user_id: int):
+            for i in range(messages):
+                update, message_id = self.message_update(user_id, f'load message {i}')
+                self.sent[(user_id, message_id)] = time.perf_counter()
+                await self.post(session, update)
+                await asyncio.sleep(interval)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user_loop(u) for u in self.user_ids))
+        return time.perf_counter() - started
+
+
+async def main(cli):
+    api = FakeBotAPI()
+    runner = web.AppRunner(api.create_app())
+    await runner.setup()
+    await web.TCPSite(runner, cli.api_host, cli.api_port).start()
+    print(f"Bot API stand-in: http://{cli.api_host}:{cli.api_port}")
+
+    generator = LoadGenerator(cli.webhook, cli.secret, cli.users, cli.concurrency)
+    async with aiohttp.ClientSession() as session:
+        print(f"Waiting for the bot at {cli.webhook} ...")
+        await generator.wait_ready(session, cli.ready_timeout)
+        await generator.setup(session, cli.settle)
+        elapsed = await generator.run(session, cli.messages, cli.interval)
+        await asyncio.sleep(cli.drain)
+
+    relay = [api.relayed[key] - sent_at for key, sent_at in generator.sent.items() if key in api.relayed]
+    total = len(generator.sent)
+    print(f"Updates sent:        {total} in {elapsed:.2f}s ({total / elapsed:.0f} updates/s)")
+    print(f"Webhook errors:      {generator.errors}")
+    print(f"POST latency ms:     p50={percentile(generator.post_latencies, 0.5) * 1000:.1f} "
+          f"p95={percentile(generator.post_latencies, 0.95) * 1000:.1f} "
+          f"p99={percentile(generator.post_latencies, 0.99) * 1000:.1f}")
+    print(f"Relayed:             {len(relay)}/{total}")
+    print(f"Relay latency ms:    p50={percentile(relay, 0.5) * 1000:.1f} "
+          f"p95={percentile(relay, 0.95) * 1000:.1f} p99={percentile(relay, 0.99) * 1000:.1f}")
+    print(f"Bot API calls:       {api.calls}")
+    await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Webhook load generator')
+    parser.add_argument('--webhook', default='http://127.0.0.1:8080/webhook')
+    parser.add_argument('--secret', required=True, help='WEBHOOK_SECRET of the bot')
+    parser.add_argument('--api-host', default='127.0.0.1')
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--users', type=int, default=100, help='Synthetic users (paired with each other)')
+    parser.add_argument('--messages', type=int, default=10, help='Messages per user')
+    parser.add_argument('--interval', type=float, default=0.1, help='Pause between messages of one user')
+    parser.add_argument('--concurrency', type=int, default=100, help='Parallel POST requests')
+    parser.add_argument('--settle', type=float, default=2.0, help='Seconds to wait after each setup step')
+    parser.add_argument('--ready-timeout', type=float, default=120, help='Seconds to wait for the bot to start')
+    parser.add_argument('--drain', type=float, default=3.0, help='Seconds to wait for the last relays')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,250 @@
+"""Non-blocking logging: queue handoff, rotating JSON files and per-call-site sampling
+
+Benchmark of the logging cost of one relayed message on the event loop:
+    python -m bot.utils.logs --messages 100000
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Стандартные атрибуты LogRecord - всё остальное пришло через extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'suppressed'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed with extra= are included."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'site': f'{record.module}:{record.lineno}',
+        }
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain format that also shows how many records of the call site were sampled out."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f'{text} (+{suppressed} подавлено)' if suppressed else text
+
+
+class SamplingFilter(logging.Filter):
+    """Passes at most `rate` records per second from each call site.
+
+    Only records below min_level (INFO and DEBUG by default) are sampled;
+    warnings and errors always pass. The next record that passes from a
+    throttled call site carries the number of dropped ones in
+    record.suppressed.
+    """
+
+    def __init__(self, rate: float = 20, min_level: int = logging.WARNING):
+        """Initialize sampling filter
+
+        Args:
+            rate: Records per second allowed per call site (0 - no limit)
+            min_level: Records at this level or above are never dropped
+        """
+        super().__init__()
+        self.rate = rate
+        self.min_level = min_level
+        # (файл, строка) -> [начало окна, записей в окне, пропущено в окне]
+        self._sites: Dict[Tuple[str, int], List[float]] = {}
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.rate or record.levelno >= self.min_level:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        state = self._sites.get(site)
+        if state is None or now - state[0] >= 1.0:
+            pending = state[2] if state else 0
+            self._sites[site] = [now, 1, 0]
+            if pending:
+                record.suppressed = int(pending)
+            return True
+        if state[1] < self.rate:
+            state[1] += 1
+            return True
+        state[2] += 1
+        self.dropped += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller and defers formatting.
+
+    The stock prepare() formats the message in the calling thread so the
+    record can be pickled; the queue here is in-process, so msg and args
+    are handed over as is and formatted by the listener thread. When the
+    queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Трассировку нужно снять сейчас - потом её объекты могут измениться
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Очередь ограничена: ждём места, а не теряем сигнал остановки
+        self.queue.put(self._sentinel)
+
+
+class LoggingPipeline:
+    """Root logger -> sampling -> bounded queue -> listener thread -> stdout + rotating file."""
+
+    def __init__(self, level: str = 'INFO', path: Optional[str] = 'bot.log', max_bytes: int = 50 * 1024 * 1024,
+                 backup_count: int = 5, json_file: bool = True, sample_rate: float = 20,
+                 max_queue: int = 10000, stdout: bool = True):
+        """Initialize logging pipeline
+
+        Args:
+            level: Root log level
+            path: Log file (None - no file)
+            max_bytes: Size at which the file is rotated
+            backup_count: Rotated files kept
+            json_file: Write the file as JSON lines instead of text
+            sample_rate: INFO/DEBUG records per second allowed per call site (0 - no limit)
+            max_queue: Records waiting for the listener before new ones are dropped
+            stdout: Also print to stdout
+        """
+        handlers: List[logging.Handler] = []
+        if stdout:
+            console = logging.StreamHandler(sys.stdout)
+            console.setFormatter(TextFormatter(TEXT_FORMAT))
+            handlers.append(console)
+        if path:
+            file_handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+            )
+            file_handler.setFormatter(JsonFormatter() if json_file else TextFormatter(TEXT_FORMAT))
+            handlers.append(file_handler)
+
+        self.level = level
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.sampler = SamplingFilter(sample_rate)
+        self.handler.addFilter(self.sampler)
+        self.listener = _Listener(self.queue, *handlers, respect_handler_level=True)
+        self._lock = threading.Lock()
+        self._started = False
+
+    def install(self):
+        """Replace root handlers with the queue handler and start the listener thread."""
+        with self._lock:
+            if self._started:
+                return
+            root = logging.getLogger()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            root.addHandler(self.handler)
+            root.setLevel(self.level)
+            self.listener.start()
+            self._started = True
+
+    def stop(self):
+        """Flush queued records and stop the listener thread."""
+        with self._lock:
+            if not self._started:
+                return
+            self.listener.stop()
+            logging.getLogger().removeHandler(self.handler)
+            self._started = False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queue_depth': self.queue.qsize(),
+            'sampled_out': self.sampler.dropped,
+            'queue_dropped': self.handler.dropped,
+        }
+
+
+def benchmark(messages: int, directory: str):
+    """Time the log call of a relayed message as the relay handler makes it."""
+    import os
+    import tempfile
+
+    directory = directory or tempfile.mkdtemp(prefix='logbench')
+    os.makedirs(directory, exist_ok=True)
+    logger = logging.getLogger('bench.relay')
+    user_id, partner_id, content_type = 123456789, 987654321, 'text'
+
+    def run(label: str, log):
+        # Важно не только среднее: синхронная запись в файл даёт редкие долгие паузы цикла
+        timings = []
+        clock = time.perf_counter_ns
+        for _ in range(messages):
+            started = clock()
+            log()
+            timings.append(clock() - started)
+        timings.sort()
+        print(f"{label:<40} mean {sum(timings) / messages / 1000:>7.2f} us | "
+              f"p99 {timings[int(messages * 0.99)] / 1000:>7.2f} us | max {timings[-1] / 1000:>9.1f} us")
+
+    # Прежняя схема: синхронная запись в файл и f-строка
+    root = logging.getLogger()
+    sync_handler = logging.FileHandler(os.path.join(directory, 'sync.log'), encoding='utf-8')
+    sync_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    root.handlers = [sync_handler]
+    root.setLevel(logging.INFO)
+    run('FileHandler, f-string (before)', lambda: logger.info(f"✅ {content_type}: {user_id} -> {partner_id}"))
+    root.removeHandler(sync_handler)
+    sync_handler.close()
+
+    for label, rate in (('queue + JSON file, no sampling', 0), ('queue + JSON file, 20/s per call site', 20)):
+        pipeline = LoggingPipeline(path=os.path.join(directory, f'queue{rate}.log'), sample_rate=rate,
+                                   max_queue=messages + 1, stdout=False)
+        pipeline.install()
+        run(label, lambda: logger.info("✅ %s: %s -> %s", content_type, user_id, partner_id))
+        pipeline.stop()
+        print(f"{'':<42} {pipeline.stats()}")
+
+    print(f"Log files in {directory}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Logging overhead benchmark')
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--dir', default='')
+    cli = parser.parse_args()
+    benchmark(cli.messages, cli.dir)
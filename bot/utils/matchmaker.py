@@ -0,0 +1,303 @@
+"""In-memory matchmaking index with O(1) enqueue, match and cancel
+
+Microbenchmark against the old list-based queues with 100k waiting users:
+    python -m bot.utils.matchmaker --waiting 100000
+
+Simulation of match rate and time-to-match with a skewed gender mix:
+    python -m bot.utils.matchmaker --simulate --arrivals 20000 --male-share 0.8
+"""
+
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+# (category, gender, interests, wanted_gender)
+BucketKey = Tuple[str, Optional[str], str, Optional[str]]
+
+
+class Matchmaker:
+    """FIFO waiting queues indexed by search category and profile.
+
+    Waiting users are bucketed by (category, gender, interests,
+    wanted_gender) using the profile attributes cached when they
+    enqueued. A search only inspects the head of each compatible
+    bucket, so filtered searches find a partner further down the line
+    without popping and requeueing incompatible candidates.
+
+    Each bucket is an OrderedDict used as an ordered set and a
+    user -> bucket index lets a user be removed without scanning.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[BucketKey, OrderedDict] = {}
+        self._category_keys: Dict[str, Set[BucketKey]] = {}
+        self._category_sizes: Dict[str, int] = {}
+        self._user_bucket: Dict[int, BucketKey] = {}
+        self._seq = 0
+
+    def enqueue(self, user_id: int, category: str, gender: Optional[str] = None,
+                interests: Optional[str] = None, wanted_gender: Optional[str] = None):
+        """Put user at the tail of their bucket (moving them if already waiting).
+
+        Args:
+            user_id: Waiting user
+            category: Search category ('random', 'gender_filter', ...)
+            gender: User's own gender
+            interests: User's interests ('' or None for no preference)
+            wanted_gender: Gender the user is searching for (None for any)
+        """
+        self.cancel(user_id)
+        key = (category, gender, interests or '', wanted_gender)
+        queue = self._buckets.get(key)
+        if queue is None:
+            queue = self._buckets[key] = OrderedDict()
+            self._category_keys.setdefault(category, set()).add(key)
+        self._seq += 1
+        queue[user_id] = self._seq
+        self._user_bucket[user_id] = key
+        self._category_sizes[category] = self._category_sizes.get(category, 0) + 1
+
+    def match(self, category: str, gender: Optional[str] = None,
+              interests: Optional[str] = None, wanted_gender: Optional[str] = None) -> Optional[int]:
+        """Pop the longest-waiting user compatible with the searcher.
+
+        A waiting user is compatible when their gender satisfies the
+        searcher's filter, the searcher's gender satisfies theirs, and
+        their interests are equal or either side has none.
+
+        Returns:
+            Partner ID or None if nobody compatible is waiting
+        """
+        interests = interests or ''
+        best_key = None
+        best_seq = None
+        for key in self._category_keys.get(category, ()):
+            _, partner_gender, partner_interests, partner_wanted = key
+            if wanted_gender and partner_gender != wanted_gender:
+                continue
+            if partner_wanted and partner_wanted != gender:
+                continue
+            if interests and partner_interests and partner_interests != interests:
+                continue
+            seq = next(iter(self._buckets[key].values()))
+            if best_seq is None or seq < best_seq:
+                best_key, best_seq = key, seq
+
+        if best_key is None:
+            return None
+        user_id, _ = self._buckets[best_key].popitem(last=False)
+        self._forget(user_id, best_key)
+        return user_id
+
+    def cancel(self, user_id: int) -> bool:
+        """Remove user from their queue. Returns True if they were waiting."""
+        key = self._user_bucket.get(user_id)
+        if key is None:
+            return False
+        del self._buckets[key][user_id]
+        self._forget(user_id, key)
+        return True
+
+    def _forget(self, user_id: int, key: BucketKey):
+        del self._user_bucket[user_id]
+        category = key[0]
+        self._category_sizes[category] -= 1
+        if not self._buckets[key]:
+            del self._buckets[key]
+            self._category_keys[category].discard(key)
+
+    def category_of(self, user_id: int) -> Optional[str]:
+        """Category the user is waiting in, if any."""
+        key = self._user_bucket.get(user_id)
+        return key[0] if key else None
+
+    def size(self, category: str) -> int:
+        return self._category_sizes.get(category, 0)
+
+    def sizes(self) -> Dict[str, int]:
+        """Number of waiting users per category."""
+        return dict(self._category_sizes)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._user_bucket
+
+    def __len__(self) -> int:
+        return len(self._user_bucket)
+
+
+CATEGORIES = ('random', 'gender_filter', 'interests')
+
+
+def benchmark(waiting: int, ops: int, seed: int = 3):
+    """Time search, cancel and match with `waiting` users queued: lists vs Matchmaker."""
+    import random
+
+    rng = random.Random(seed)
+    queued = list(range(waiting))
+    categories = {user_id: rng.choice(CATEGORIES) for user_id in queued}
+    # Новые пользователи (не в очереди) и случайные ожидающие для отмены
+    newcomers = list(range(waiting, waiting + ops))
+    leaving = rng.sample(queued, ops)
+
+    # Было: список на категорию, поиск своего ID по всем спискам, pop(0) и remove
+    lists = defaultdict(list)
+    for user_id in queued:
+        lists[categories[user_id]].append(user_id)
+
+    def list_search(user_id: int, category: str):
+        for cat in list(lists.keys()):
+            if user_id in lists[cat]:
+                lists[cat].remove(user_id)
+        lists[category].append(user_id)
+
+    def list_cancel(user_id: int):
+        for cat in list(lists.keys()):
+            if user_id in lists[cat]:
+                lists[cat].remove(user_id)
+
+    def list_match(category: str):
+        return lists[category].pop(0) if lists[category] else None
+
+    matchmaker = Matchmaker()
+    for user_id in queued:
+        matchmaker.enqueue(user_id, categories[user_id])
+
+    def timed(fn, args) -> float:
+        started = time.perf_counter()
+        for arg in args:
+            fn(*arg)
+        return (time.perf_counter() - started) / len(args) * 1e6
+
+    search_args = [(user_id, rng.choice(CATEGORIES)) for user_id in newcomers]
+    cancel_args = [(user_id,) for user_id in leaving]
+    match_args = [(rng.choice(CATEGORIES),) for _ in range(ops)]
+    results = {
+        'lists': (timed(list_search, search_args), timed(list_cancel, cancel_args), timed(list_match, match_args)),
+        'Matchmaker': (
+            timed(lambda user_id, category: (matchmaker.cancel(user_id), matchmaker.enqueue(user_id, category)),
+                  search_args),
+            timed(matchmaker.cancel, cancel_args),
+            timed(matchmaker.match, match_args),
+        ),
+    }
+
+    print(f"{waiting} waiting users, {ops} operations of each kind (us/op)")
+    print(f"{'engine':<12} {'search':>10} {'cancel':>10} {'match':>10}")
+    for name, (search, cancel, match) in results.items():
+        print(f"{name:<12} {search:>10.2f} {cancel:>10.2f} {match:>10.2f}")
+
+
+def simulate(arrivals: int, rate: float, patience: float, male_share: float, premium_share: float,
+             seed: int = 4):
+    """Replay the same arrivals against head-of-queue matching and the index.
+
+    Users arrive `rate` per second and search once; premium users search
+    in 'gender_filter' for the other gender, the rest in 'random'.
+    Waiting users give up after `patience` seconds.
+    """
+    import random
+    from collections import deque
+
+    male, female = '👨 Парень', '👩 Девушка'
+    rng = random.Random(seed)
+    users = []
+    for user_id in range(arrivals):
+        gender = male if rng.random() < male_share else female
+        premium = rng.random() < premium_share
+        users.append({
+            'id': user_id,
+            'at': user_id / rate,
+            'gender': gender,
+            'interests': rng.choice(['', '', 'музыка', 'игры', 'кино']),
+            'category': 'gender_filter' if premium else 'random',
+            'wanted': (female if gender == male else male) if premium else None,
+        })
+
+    def head_of_queue():
+        # Было: снять голову очереди; не подошла по полу или интересам - вернуть обоих в хвост
+        queues = defaultdict(list)
+        lookups = 0
+
+        def search(user):
+            nonlocal lookups
+            queue = queues[user['category']]
+            lookups += 1
+            if queue:
+                partner = queue.pop(0)
+                lookups += 1
+                if ((user['wanted'] and partner['gender'] != user['wanted'])
+                        or (user['interests'] and partner['interests'] and user['interests'] != partner['interests'])):
+                    queue.extend((partner, user))
+                    return None
+                return partner
+            queue.append(user)
+            return None
+
+        def give_up(user):
+            queue = queues[user['category']]
+            if user in queue:
+                queue.remove(user)
+
+        return search, give_up, lambda: lookups
+
+    def indexed():
+        matchmaker = Matchmaker()
+        by_id = {user['id']: user for user in users}
+        lookups = 0
+
+        def search(user):
+            nonlocal lookups
+            # Профиль ожидающего закеширован в индексе - читаем только свой
+            lookups += 1
+            partner_id = matchmaker.match(user['category'], user['gender'], user['interests'], user['wanted'])
+            if partner_id is None:
+                matchmaker.enqueue(user['id'], user['category'], user['gender'], user['interests'], user['wanted'])
+                return None
+            return by_id[partner_id]
+
+        return search, lambda user: matchmaker.cancel(user['id']), lambda: lookups
+
+    print(f"{arrivals} arrivals at {rate:g}/s, {male_share:.0%} men, {premium_share:.0%} premium "
+          f"(gender filter), patience {patience:g} s")
+    print(f"{'engine':<15} {'matched':>8} {'wait p50 s':>11} {'wait p90 s':>11} {'mean s':>8} {'lookups/search':>15}")
+    for name, engine in (('head of queue', head_of_queue), ('index', indexed)):
+        search, give_up, lookups = engine()
+        waiting = deque()
+        waits = []
+        matched = set()
+        started = time.perf_counter()
+        for user in users:
+            while waiting and waiting[0]['at'] + patience < user['at']:
+                expired = waiting.popleft()
+                if expired['id'] not in matched:
+                    give_up(expired)
+            partner = search(user)
+            if partner is None:
+                waiting.append(user)
+                continue
+            matched.update((user['id'], partner['id']))
+            waits.extend((user['at'] - partner['at'], 0.0))
+        elapsed = time.perf_counter() - started
+        waits.sort()
+        print(f"{name:<15} {len(matched) / arrivals:>8.1%} {waits[len(waits) // 2]:>11.2f} "
+              f"{waits[int(len(waits) * 0.9)]:>11.2f} {sum(waits) / len(waits):>8.2f} "
+              f"{lookups() / arrivals:>15.2f}  ({elapsed * 1000:.0f} ms)")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Matchmaker microbenchmark')
+    parser.add_argument('--waiting', type=int, default=100000)
+    parser.add_argument('--ops', type=int, default=2000)
+    parser.add_argument('--simulate', action='store_true', help='Match rate simulation instead')
+    parser.add_argument('--arrivals', type=int, default=20000)
+    parser.add_argument('--rate', type=float, default=5)
+    parser.add_argument('--patience', type=float, default=60)
+    parser.add_argument('--male-share', type=float, default=0.8)
+    parser.add_argument('--premium-share', type=float, default=0.3)
+    cli = parser.parse_args()
+    if cli.simulate:
+        simulate(cli.arrivals, cli.rate, cli.patience, cli.male_share, cli.premium_share)
+    else:
+        benchmark(cli.waiting, cli.ops)
@@ -0,0 +1,222 @@
+"""In-process metrics rendered in the Prometheus text exposition format"""
+
+import functools
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин (сек): от быстрых обращений к кешу до медленных вызовов Bot API
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f'{self.name}{_labels(self.labels, values)} {_number(value)}'
+            for values, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Metric):
+    """Gauge whose values are read from `collect` at scrape time."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], Any], labels: Sequence[str] = ()):
+        """Initialize gauge
+
+        Args:
+            name: Metric name
+            documentation: HELP text
+            collect: Returns a number, or {label values tuple: number} when labels are set
+            labels: Label names
+        """
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        try:
+            values = self.collect()
+        except Exception as e:
+            logger.error(f"❌ Ошибка метрики {self.name}: {e}")
+            return []
+        if not self.labels:
+            values = {(): values}
+        return self.header() + [
+            f'{self.name}{_labels(self.labels, key)} {_number(value)}'
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(Metric):
+    """Fixed-bucket histogram; observe() is a bisect and three increments."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # значения меток -> [счётчики корзин (последняя - +Inf), сумма, количество]
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for values, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, collect: Callable[[], Any], labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, collect, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def timed(histogram: Histogram, label: str):
+    """Decorator recording the duration of a coroutine function under `label`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, label)
+        return wrapper
+    return decorator
+
+
+def instrument(obj: Any, histogram: Histogram, exclude: Iterable[str] = ()) -> List[str]:
+    """Time every public coroutine method of obj (per instance, labelled by method name).
+
+    Nothing is wrapped unless this is called, so disabled metrics cost nothing.
+    """
+    exclude = set(exclude)
+    wrapped = []
+    for name, _ in inspect.getmembers(type(obj), inspect.iscoroutinefunction):
+        if name.startswith('_') or name in exclude:
+            continue
+        setattr(obj, name, timed(histogram, name)(getattr(obj, name)))
+        wrapped.append(name)
+    return wrapped
+
+
+class MetricsServer:
+    """Serves GET /metrics for a Prometheus scraper."""
+
+    def __init__(self, registry: Registry, host: str = '127.0.0.1', port: int = 9090):
+        """Initialize metrics server
+
+        Args:
+            registry: Metrics to expose
+            host: Interface to listen on (keep it local or firewalled)
+            port: Port to listen on
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+        )
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"📈 Метрики: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -1,6 +1,7 @@
 from aiogram import Bot
 from datetime import datetime
 from bot.config import BOT_TOKEN
+from bot.utils.sender import scheduler, PRIORITY_RELAY, PRIORITY_MENU, PRIORITY_NOTICE
 
 
 async def notify_match_found(
@@ -39,8 +40,8 @@ async def notify_match_found(
     """
     
     try:
-        await bot.send_message(user1_id, msg1)
-        await bot.send_message(user2_id, msg2)
+        await scheduler.call(user1_id, lambda: bot.send_message(user1_id, msg1), priority=PRIORITY_RELAY)
+        await scheduler.call(user2_id, lambda: bot.send_message(user2_id, msg2), priority=PRIORITY_RELAY)
     except Exception as e:
         print(f"Error sending notifications: {e}")
 
@@ -60,7 +61,7 @@ async def notify_ban(bot: Bot, user_id: int, reason: str, expires_at: str):
     """
     
     try:
-        await bot.send_message(user_id, msg)
+        await scheduler.call(user_id, lambda: bot.send_message(user_id, msg), priority=PRIORITY_NOTICE)
     except Exception as e:
         print(f"Error sending ban notification: {e}")
 
@@ -77,7 +78,7 @@ async def notify_report_received(bot: Bot, user_id: int):
     """
     
     try:
-        await bot.send_message(user_id, msg)
+        await scheduler.call(user_id, lambda: bot.send_message(user_id, msg), priority=PRIORITY_MENU)
     except Exception as e:
         print(f"Error sending report notification: {e}")
 
@@ -100,6 +101,6 @@ async def notify_premium_purchased(bot: Bot, user_id: int, subscription_type: st
     """
     
     try:
-        await bot.send_message(user_id, msg)
+        await scheduler.call(user_id, lambda: bot.send_message(user_id, msg), priority=PRIORITY_NOTICE)
     except Exception as e:
         print(f"Error sending premium notification: {e}")
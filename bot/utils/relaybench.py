@@ -0,0 +1,190 @@
+"""Relay latency per content type: copy_message against the old send_* helpers
+
+Runs the bot's relay path in process against a stand-in Bot API session
+with a fixed round-trip time; calls go through the bot's send scheduler
+with its configured rate limits. Latency is counted from the handler
+receiving the message to the last Bot API call for it completing.
+    python -m bot.utils.relaybench --chats 20 --rtt 0.05 --album 5
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import (
+    Animation, Audio, Chat, Document, Location, Message, PhotoSize, Sticker, User, Video, VideoNote, Voice,
+)
+
+import bot.main as main
+from bot.utils.loadgen import percentile
+from bot.utils.sender import PRIORITY_RELAY, SendScheduler
+
+FIRST_USER_ID = 9_000_000_000
+
+
+class FakeSession(BaseSession):
+    """Answers Bot API calls after `rtt` seconds and records when each recipient got them."""
+
+    def __init__(self, rtt: float):
+        super().__init__()
+        self.rtt = rtt
+        self.message_ids = itertools.count(1)
+        self.calls: Dict[str, int] = defaultdict(int)
+        # chat_id -> время завершения последнего вызова
+        self.delivered: Dict[int, float] = {}
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(self.rtt)
+        name = method.__api_method__
+        self.calls[name] += 1
+        chat_id = int(method.chat_id)
+        if name == 'copyMessage':
+            result = {'message_id': next(self.message_ids)}
+        elif name == 'copyMessages':
+            result = [{'message_id': next(self.message_ids)} for _ in method.message_ids]
+        else:
+            result = {
+                'message_id': next(self.message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+            }
+        self.delivered[chat_id] = time.perf_counter()
+        response = self.check_response(bot, method, 200, json.dumps({'ok': True, 'result': result}))
+        return response.result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        raise NotImplementedError
+        yield b''
+
+    async def close(self):
+        pass
+
+
+def make_message(user_id: int, message_id: int, content_type: str, media_group_id: str = None) -> Message:
+    unique = f'u{message_id}'
+    fields = {
+        'text': {'text': 'привет'},
+        'photo': {'photo': [PhotoSize(file_id=f'p{message_id}', file_unique_id=unique, width=1280, height=960)],
+                  'caption': 'фото'},
+        'voice': {'voice': Voice(file_id=f'v{message_id}', file_unique_id=unique, duration=4)},
+        'video': {'video': Video(file_id=f'm{message_id}', file_unique_id=unique, width=640, height=360, duration=9)},
+        'video_note': {'video_note': VideoNote(file_id=f'n{message_id}', file_unique_id=unique, length=240,
+                                               duration=5)},
+        'sticker': {'sticker': Sticker(file_id=f's{message_id}', file_unique_id=unique, type='regular', width=512,
+                                       height=512, is_animated=False, is_video=False)},
+        'document': {'document': Document(file_id=f'd{message_id}', file_unique_id=unique, file_name='doc.pdf')},
+        'animation': {'animation': Animation(file_id=f'a{message_id}', file_unique_id=unique, width=320,
+                                             height=240, duration=2)},
+        'audio': {'audio': Audio(file_id=f'o{message_id}', file_unique_id=unique, duration=180)},
+        'location': {'location': Location(latitude=55.75, longitude=37.62)},
+    }[content_type]
+    return Message(
+        message_id=message_id, date=datetime.now(), chat=Chat(id=user_id, type='private'),
+        from_user=User(id=user_id, is_bot=False, first_name='bench'), media_group_id=media_group_id, **fields,
+    )
+
+
+async def legacy_relay(bot: Bot, partner_id: int, message: Message):
+    """Было: отдельный send_* на каждый тип; остальные типы не пересылались"""
+    if message.text:
+        method = lambda: bot.send_message(chat_id=partner_id, text=message.text)
+    elif message.photo:
+        method = lambda: bot.send_photo(chat_id=partner_id, photo=message.photo[-1].file_id,
+                                        caption=message.caption)
+    elif message.voice:
+        method = lambda: bot.send_voice(chat_id=partner_id, voice=message.voice.file_id)
+    elif message.video:
+        method = lambda: bot.send_video(chat_id=partner_id, video=message.video.file_id, caption=message.caption)
+    elif message.video_note:
+        method = lambda: bot.send_video_note(chat_id=partner_id, video_note=message.video_note.file_id)
+    elif message.sticker:
+        method = lambda: bot.send_sticker(chat_id=partner_id, sticker=message.sticker.file_id)
+    else:
+        return
+    await main.scheduler.call(partner_id, method, priority=PRIORITY_RELAY, timeout=40)
+
+
+async def copy_relay(bot: Bot, partner_id: int, message: Message):
+    if message.media_group_id:
+        await main.relay_media_group(bot, partner_id, message.from_user.id, message)
+    else:
+        await main.relay_message(bot, partner_id, message.from_user.id, message)
+
+
+async def run_case(relay, content_type: str, chats: int, album: int, rtt: float) -> dict:
+    session = FakeSession(rtt)
+    bot = Bot('42:benchmark', session=session)
+    message_ids = itertools.count(1)
+    started: Dict[int, float] = {}
+
+    async def chat(index: int):
+        user_id, partner_id = FIRST_USER_ID + 2 * index, FIRST_USER_ID + 2 * index + 1
+        # Элементы альбома приходят отдельными обновлениями, по очереди
+        items = album if content_type == 'album' else 1
+        group_id = f'g{index}' if content_type == 'album' else None
+        started[partner_id] = time.perf_counter()
+        for _ in range(items):
+            message = make_message(user_id, next(message_ids), 'photo' if group_id else content_type, group_id)
+            await relay(bot, partner_id, message)
+
+    # Свежие корзины лимитов на каждый прогон: строки таблицы не влияют друг на друга
+    scheduler, main.scheduler = main.scheduler, SendScheduler()
+    main.scheduler.start()
+    try:
+        await asyncio.gather(*(chat(index) for index in range(chats)))
+        # Альбом уходит по таймеру MEDIA_GROUP_WAIT
+        while main.pending_media_groups or main.scheduler.pending:
+            await asyncio.sleep(0.01)
+        await main.scheduler.stop()
+    finally:
+        main.scheduler = scheduler
+
+    latencies = [session.delivered[chat_id] - at for chat_id, at in started.items() if chat_id in session.delivered]
+    return {
+        'delivered': len(latencies) / chats,
+        'p50': percentile(latencies, 0.5),
+        'p90': percentile(latencies, 0.9),
+        'calls': sum(session.calls.values()) / chats,
+    }
+
+
+async def benchmark(chats: int, rtt: float, album: int):
+    """Relay one message of each type from `chats` users at once with both paths.
+
+    Args:
+        chats: Concurrent chats per content type
+        rtt: Simulated Bot API round trip in seconds
+        album: Photos per album
+    """
+    # Лог каждой пересылки здесь только мешает
+    logging.getLogger('bot.main').setLevel(logging.WARNING)
+    content_types = ['text', 'photo', 'voice', 'video', 'video_note', 'sticker',
+                     'document', 'animation', 'audio', 'location', 'album']
+    print(f"{chats} chats per type, Bot API round trip {rtt * 1000:.0f} ms, album of {album}, "
+          f"MEDIA_GROUP_WAIT {main.MEDIA_GROUP_WAIT} s")
+    print(f"{'type':<11} {'send_* p50/p90 ms':>18} {'calls':>6} {'delivered':>9}   "
+          f"{'copy p50/p90 ms':>16} {'calls':>6} {'delivered':>9}")
+    for content_type in content_types:
+        row = [await run_case(relay, content_type, chats, album, rtt) for relay in (legacy_relay, copy_relay)]
+        print(f"{content_type:<11} " + "   ".join(
+            f"{result['p50'] * 1000:>8.0f}/{result['p90'] * 1000:<7.0f} {result['calls']:>6.1f} "
+            f"{result['delivered']:>9.0%}"
+            for result in row
+        ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--rtt', type=float, default=0.05)
+    parser.add_argument('--album', type=int, default=5)
+    cli = parser.parse_args()
+    asyncio.run(benchmark(cli.chats, cli.rtt, cli.album))
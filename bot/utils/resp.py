@@ -0,0 +1,120 @@
+"""Minimal asyncio client for the Redis protocol (RESP)"""
+
+import asyncio
+from typing import Any, Iterable, List, Optional
+from urllib.parse import urlparse
+
+
+class RespError(RuntimeError):
+    """Error reply of the server (-ERR ...)."""
+
+
+class RespClient:
+    """One connection to a server speaking the Redis protocol.
+
+    Commands passed to execute() are pipelined: written in one go and
+    their replies read back in order, so a batch costs one round trip.
+    Every reply of a batch is read before an error reply is raised, and
+    any other failure drops the connection, so a later batch never reads
+    replies left over from an earlier one.
+    Works against Redis itself or the local stand-in in bot.utils.broker.
+    """
+
+    def __init__(self, url: str = 'redis://localhost:6379/0'):
+        """Initialize client
+
+        Args:
+            url: redis://[:password@]host[:port][/db]
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def encode(*args) -> bytes:
+        out = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            value = arg if isinstance(arg, bytes) else str(arg).encode()
+            out.append(f'${len(value)}\r\n'.encode() + value + b'\r\n')
+        return b''.join(out)
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError('соединение с Redis закрыто')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            # Не бросаем: остальные ответы пакета ещё в сокете
+            return RespError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2]
+        if kind == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RuntimeError(f'неизвестный ответ Redis: {line!r}')
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        if setup:
+            self._raise_error(await self._pipeline(setup))
+
+    async def _pipeline(self, commands: List[tuple]) -> List[Any]:
+        self._writer.write(b''.join(self.encode(*command) for command in commands))
+        await self._writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    @staticmethod
+    def _raise_error(replies: List[Any]):
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+
+    async def execute(self, commands: Iterable[tuple]) -> List[Any]:
+        """Send commands in one round trip and return their replies.
+
+        Raises:
+            RespError: First error reply of the batch (the other commands still ran)
+        """
+        commands = list(commands)
+        async with self._lock:
+            try:
+                if self._writer is None or self._writer.is_closing():
+                    await self._connect()
+                replies = await self._pipeline(commands)
+            except BaseException:
+                # Ответы больше не сопоставить с командами - переподключаемся в следующий раз
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+                raise
+        self._raise_error(replies)
+        return replies
+
+    async def call(self, *args) -> Any:
+        """Send a single command and return its reply."""
+        reply, = await self.execute([args])
+        return reply
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,408 @@
+"""Outbound Bot API scheduler with flood-limit aware rate limiting"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter,
+)
+
+from bot.config import (
+    SEND_GLOBAL_RATE, SEND_PER_CHAT_RATE, SEND_PER_CHAT_BURST,
+    SEND_MAX_QUEUE, SEND_WORKERS, SEND_MAX_RETRIES, SEND_CALL_DEADLINE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты очереди (меньше - важнее)
+PRIORITY_RELAY = 0    # пересылка сообщений собеседнику, уведомления о матче
+PRIORITY_MENU = 1     # меню и ответы на команды
+PRIORITY_NOTICE = 2   # уведомления администратору и служебные рассылки
+
+LANE_NAMES = {PRIORITY_RELAY: 'relay', PRIORITY_MENU: 'menu', PRIORITY_NOTICE: 'notice'}
+
+
+class SendDropped(Exception):
+    """Raised when a send is rejected because the queue is full."""
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of rejecting."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available, without taking it."""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def reserve(self, now: float) -> float:
+        """Take one token and return seconds to wait before using it."""
+        self._refill(now)
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.paused_until - now)
+
+    def pause(self, until: float):
+        """Hand out no tokens before `until` (TelegramRetryAfter)."""
+        self.paused_until = max(self.paused_until, until)
+
+    def is_idle(self, now: float) -> bool:
+        return now >= self.paused_until and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class _Job:
+    __slots__ = ('priority', 'seq', 'method', 'timeout', 'queued_at', 'expires_at', 'future', 'attempt')
+
+    def __init__(self, priority: int, seq: int, method: Callable[[], Awaitable[Any]], timeout: float,
+                 deadline: float, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.method = method
+        self.timeout = timeout
+        self.queued_at = time.monotonic()
+        self.expires_at = self.queued_at + deadline
+        self.future = future
+        self.attempt = 0
+
+
+class _Chat:
+    __slots__ = ('jobs', 'paused_until', 'timer')
+
+    def __init__(self):
+        self.jobs: Deque[_Job] = deque()
+        # Повтор после ошибки сети или флуд-лимита - не раньше этого времени
+        self.paused_until = 0.0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class SendScheduler:
+    """Central queue for every outgoing Bot API call.
+
+    Every recipient chat has its own FIFO, so calls to one chat run one
+    at a time and in order. A chat enters the ready queue (ordered by the
+    priority lane of its oldest call) only when its per-chat token is
+    available; a chat that has to wait for its limit, a retry_after or a
+    backoff is put back with a timer instead of holding a worker, so a
+    few busy recipients never stall sends to everyone else. Workers then
+    take a global token and run one attempt. TelegramRetryAfter pauses
+    both the chat and the global bucket; network errors are retried a
+    bounded number of times with jittered backoff. Every call has an
+    overall deadline covering queueing and retries.
+    """
+
+    def __init__(self, global_rate: float = 30, per_chat_rate: float = 1, per_chat_burst: float = 3,
+                 max_queue: int = 10000, workers: int = 8, max_retries: int = 3,
+                 max_chat_buckets: int = 50000, call_deadline: float = 60):
+        """Initialize scheduler
+
+        Args:
+            global_rate: Calls per second across all chats
+            per_chat_rate: Calls per second to one chat
+            per_chat_burst: Calls allowed to one chat in a burst
+            max_queue: Pending calls before new ones are dropped
+            workers: Number of concurrent sender tasks
+            max_retries: Retries per call after the first attempt
+            max_chat_buckets: Per-chat buckets kept before idle ones are pruned
+            call_deadline: Default seconds a call may take, queueing and retries included
+        """
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_queue = max_queue
+        self.workers = workers
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+        self.call_deadline = call_deadline
+
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        # Чаты с вызовами в очереди; каждый - либо в _ready, либо ждёт таймера, либо у воркера
+        self._chats: Dict[int, _Chat] = {}
+        self._ready: Optional[asyncio.PriorityQueue] = None
+        self._tasks = []
+        self._seq = 0
+        self.pending = 0
+
+        # Метрики
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.expired = 0
+        self.retries = 0
+        self.retry_after_hits = 0
+        self.wait_total = {lane: 0.0 for lane in LANE_NAMES}
+        self.wait_max = {lane: 0.0 for lane in LANE_NAMES}
+        self.wait_count = {lane: 0 for lane in LANE_NAMES}
+
+    def set_global_rate(self, rate: float):
+        """Change the global limit (e.g. split between several processes)."""
+        self.global_bucket = TokenBucket(rate, rate)
+
+    def start(self):
+        """Start sender workers."""
+        if self._tasks:
+            return
+        self._ready = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10):
+        """Give queued calls up to timeout seconds to finish, then stop workers."""
+        if not self._tasks:
+            return
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for chat in self._chats.values():
+            if chat.timer is not None:
+                chat.timer.cancel()
+            for job in chat.jobs:
+                job.future.cancel()
+        self._chats.clear()
+        self.pending = 0
+        self._ready = None
+
+    async def call(self, chat_id: int, method: Callable[[], Awaitable[Any]],
+                   priority: int = PRIORITY_MENU, timeout: float = 30,
+                   deadline: Optional[float] = None) -> Any:
+        """Schedule a Bot API call and wait for its result.
+
+        Args:
+            chat_id: Recipient chat (used for per-chat limiting)
+            method: Zero-argument factory returning the API coroutine
+            priority: PRIORITY_RELAY, PRIORITY_MENU or PRIORITY_NOTICE
+            timeout: Seconds allowed per attempt
+            deadline: Seconds allowed for the whole call (default - call_deadline)
+
+        Raises:
+            SendDropped: If the queue is full
+            asyncio.TimeoutError: If the call did not finish before the deadline
+        """
+        deadline = self.call_deadline if deadline is None else deadline
+        if not self._tasks:
+            return await asyncio.wait_for(self._execute(chat_id, method, timeout), timeout=deadline)
+
+        if self.pending >= self.max_queue:
+            self.dropped += 1
+            raise SendDropped(f"очередь отправки переполнена ({self.max_queue})")
+
+        self._seq += 1
+        job = _Job(priority, self._seq, method, timeout, deadline, asyncio.get_running_loop().create_future())
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat()
+            chat.jobs.append(job)
+            self._make_ready(chat_id)
+        else:
+            chat.jobs.append(job)
+        self.pending += 1
+
+        try:
+            # По тайм-ауту future отменяется, и воркер пропустит вызов
+            return await asyncio.wait_for(job.future, timeout=deadline)
+        except asyncio.TimeoutError:
+            self.expired += 1
+            raise
+
+    def _make_ready(self, chat_id: int):
+        chat = self._chats.get(chat_id)
+        if chat is None or not chat.jobs or self._ready is None:
+            return
+        chat.timer = None
+        head = chat.jobs[0]
+        self._ready.put_nowait((head.priority, head.seq, chat_id))
+
+    def _chat_wait(self, chat_id: int, chat: _Chat, now: float) -> float:
+        return max(chat.paused_until - now, self._chat_bucket(chat_id, now).wait_time(now))
+
+    def _reschedule(self, chat_id: int, chat: _Chat):
+        """Put the chat back: into the ready queue, or on a timer until it may send."""
+        if not chat.jobs:
+            del self._chats[chat_id]
+            return
+        wait = self._chat_wait(chat_id, chat, time.monotonic())
+        if wait > 0:
+            chat.timer = asyncio.get_running_loop().call_later(wait, self._make_ready, chat_id)
+        else:
+            self._make_ready(chat_id)
+
+    def _finish(self, chat: _Chat):
+        chat.jobs.popleft()
+        self.pending -= 1
+
+    async def _worker(self):
+        while True:
+            _, _, chat_id = await self._ready.get()
+            chat = self._chats[chat_id]
+            try:
+                await self._serve(chat_id, chat)
+            except Exception as e:
+                logger.error(f"❌ Ошибка отправки в {chat_id}: {e}")
+            finally:
+                self._reschedule(chat_id, chat)
+
+    async def _serve(self, chat_id: int, chat: _Chat):
+        """Run one attempt of the chat's oldest call, if the chat may send now."""
+        job = chat.jobs[0]
+        if job.future.done():
+            # Вызывающий уже не ждёт (истёк срок)
+            self._finish(chat)
+            return
+        now = time.monotonic()
+        if self._chat_wait(chat_id, chat, now) > 0:
+            return
+
+        if job.attempt == 0:
+            waited = now - job.queued_at
+            self.wait_total[job.priority] += waited
+            self.wait_count[job.priority] += 1
+            self.wait_max[job.priority] = max(self.wait_max[job.priority], waited)
+
+        self._chat_bucket(chat_id, now).reserve(now)
+        # Глобальный лимит общий для всех чатов - его ожидание никого не обгоняет
+        delay = self.global_bucket.reserve(now)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Попытка не переживает срок вызова: воркер не остаётся занят тем, кого уже не ждут
+        remaining = job.expires_at - time.monotonic()
+        if job.future.done() or remaining <= 0:
+            self._finish(chat)
+            return
+
+        try:
+            result = await asyncio.wait_for(job.method(), timeout=min(job.timeout, remaining))
+        except TelegramRetryAfter as e:
+            # Флуд-лимит Telegram: молчим сколько сказали - и в этот чат, и вообще
+            self.retry_after_hits += 1
+            until = time.monotonic() + e.retry_after
+            chat.paused_until = until
+            self.global_bucket.pause(until)
+            logger.warning(f"⏳ Флуд-лимит для {chat_id}, повтор через {e.retry_after} сек")
+            self._retry_or_fail(chat, job, e)
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            # Повтор не поможет (бот заблокирован, неверный запрос)
+            self._fail(chat, job, e)
+        except (TelegramNetworkError, asyncio.TimeoutError) as e:
+            chat.paused_until = time.monotonic() + min(2 ** job.attempt, 10) * (0.5 + random.random())
+            self._retry_or_fail(chat, job, e)
+        except Exception as e:
+            self._fail(chat, job, e)
+        else:
+            self.sent += 1
+            self._finish(chat)
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def _retry_or_fail(self, chat: _Chat, job: _Job, error: Exception):
+        if job.attempt >= self.max_retries or job.future.done():
+            self._fail(chat, job, error)
+            return
+        job.attempt += 1
+        self.retries += 1
+
+    def _fail(self, chat: _Chat, job: _Job, error: Exception):
+        self.failed += 1
+        self._finish(chat)
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def _chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chat_buckets:
+                self._prune(now)
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        return bucket
+
+    def _prune(self, now: float):
+        idle = [chat_id for chat_id, bucket in self._chat_buckets.items()
+                if bucket.is_idle(now) and chat_id not in self._chats]
+        for chat_id in idle:
+            del self._chat_buckets[chat_id]
+
+    async def _execute(self, chat_id: int, method: Callable[[], Awaitable[Any]], timeout: float) -> Any:
+        """Run a call right away (scheduler not started: tools, tests)."""
+        attempt = 0
+        while True:
+            now = time.monotonic()
+            delay = max(self.global_bucket.reserve(now), self._chat_bucket(chat_id, now).reserve(now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                result = await asyncio.wait_for(method(), timeout=timeout)
+                self.sent += 1
+                return result
+            except TelegramRetryAfter as e:
+                self.retry_after_hits += 1
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    raise
+                await asyncio.sleep(e.retry_after)
+            except (TelegramBadRequest, TelegramForbiddenError):
+                self.failed += 1
+                raise
+            except (TelegramNetworkError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    raise
+                await asyncio.sleep(min(2 ** attempt, 10) * (0.5 + random.random()))
+            except Exception:
+                self.failed += 1
+                raise
+            attempt += 1
+            self.retries += 1
+
+    @property
+    def queue_depth(self) -> int:
+        return self.pending
+
+    def stats(self) -> Dict[str, Any]:
+        """Return scheduler counters."""
+        lanes = {}
+        for lane, name in LANE_NAMES.items():
+            count = self.wait_count[lane]
+            lanes[name] = {
+                'count': count,
+                'avg_wait_ms': (self.wait_total[lane] / count * 1000) if count else 0.0,
+                'max_wait_ms': self.wait_max[lane] * 1000,
+            }
+        return {
+            'queue_depth': self.queue_depth,
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'expired': self.expired,
+            'retries': self.retries,
+            'retry_after_hits': self.retry_after_hits,
+            'lanes': lanes,
+        }
+
+
+scheduler = SendScheduler(
+    global_rate=SEND_GLOBAL_RATE,
+    per_chat_rate=SEND_PER_CHAT_RATE,
+    per_chat_burst=SEND_PER_CHAT_BURST,
+    max_queue=SEND_MAX_QUEUE,
+    workers=SEND_WORKERS,
+    max_retries=SEND_MAX_RETRIES,
+    call_deadline=SEND_CALL_DEADLINE,
+)
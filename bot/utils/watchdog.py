@@ -0,0 +1,304 @@
+"""Event-loop lag watchdog that records what was blocking the loop
+
+Demo with synthetic stalls and the overhead of leaving it on:
+    python -m bot.utils.watchdog --seconds 5
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from types import CodeType, FrameType
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Каталог пакета bot - по нему ищем «свой» кадр стека, а не кадр библиотеки
+_PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Site = Tuple[Optional[str], Optional[str], str]
+
+
+class Offender:
+    """Aggregated stalls with the same handler, DB method and blocking line."""
+
+    __slots__ = ('handler', 'db_method', 'location', 'stack', 'count', 'total_lag', 'max_lag', 'last_seen')
+
+    def __init__(self, handler: Optional[str], db_method: Optional[str], location: str, stack: str):
+        self.handler = handler
+        self.db_method = db_method
+        self.location = location
+        self.stack = stack
+        self.count = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_seen = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'handler': self.handler,
+            'db_method': self.db_method,
+            'location': self.location,
+            'count': self.count,
+            'total_lag_ms': self.total_lag * 1000,
+            'max_lag_ms': self.max_lag * 1000,
+            'stack': self.stack,
+        }
+
+
+class LoopWatchdog:
+    """Measures event-loop lag and captures the loop thread's stack during stalls.
+
+    A task on the loop wakes every `interval` and measures how late it
+    woke up. A daemon thread checks the time of the last wakeup; once the
+    loop has been silent for half of `threshold` it grabs the loop
+    thread's current frame (sys._current_frames), so the stack shows the
+    code that is blocking right now. When the loop wakes up and the lag
+    reached `threshold`, the stack is attributed to the outermost tracked
+    handler and the innermost tracked DB method (see track()) and counted
+    per (handler, DB method, line); shorter pauses are discarded.
+    The cost is one timer wakeup per interval on the loop and a thread
+    that does nothing but compare timestamps until a stall happens.
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.1, top_n: int = 10,
+                 max_sites: int = 500, stack_depth: int = 30):
+        """Initialize watchdog
+
+        Args:
+            threshold: Lag in seconds counted as a stall and captured
+            interval: Seconds between heartbeats on the loop
+            top_n: Offenders returned by top() by default
+            max_sites: Distinct offenders kept (the least frequent is evicted)
+            stack_depth: Frames kept in a captured stack
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.top_n = top_n
+        self.max_sites = max_sites
+        self.stack_depth = stack_depth
+        # код функции -> (вид, имя): 'handler' или 'db'
+        self._tracked: Dict[CodeType, Tuple[str, str]] = {}
+        # Меняется только в потоке цикла событий
+        self._offenders: Dict[Site, Offender] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._beat = time.monotonic()
+        self._beats = 0
+        # Номер пульса, на котором уже сняли стек, и снятое (место, стек)
+        self._captured_beat = -1
+        self._pending: Optional[Tuple[Site, Optional[str]]] = None
+
+        # Метрики
+        self.stalls = 0
+        self.captured = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def track(self, kind: str, functions: Iterable[Callable]):
+        """Attribute stalls inside these functions to them (kind: 'handler' or 'db')."""
+        for fn in functions:
+            fn = getattr(fn, '__wrapped__', fn)
+            code = getattr(fn, '__code__', None)
+            if code is not None:
+                self._tracked[code] = (kind, fn.__qualname__)
+
+    def start(self):
+        """Start heartbeat task and watcher thread; call from the loop's thread."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._thread.join(timeout=1)
+        self._thread = None
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            self._beat = time.monotonic()
+            self._beats += 1
+            self.last_lag = lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag >= self.threshold:
+                self.stalls += 1
+            pending, self._pending = self._pending, None
+            if pending is not None and lag >= self.threshold:
+                self._record(*pending, lag)
+
+    def _watch(self):
+        # Проверяем чаще порога, чтобы застать остановку, пока она длится
+        period = min(self.interval, self.threshold) / 4
+        while not self._stopped.wait(period):
+            beats = self._beats
+            stalled = time.monotonic() - self._beat - self.interval
+            if stalled < self.threshold / 2 or beats == self._captured_beat:
+                continue
+            self._captured_beat = beats
+            try:
+                self._pending = self._capture()
+            except Exception as e:
+                logger.error(f"❌ Ошибка снятия стека цикла событий: {e}")
+
+    def _capture(self) -> Optional[Tuple[Site, Optional[str]]]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        frames: List[FrameType] = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        # frames - от текущего кадра к внешним
+        handler = db_method = None
+        location = None
+        for frame in frames:
+            tracked = self._tracked.get(frame.f_code)
+            if tracked is not None:
+                kind, name = tracked
+                if kind == 'handler':
+                    handler = name
+                elif db_method is None:
+                    db_method = name
+            if location is None and frame.f_code.co_filename.startswith(_PACKAGE_DIR):
+                location = f'{os.path.relpath(frame.f_code.co_filename, _PACKAGE_DIR)}:{frame.f_lineno} {frame.f_code.co_name}'
+        top = frames[0].f_code
+        if location is None:
+            location = f'{os.path.basename(top.co_filename)}:{frames[0].f_lineno} {top.co_name}'
+
+        site = (handler, db_method, location)
+        stack = None
+        if site not in self._offenders:
+            stack = ''.join(traceback.format_list(
+                traceback.extract_stack(frames[0], limit=self.stack_depth)
+            ))
+        return site, stack
+
+    def _record(self, site: Site, stack: Optional[str], lag: float):
+        offender = self._offenders.get(site)
+        if offender is None:
+            if stack is None:
+                # Место вытеснили между снятием стека и пробуждением цикла
+                return
+            if len(self._offenders) >= self.max_sites:
+                rarest = min(self._offenders, key=lambda key: self._offenders[key].count)
+                del self._offenders[rarest]
+            offender = self._offenders[site] = Offender(*site, stack)
+        offender.count += 1
+        offender.total_lag += lag
+        offender.max_lag = max(offender.max_lag, lag)
+        offender.last_seen = time.time()
+        self.captured += 1
+
+        if offender.count == 1:
+            logger.warning(
+                "🐢 Цикл событий стоял %.0f мс: %s | обработчик %s | БД %s\n%s",
+                lag * 1000, offender.location, offender.handler or '—', offender.db_method or '—', offender.stack
+            )
+        else:
+            logger.warning(
+                "🐢 Цикл событий стоял %.0f мс: %s | обработчик %s | БД %s (%s раз)",
+                lag * 1000, offender.location, offender.handler or '—', offender.db_method or '—', offender.count
+            )
+
+    def top(self, n: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Offenders by total stall time, worst first."""
+        ranked = sorted(self._offenders.values(), key=lambda o: (o.total_lag, o.count), reverse=True)
+        return [offender.as_dict() for offender in ranked[:n or self.top_n]]
+
+    def reset(self):
+        self._offenders.clear()
+        self.stalls = self.captured = 0
+        self.max_lag = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'threshold_ms': self.threshold * 1000,
+            'last_lag_ms': max(self.last_lag, 0.0) * 1000,
+            'max_lag_ms': self.max_lag * 1000,
+            'stalls': self.stalls,
+            'captured': self.captured,
+            'offenders': len(self._offenders),
+        }
+
+
+async def benchmark(seconds: float):
+    """Run a busy loop with and without the watchdog, then stall it on purpose."""
+    async def busy(duration: float) -> int:
+        # Много коротких задач - как поток апдейтов
+        ticks = 0
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(0)
+            ticks += 1
+        return ticks
+
+    # Разброс между прогонами - проценты: чередуем прогоны с ним и без и берём медианы
+    await busy(min(seconds, 1))
+    rounds = 5
+    without, watched = [], []
+    for _ in range(rounds):
+        without.append(await busy(seconds / rounds))
+        watchdog = LoopWatchdog()
+        watchdog.start()
+        watched.append(await busy(seconds / rounds))
+        await watchdog.stop()
+    baseline, with_watchdog = sorted(without)[rounds // 2], sorted(watched)[rounds // 2]
+    print(f"Loop iterations/s (median): {baseline * rounds / seconds:,.0f} without, "
+          f"{with_watchdog * rounds / seconds:,.0f} with watchdog "
+          f"({(baseline - with_watchdog) / max(baseline, 1) * 100:+.2f}% overhead)")
+    watchdog.start()
+
+    def read_file_synchronously():
+        time.sleep(0.2)
+
+    async def handle_message():
+        read_file_synchronously()
+
+    async def query_database():
+        time.sleep(0.12)
+
+    async def handle_callback():
+        await query_database()
+
+    watchdog.track('handler', [handle_message, handle_callback])
+    watchdog.track('db', [query_database])
+    for handler in (handle_message, handle_callback, handle_message):
+        # Пауза до и после: пульс должен успеть заснуть до остановки и проснуться после неё
+        await asyncio.sleep(0.2)
+        await handler()
+    await asyncio.sleep(0.2)
+    await watchdog.stop()
+
+    print(watchdog.stats())
+    for offender in watchdog.top():
+        print(f"{offender['count']}x {offender['total_lag_ms']:.0f} ms | {offender['handler']} | "
+              f"{offender['db_method']} | {offender['location']}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Event-loop watchdog demo and overhead')
+    parser.add_argument('--seconds', type=float, default=5)
+    cli = parser.parse_args()
+    asyncio.run(benchmark(cli.seconds))
@@ -0,0 +1,142 @@
+"""Webhook ingress: aiohttp server feeding updates to an ordered worker pool"""
+
+import hmac
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from .executor import OrderedExecutor
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def update_key(update: Update) -> int:
+    """Ordering key of an update: the user who sent it."""
+    user = getattr(update.event, 'from_user', None)
+    if user is not None:
+        return user.id
+    chat = getattr(update.event, 'chat', None)
+    if chat is not None:
+        return chat.id
+    return update.update_id
+
+
+class WebhookServer:
+    """Receives Telegram updates over HTTPS instead of long polling.
+
+    Each POST is checked against the secret token, queued on an
+    OrderedExecutor keyed by user and answered with 200 right away, so
+    Telegram never waits for handlers. When the backlog is full the
+    server answers 503 and Telegram redelivers the update later.
+
+    /healthz reports that the process is alive, /readyz that it accepts
+    updates (started, not shutting down, backlog below 90%).
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, url: str, secret_token: str,
+                 path: str = '/webhook', host: str = '0.0.0.0', port: int = 8080,
+                 workers: int = 64, max_queue: int = 10000, max_per_user: int = 0,
+                 ready_check: Optional[Callable[[], bool]] = None):
+        """Initialize webhook server
+
+        Args:
+            dp: Dispatcher with registered handlers
+            bot: Bot instance
+            url: Public base URL Telegram should call (https://example.com)
+            secret_token: Value Telegram sends in X-Telegram-Bot-Api-Secret-Token
+            path: Webhook path appended to url
+            host: Interface to listen on
+            port: Port to listen on
+            workers: Concurrent update handlers
+            max_queue: Updates allowed to wait before answering 503
+            max_per_user: Updates of one user allowed to wait (extra ones are dropped)
+            ready_check: Extra readiness condition (e.g. database is open)
+        """
+        self.dp = dp
+        self.bot = bot
+        self.url = url.rstrip('/') + path
+        self.secret_token = secret_token
+        self.path = path
+        self.host = host
+        self.port = port
+        self.ready_check = ready_check
+        self.executor = OrderedExecutor(workers=workers, max_queue=max_queue, max_per_key=max_per_user)
+        self._runner: Optional[web.AppRunner] = None
+        self._accepting = False
+
+        # Метрики
+        self.received = 0
+        self.unauthorized = 0
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/healthz', self.handle_health)
+        app.router.add_get('/readyz', self.handle_ready)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(token, self.secret_token):
+            self.unauthorized += 1
+            return web.Response(status=401)
+        if not self._accepting:
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={'bot': self.bot})
+        except Exception as e:
+            logger.warning(f"⚠️ Некорректное обновление: {e}")
+            # 200: повторная доставка того же тела не поможет
+            return web.Response()
+
+        self.received += 1
+        if not self.executor.submit(update_key(update), lambda: self.dp.feed_update(self.bot, update)):
+            return web.Response(status=503)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok'})
+
+    def is_ready(self) -> bool:
+        if not self._accepting or self.executor.saturation >= 0.9:
+            return False
+        return self.ready_check() if self.ready_check else True
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        ready = self.is_ready()
+        return web.json_response(
+            {'ready': ready, **self.executor.stats()},
+            status=200 if ready else 503
+        )
+
+    async def start(self):
+        """Start workers and the HTTP server, then register the webhook."""
+        self.executor.start()
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._accepting = True
+
+        await self.bot.set_webhook(
+            self.url,
+            secret_token=self.secret_token,
+            allowed_updates=self.dp.resolve_used_update_types(),
+        )
+        logger.info(f"✅ Вебхук: {self.url} (слушаем {self.host}:{self.port})")
+
+    async def stop(self):
+        """Stop accepting updates, finish queued ones and close the server."""
+        self._accepting = False
+        await self.executor.stop()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {'received': self.received, 'unauthorized': self.unauthorized, **self.executor.stats()}
@@ -0,0 +1,18 @@
+"""Shared test setup: an isolated database and no log file"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# bot.main читает настройки при импорте - подменяем до него
+_tmp = tempfile.mkdtemp(prefix='bot-tests')
+os.environ['DATABASE_PATH'] = os.path.join(_tmp, 'chat_bot.db')
+os.environ['MESSAGE_ARCHIVE_DIR'] = os.path.join(_tmp, 'archive')
+os.environ['LOG_FILE'] = ''
+os.environ['METRICS_PORT'] = '0'
+os.environ['LOOP_LAG_THRESHOLD_MS'] = '0'
+os.environ['CLUSTER_SHARDS'] = '1'
+os.environ['WEBHOOK_URL'] = ''
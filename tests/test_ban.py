@@ -0,0 +1,50 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import bot.main as main
+from bot.config import MAX_REPORTS_FOR_BAN
+from bot.database.db import Database as LegacyDatabase
+from bot.utils.ban import ban_expiry_worker, check_and_apply_ban, is_user_banned
+
+
+def test_expiry_worker_deletes_expired_bans(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'DB_PATH', str(tmp_path / 'bans.db'))
+
+    async def run():
+        db = main.Database()
+        await db.init_db()
+        await db.ban_user(1, 'истёк', duration_days=1)
+        await db.ban_user(2, 'действует', duration_days=1)
+        await db.ban_user(3, 'навсегда')
+        past = (datetime.now() - timedelta(minutes=1)).isoformat()
+        await db.pool.execute('UPDATE banned_users SET expires_at = ? WHERE user_id = 1', (past,))
+
+        task = asyncio.create_task(ban_expiry_worker(db, interval=0.01))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        rows = await db.pool.fetchall('SELECT user_id FROM banned_users ORDER BY user_id')
+        assert [row['user_id'] for row in rows] == [2, 3]
+        assert await db.unban_expired() == 0
+        db.close()
+
+    asyncio.run(run())
+
+
+def test_report_ban_and_check_on_legacy_database(tmp_path):
+    async def run():
+        db = LegacyDatabase(str(tmp_path / 'legacy.db'))
+        await db.init_db()
+        await db.create_user(1, 'reported')
+        await db.update_user(1, reports_count=MAX_REPORTS_FOR_BAN)
+        assert await check_and_apply_ban(1, db)
+        assert await is_user_banned(1, db)
+
+        await db.update_user(1, ban_expires_at=(datetime.now() - timedelta(seconds=1)).isoformat(' '))
+        # Истёкший бан не действует ещё до прохода фоновой задачи
+        assert not await is_user_banned(1, db)
+        assert await db.unban_expired() == 1
+        assert not (await db.get_user(1))['is_banned']
+
+    asyncio.run(run())
@@ -0,0 +1,28 @@
+from bot.database.cache import LRUCache
+
+
+def test_write_during_read_skips_only_that_key():
+    cache = LRUCache(max_size=10)
+    seen = cache.version
+    # Пока строки 1 и 2 читались из БД, профиль 1 изменился
+    cache.update(1, interests='музыка')
+    cache.put(1, {'interests': ''}, seen)
+    cache.put(2, {'interests': ''}, seen)
+    assert cache.get(1) is None
+    assert cache.get(2) == {'interests': ''}
+
+
+def test_forgotten_writes_still_block_older_reads():
+    cache = LRUCache(max_size=2)
+    seen = cache.version
+    for user_id in range(5):
+        cache.invalidate(user_id)
+    # Запись о ключе 0 вытеснена из учёта - чтение до неё всё равно не кешируется
+    cache.put(0, {'rating': 1.0}, seen)
+    assert cache.get(0) is None
+    cache.put(0, {'rating': 2.0}, cache.version)
+    assert cache.get(0) == {'rating': 2.0}
+
+    cache.clear()
+    cache.put(9, {'rating': 3.0}, seen)
+    assert cache.get(9) is None
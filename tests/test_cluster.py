@@ -0,0 +1,153 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Chat, Message, Update, User
+
+import bot.main as main
+from bot.utils.cluster import route_updates
+
+
+class FakeBot:
+    id = 42
+
+    def __init__(self, batches=()):
+        self.batches = list(batches)
+        self.offsets = []
+        self.sent = []
+
+    async def get_updates(self, offset=None, timeout=None):
+        self.offsets.append(offset)
+        if not self.batches:
+            raise asyncio.CancelledError
+        return self.batches.pop(0)
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.sent.append((chat_id, text))
+
+
+class FakeClient:
+    def __init__(self):
+        self.commands = []
+
+    async def execute(self, commands):
+        self.commands.extend(commands)
+
+
+class FakeCluster:
+    shards = 2
+
+    def __init__(self):
+        self.client = FakeClient()
+        self.released = []
+        self.messages = []
+
+    def owner(self, user_id):
+        return user_id % self.shards
+
+    def queue(self, shard):
+        return f'cluster:shard:{shard}'
+
+    async def release(self, user_id, partner_id):
+        self.released.append((user_id, partner_id))
+
+    async def send_to_user(self, user_id, message):
+        self.messages.append((user_id, message))
+
+
+def make_message_update(update_id, user_id):
+    user = User(id=user_id, is_bot=False, first_name='user')
+    message = Message(message_id=update_id, date=datetime.now(), chat=Chat(id=user_id, type='private'),
+                      from_user=user, text='привет')
+    return Update(update_id=update_id, message=message)
+
+
+def test_router_skips_unknown_update_types():
+    # Обновление без известных aiogram полей - как новый тип Bot API
+    bot = FakeBot([[Update(update_id=1), make_message_update(2, 3)], [Update(update_id=3)]])
+    cluster = FakeCluster()
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(route_updates(bot, cluster))
+
+    assert bot.offsets == [None, 3, 4]
+    assert [(queue, json.loads(body)['update']['update_id']) for _, queue, body in cluster.client.commands] == [
+        ('cluster:shard:1', 2),
+    ]
+
+
+@pytest.fixture
+def shard(monkeypatch):
+    bot, cluster = FakeBot(), FakeCluster()
+    monkeypatch.setattr(main, 'fsm_storage', MemoryStorage())
+    monkeypatch.setattr(main, 'cluster', cluster)
+    monkeypatch.setattr(main, 'bot_instance', bot)
+    monkeypatch.setattr(main, 'active_chats', {})
+    return bot, cluster
+
+
+def test_matched_starts_chat_for_waiting_user(shard):
+    bot, cluster = shard
+
+    async def run():
+        state = main.user_state(bot, 10)
+        await state.set_state(main.UserStates.in_chat)
+        await state.update_data(chat_id=None, partner_id=None, category='random', waiting=True)
+        await main.handle_cluster_message(None, {
+            'type': 'matched', 'user_id': 10, 'partner_id': 11, 'chat_id': 'c1', 'category': 'random',
+        })
+        return await state.get_state(), await state.get_data()
+
+    current, data = asyncio.run(run())
+    assert current == main.UserStates.in_chat.state
+    assert (data['chat_id'], data['partner_id']) == ('c1', 11)
+    assert main.active_chats[10] == {'partner_id': 11, 'chat_id': 'c1'}
+    assert cluster.released == []
+
+
+def test_stale_matched_keeps_state_of_user_in_another_chat(shard):
+    bot, cluster = shard
+
+    async def run():
+        state = main.user_state(bot, 10)
+        await state.set_state(main.UserStates.in_chat)
+        await state.update_data(chat_id='other', partner_id=12, category='random')
+        main.active_chats[10] = {'partner_id': 12, 'chat_id': 'other'}
+        await main.handle_cluster_message(None, {
+            'type': 'matched', 'user_id': 10, 'partner_id': 11, 'chat_id': 'c1', 'category': 'random',
+        })
+        return await state.get_data()
+
+    data = asyncio.run(run())
+    assert (data['chat_id'], data['partner_id']) == ('other', 12)
+    assert main.active_chats[10]['chat_id'] == 'other'
+    assert cluster.released == [(10, 11)]
+    assert cluster.messages == [(11, {'type': 'match_cancelled', 'user_id': 11, 'chat_id': 'c1'})]
+    assert bot.sent == []
+
+
+def test_cancelled_match_clears_only_that_chat(shard):
+    bot, cluster = shard
+
+    async def run():
+        state = main.user_state(bot, 11)
+        await state.set_state(main.UserStates.in_chat)
+        await state.update_data(chat_id='c1', partner_id=10, category='random')
+        main.active_chats[11] = {'partner_id': 10, 'chat_id': 'c1'}
+        # Устаревшая отмена не должна трогать новый диалог
+        other = main.user_state(bot, 13)
+        await other.set_state(main.UserStates.in_chat)
+        await other.update_data(chat_id='c2', partner_id=14)
+        main.active_chats[13] = {'partner_id': 14, 'chat_id': 'c2'}
+
+        await main.handle_cluster_message(None, {'type': 'match_cancelled', 'user_id': 11, 'chat_id': 'c1'})
+        await main.handle_cluster_message(None, {'type': 'match_cancelled', 'user_id': 13, 'chat_id': 'c1'})
+        return await state.get_state(), await other.get_data()
+
+    current, other_data = asyncio.run(run())
+    assert current is None
+    assert 11 not in main.active_chats
+    assert other_data['chat_id'] == 'c2' and main.active_chats[13]['chat_id'] == 'c2'
+    assert [chat_id for chat_id, _ in bot.sent] == [11]
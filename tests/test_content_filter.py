@@ -0,0 +1,73 @@
+import pytest
+
+from bot.utils.content_filter import ContentFilter, FORBIDDEN_KEYWORDS, normalize
+
+
+@pytest.fixture(scope='module')
+def content_filter():
+    return ContentFilter(FORBIDDEN_KEYWORDS)
+
+
+@pytest.mark.parametrize('text', [
+    'давай встретимся в ср',
+    'СР и ЧТ свободна',
+    'ср, чт, пт',
+    'срочно напиши',
+    'сосед опять шумит',
+    'вот мой кот',
+    'мама мыла раму',
+    'рост 180, вес 75',
+    'мне 19, учусь на 3 курсе',
+    'сорок сороков',
+    'my cpu is too hot',
+    'something about methods',
+])
+def test_ordinary_text_passes(content_filter, text):
+    assert content_filter.find(text) is None
+
+
+@pytest.mark.parametrize('text, category', [
+    ('cp', 'csam'),
+    ('сp', 'csam'),                   # кириллическая «с» + латинская p
+    ('кто хочет c0саine', 'drugs'),  # цифра и кириллица внутри латинского слова
+    ('just k.y.s', 'violence'),
+    ('kуs', 'violence'),
+    ('SEND   MONEY now', 'scam'),
+])
+def test_obfuscated_keywords_match(content_filter, text, category):
+    found = content_filter.find(text)
+    assert found is not None and found[0] == category
+
+
+def test_offset_points_into_original_text(content_filter):
+    text = 'привет, кто хочет c0саine?'
+    category, offset, fragment = content_filter.find(text)
+    assert category == 'drugs'
+    assert fragment == 'c0саine'
+    assert text[offset:offset + len(fragment)] == fragment
+
+
+@pytest.mark.parametrize('text', ['İstanbul cp', 'İstanbul сp', 'İİ и cp'])
+def test_lowercase_keeps_offsets(content_filter, text):
+    # 'İ'.lower() - две кодовые точки
+    assert len(normalize(text)) == len(text)
+    assert content_filter.find(text) == ('csam', len(text) - 2, text[-2:])
+
+
+def test_cyrillic_words_are_not_folded():
+    assert normalize('Давай в СР') == 'давай в ср'
+    assert normalize('сp') == 'cp'
+
+
+def test_cyrillic_keyword_matches_plain_and_mixed():
+    content_filter = ContentFilter({'drugs': ['закладка']})
+    assert content_filter.find('где закладка') is not None
+    assert content_filter.find('где зaклaдкa') is not None  # латинские «a»
+
+
+def test_reload_from_file(tmp_path):
+    path = tmp_path / 'keywords.json'
+    path.write_text('{"spam": ["buy now"]}', encoding='utf-8')
+    content_filter = ContentFilter(FORBIDDEN_KEYWORDS, path=str(path), reload_interval=0)
+    assert content_filter.find('buy now!')[0] == 'spam'
+    assert content_filter.find('cocaine') is None
@@ -0,0 +1,90 @@
+import asyncio
+import random
+from datetime import datetime, timezone
+
+import bot.main as main
+from bot.database.counters import read_counters, recount
+from bot.database.partitions import partition_name
+
+VOTE_RECOUNT = '''
+    SELECT u.user_id, u.positive_votes, u.negative_votes, u.rating,
+        (SELECT COUNT(*) FROM votes WHERE votee_id = u.user_id AND vote_type = 'positive'),
+        (SELECT COUNT(*) FROM votes WHERE votee_id = u.user_id AND vote_type != 'positive')
+    FROM users u
+'''
+
+
+def vote_drift(conn):
+    drift = []
+    for user_id, positive, negative, rating, actual_positive, actual_negative in conn.execute(VOTE_RECOUNT):
+        total = actual_positive + actual_negative
+        actual_rating = actual_positive * 100.0 / total if total else 0.0
+        if (positive, negative) != (actual_positive, actual_negative) or abs(rating - actual_rating) > 1e-9:
+            drift.append((user_id, (positive, negative, rating), (actual_positive, actual_negative, actual_rating)))
+    return drift
+
+
+def test_counters_match_full_recount(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'DB_PATH', str(tmp_path / 'counters.db'))
+    monkeypatch.setattr(main, 'MESSAGE_ARCHIVE_DIR', str(tmp_path / 'archive'))
+    rng = random.Random(14)
+    clock = [datetime(2026, 1, 15, tzinfo=timezone.utc)]
+
+    async def run():
+        db = main.Database()
+        await db.init_db()
+        db.partitions.clock = lambda: clock[0]
+        db.journal.start()
+
+        users = list(range(1, 41))
+        for user_id in users:
+            await db.create_user(user_id, f'user{user_id}', 'User')
+        for user_id in rng.sample(users, 15):
+            await db.give_premium(user_id, 1)
+        for user_id in rng.sample(users, 5):
+            await db.remove_premium(user_id)
+
+        chats = []
+        for _ in range(60):
+            user1_id, user2_id = rng.sample(users, 2)
+            chat_id = await db.create_chat(user1_id, user2_id, 'random')
+            chats.append((chat_id, user1_id, user2_id))
+            for _ in range(rng.randint(0, 8)):
+                await db.save_message(chat_id, rng.choice((user1_id, user2_id)), 'привет')
+            if rng.random() < 0.7:
+                await db.end_chat(chat_id)
+            if len(chats) == 30:
+                # Половина переписки - в прошлом месяце, который уйдёт в архив
+                await db.journal.stop()
+                clock[0] = datetime(2026, 2, 15, tzinfo=timezone.utc)
+                db.journal.start()
+
+        # Голоса пачками, с повторами за тот же диалог
+        votes = [
+            (voter, votee, chat_id, rng.choice(('positive', 'negative')))
+            for chat_id, user1_id, user2_id in chats
+            for voter, votee in ((user1_id, user2_id), (user2_id, user1_id)) if rng.random() < 0.8
+        ]
+        await db.save_votes(votes + rng.sample(votes, 10))
+        await db.journal.stop()
+
+        await db.partitions.archive(partition_name('2026-01'))
+        # Удаление данных: голоса, чаты, сообщения и профиль через триггеры удаления
+        for user_id in rng.sample(users, 6):
+            await db.erasure.enqueue(user_id)
+            await db.erasure._process(await db.pool.run(db.erasure._claim))
+
+        drift = await db.pool.run(recount)
+        votes_drift = await db.pool.run(vote_drift)
+        counters = await db.pool.run(read_counters)
+        totals = await db.pool.fetchone('SELECT COUNT(*) AS users, SUM(positive_votes + negative_votes) AS votes FROM users')
+        db.close()
+        return drift, votes_drift, counters, totals
+
+    drift, votes_drift, counters, totals = asyncio.run(run())
+    assert drift == {}
+    assert votes_drift == []
+    # Проверка не вырождена: счётчики ненулевые
+    assert counters['total_users'] == totals['users'] == 34
+    assert counters['total_chats'] > 0 and counters['total_messages'] > 0 and counters['archived_messages'] > 0
+    assert totals['votes'] > 0
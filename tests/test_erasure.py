@@ -0,0 +1,71 @@
+import asyncio
+import lzma
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+import bot.main as main
+from bot.database.partitions import partition_name
+
+
+def archived_senders(path):
+    raw = path + '.check.db'
+    with lzma.open(path, 'rb') as src, open(raw, 'wb') as dst:
+        dst.write(src.read())
+    try:
+        conn = sqlite3.connect(raw)
+        senders = sorted(row[0] for row in conn.execute('SELECT sender_id FROM messages'))
+        conn.close()
+    finally:
+        os.remove(raw)
+    return senders
+
+
+def test_erasure_rewrites_archived_partitions(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'DB_PATH', str(tmp_path / 'erasure.db'))
+    monkeypatch.setattr(main, 'MESSAGE_ARCHIVE_DIR', str(tmp_path / 'archive'))
+    clock = [datetime(2026, 1, 15, tzinfo=timezone.utc)]
+
+    async def run():
+        db = main.Database()
+        await db.init_db()
+        db.partitions.clock = lambda: clock[0]
+        await db.create_user(1, 'leaving', 'Leaving')
+        await db.create_user(2, 'staying', 'Staying')
+
+        await db.pool.run(db.partitions.insert, [('c1', 1, 'старый секрет'), ('c1', 2, 'ответ'), ('c1', 1, 'ещё')])
+        info = await db.partitions.archive(partition_name('2026-01'))
+        clock[0] = datetime(2026, 2, 15, tzinfo=timezone.utc)
+        await db.pool.run(db.partitions.insert, [('c2', 1, 'новый секрет'), ('c2', 2, 'привет')])
+
+        path = os.path.join(main.MESSAGE_ARCHIVE_DIR, partition_name('2026-01') + '.db.xz')
+        assert info['rows'] == 3
+        assert archived_senders(path) == [1, 1, 2]
+
+        erased = []
+
+        async def on_done(user_id, deleted):
+            erased.append((user_id, deleted))
+
+        db.erasure.on_done = on_done
+        await db.erasure.enqueue(1)
+        await db.erasure._process(await db.pool.run(db.erasure._claim))
+
+        # Профиль, 1 горячее и 2 архивных сообщения
+        assert erased == [(1, 4)]
+        assert archived_senders(path) == [2]
+        hot = await db.pool.fetchall('SELECT sender_id FROM messages')
+        assert [row['sender_id'] for row in hot] == [2]
+        catalog = await db.pool.fetchone(
+            'SELECT rows FROM message_partitions WHERE name = ?', (partition_name('2026-01'),)
+        )
+        assert catalog['rows'] == 1
+        counter = await db.pool.fetchone("SELECT value FROM stats_counters WHERE name = 'archived_messages'")
+        assert counter['value'] == 1
+        assert await db.pool.fetchone('SELECT 1 FROM users WHERE user_id = 1') is None
+        job = await db.erasure.job_of(1)
+        assert job['status'] == 'done' and job['deleted'] == 4
+        assert sorted(os.listdir(main.MESSAGE_ARCHIVE_DIR)) == [partition_name('2026-01') + '.db.xz']
+        db.close()
+
+    asyncio.run(run())
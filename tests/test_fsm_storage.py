@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+import bot.main as main
+from bot.database.fsm_storage import CachedStorage, RedisBackend
+from bot.utils.broker import Broker
+from bot.utils.matchmaker import Matchmaker
+from bot.utils.resp import RespClient, RespError
+
+
+async def start_broker():
+    server = await asyncio.start_server(Broker().handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f'redis://127.0.0.1:{port}/0'
+
+
+def test_error_reply_mid_pipeline_keeps_connection_in_sync():
+    async def run():
+        server, url = await start_broker()
+        client = RespClient(url)
+        with pytest.raises(RespError):
+            await client.execute([('SET', 'a', '1'), ('BOGUS',), ('SET', 'b', '2'), ('GET', 'a')])
+        # Ответы после ошибки прочитаны - следующий вызов получает свой ответ, а не чужой
+        assert await client.call('GET', 'b') == b'2'
+        assert await client.execute([('GET', 'a'), ('GET', 'missing')]) == [b'1', None]
+        await client.close()
+        server.close()
+
+    asyncio.run(run())
+
+
+def test_protocol_error_drops_connection():
+    async def garbage(reader, writer):
+        await reader.readline()
+        writer.write(b'?\r\n+OK\r\n')
+        await writer.drain()
+
+    async def run():
+        server = await asyncio.start_server(garbage, '127.0.0.1', 0)
+        client = RespClient(f'redis://127.0.0.1:{server.sockets[0].getsockname()[1]}/0')
+        with pytest.raises(RuntimeError):
+            await client.call('PING')
+        # Непрочитанный «+OK» не достанется следующему вызову
+        assert client._writer is None
+        server.close()
+
+    asyncio.run(run())
+
+
+def test_in_state_merges_backend_and_unflushed_writes():
+    async def run():
+        server, url = await start_broker()
+        storage = CachedStorage(RedisBackend(url))
+        for user_id, state in ((1, 'UserStates:in_chat'), (2, 'UserStates:waiting_age'), (3, 'UserStates:in_chat')):
+            await storage.set_state(StorageKey(bot_id=42, chat_id=user_id, user_id=user_id), state)
+        await storage.flush()
+
+        # Новое хранилище после «перезапуска»: записи только в бэкенде, плюс незаписанное изменение
+        restarted = CachedStorage(RedisBackend(url))
+        await restarted.set_state(StorageKey(bot_id=42, chat_id=3, user_id=3), None)
+        records = await restarted.in_state('UserStates:in_chat')
+        await restarted.close()
+        await storage.close()
+        server.close()
+        return records
+
+    assert list(asyncio.run(run())) == ['42:1:1:default']
+
+
+def test_waiting_users_are_requeued_after_restart(monkeypatch):
+    sent = []
+
+    class FakeBot:
+        id = 42
+
+        async def send_message(self, chat_id, text, reply_markup=None):
+            sent.append(chat_id)
+
+    bot = FakeBot()
+    monkeypatch.setattr(main, 'fsm_storage', CachedStorage())
+    monkeypatch.setattr(main, 'matchmaker', Matchmaker())
+    monkeypatch.setattr(main, 'active_chats', {})
+    monkeypatch.setattr(main, 'bot_instance', bot)
+
+    async def run():
+        for user_id, data in ((1, {'waiting': True, 'chat_id': None, 'category': 'random'}),
+                              (2, {'waiting': True, 'chat_id': 'old', 'partner_id': 9, 'category': 'random'}),
+                              (3, {'waiting': True, 'chat_id': None, 'category': 'random'})):
+            state = main.user_state(bot, user_id)
+            await state.set_state(main.UserStates.in_chat)
+            await state.set_data(data)
+
+        await main.resume_waiting_searches(bot)
+        return [await main.user_state(bot, user_id).get_data() for user_id in (1, 2, 3)]
+
+    first, second, third = asyncio.run(run())
+    # Первый снова в очереди, третий нашёл его; второй уже был в диалоге
+    assert (first['chat_id'], first['partner_id']) == (third['chat_id'], 3)
+    assert third['partner_id'] == 1
+    assert second['chat_id'] == 'old'
+    assert set(main.active_chats) == {1, 3}
+    assert len(main.matchmaker) == 0
+    assert sorted(sent) == [1, 3]
+
+
+def test_memory_only_storage_keeps_records_beyond_max_size():
+    async def run():
+        storage = CachedStorage(max_size=10)
+        keys = [StorageKey(bot_id=42, chat_id=user_id, user_id=user_id) for user_id in range(50)]
+        for user_id, key in enumerate(keys):
+            await storage.set_state(key, 'UserStates:in_chat')
+            await storage.update_data(key, {'chat_id': f'c{user_id}', 'partner_id': user_id + 1})
+        # Очищенное состояние в памяти не копится
+        await storage.set_state(keys[0], None)
+        await storage.set_data(keys[0], {})
+        return [(await storage.get_state(key), await storage.get_data(key)) for key in keys], len(storage._records)
+
+    records, kept = asyncio.run(run())
+    assert records[0] == (None, {})
+    assert records[1:] == [
+        ('UserStates:in_chat', {'chat_id': f'c{user_id}', 'partner_id': user_id + 1}) for user_id in range(1, 50)
+    ]
+    assert kept == 49
@@ -0,0 +1,77 @@
+import asyncio
+import random
+from collections import Counter, defaultdict
+
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import bot.main as main
+from bot.utils.matchmaker import Matchmaker
+from bot.utils.sender import SendScheduler
+
+CATEGORIES = ['random', 'gender_filter', 'interests']
+GENDERS = ['👨 Парень', '👩 Девушка']
+
+
+def test_concurrent_searches_never_double_match(monkeypatch):
+    rng = random.Random(5)
+    profiles = {
+        user_id: {'user_id': user_id, 'gender': rng.choice(GENDERS), 'interests': rng.choice(['', 'музыка', 'игры'])}
+        for user_id in range(1, 301)
+    }
+    chats = []
+
+    async def get_user(user_id):
+        # Чтение профиля и запись чата уступают цикл - как запросы к пулу БД
+        await asyncio.sleep(rng.random() / 1000)
+        return profiles[user_id]
+
+    async def create_chat(user1_id, user2_id, category, chat_id=None):
+        await asyncio.sleep(rng.random() / 500)
+        chats.append((chat_id, user1_id, user2_id))
+        return chat_id
+
+    class SlowBot:
+        id = 42
+
+        async def send_message(self, chat_id, text, reply_markup=None):
+            # Медленный Bot API не должен держать lock категории
+            await asyncio.sleep(rng.random() / 100)
+
+    monkeypatch.setattr(main.db, 'get_user', get_user)
+    monkeypatch.setattr(main.db, 'create_chat', create_chat)
+    monkeypatch.setattr(main, 'fsm_storage', MemoryStorage())
+    monkeypatch.setattr(main, 'matchmaker', Matchmaker())
+    monkeypatch.setattr(main, 'active_chats', {})
+    monkeypatch.setattr(main, 'partner_search_locks', defaultdict(asyncio.Lock))
+    # Лимит Telegram здесь не проверяем
+    monkeypatch.setattr(main, 'scheduler', SendScheduler(global_rate=100000, per_chat_rate=100000))
+    bot = SlowBot()
+
+    async def search(user_id):
+        await asyncio.sleep(rng.random() / 100)
+        category = rng.choice(CATEGORIES)
+        filters = {'gender': rng.choice(GENDERS + ['any'])} if category == 'gender_filter' else {}
+        result = await main.find_partner(user_id, category, filters, bot, main.user_state(bot, user_id))
+        return user_id, result
+
+    async def run():
+        # Повторные нажатия: у части пользователей по несколько одновременных поисков
+        calls = [search(user_id) for user_id in profiles for _ in range(rng.randint(1, 3))]
+        return await asyncio.gather(*calls)
+
+    results = asyncio.run(run())
+
+    appearances = Counter(user_id for _, user1_id, user2_id in chats for user_id in (user1_id, user2_id))
+    assert chats and max(appearances.values()) == 1
+
+    by_chat = {chat_id: {user1_id, user2_id} for chat_id, user1_id, user2_id in chats}
+    for user_id, current in main.active_chats.items():
+        partner = main.active_chats[current['partner_id']]
+        assert partner == {'partner_id': user_id, 'chat_id': current['chat_id']}
+        assert by_chat[current['chat_id']] == {user_id, current['partner_id']}
+        assert user_id not in main.matchmaker
+    assert set(main.active_chats) == set(appearances)
+
+    for user_id, (partner_id, chat_id) in results:
+        if partner_id is not None:
+            assert main.active_chats[user_id] == {'partner_id': partner_id, 'chat_id': chat_id}
@@ -0,0 +1,49 @@
+import asyncio
+import sqlite3
+
+import bot.main as main
+from bot.database.db import Database as LegacyDatabase
+from bot.database.migrations import (
+    DB_SCHEMA_HOT_QUERIES, DB_SCHEMA_MIGRATIONS, MAIN_SCHEMA_HOT_QUERIES, MAIN_SCHEMA_MIGRATIONS, full_scans, migrate,
+)
+
+
+def test_main_schema_hot_queries_use_indexes(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'DB_PATH', str(tmp_path / 'main.db'))
+
+    async def run():
+        db = main.Database()
+        await db.init_db()
+        # Раздел текущего месяца: messages - представление над разделами
+        await db.pool.run(db.partitions.ensure, db.partitions.current_month())
+        scans = await db.pool.run(full_scans, MAIN_SCHEMA_HOT_QUERIES)
+        applied = await db.pool.fetchall('SELECT version FROM schema_migrations ORDER BY version')
+        rerun = await db.pool.run(migrate, MAIN_SCHEMA_MIGRATIONS)
+        db.close()
+        return scans, [row['version'] for row in applied], rerun
+
+    scans, applied, rerun = asyncio.run(run())
+    assert scans == []
+    assert applied == [m.version for m in MAIN_SCHEMA_MIGRATIONS]
+    assert rerun == []
+
+
+def test_db_schema_hot_queries_use_indexes(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    asyncio.run(LegacyDatabase(path).init_db())
+
+    conn = sqlite3.connect(path)
+    try:
+        assert full_scans(conn, DB_SCHEMA_HOT_QUERIES) == []
+        assert migrate(conn, DB_SCHEMA_MIGRATIONS) == []
+    finally:
+        conn.close()
+
+
+def test_full_scans_reports_unindexed_query():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, owner INTEGER)')
+    query = ('SELECT * FROM t WHERE owner = ?', (1,))
+    assert [sql for sql, _ in full_scans(conn, [query])] == [query[0]]
+    conn.execute('CREATE INDEX idx_t_owner ON t (owner)')
+    assert full_scans(conn, [query]) == []
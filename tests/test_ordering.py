@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime
+
+import bot.main as main
+from aiogram.types import Chat, Message, Update, User
+from bot.middleware.ordering import UserOrderingMiddleware
+
+
+def make_update(update_id, user_id, message_id, media_group_id=None, text=None):
+    user = User(id=user_id, is_bot=False, first_name='user')
+    message = Message(
+        message_id=message_id, date=datetime.now(), chat=Chat(id=user_id, type='private'),
+        from_user=user, media_group_id=media_group_id, text=text,
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def test_album_items_are_batched_behind_ordering(monkeypatch):
+    delivered = []
+
+    async def deliver_relay(bot, partner_id, user_id, from_chat_id, message_ids, content_type):
+        delivered.append((content_type, list(message_ids)))
+
+    monkeypatch.setattr(main, 'deliver_relay', deliver_relay)
+    monkeypatch.setattr(main, 'MEDIA_GROUP_WAIT', 0.05)
+
+    async def handler(event, data):
+        message = event.message
+        if message.media_group_id:
+            await main.relay_media_group(None, 2, message.from_user.id, message)
+        else:
+            await main.relay_message(None, 2, message.from_user.id, message)
+
+    async def run():
+        ordering = UserOrderingMiddleware(max_depth=20)
+        updates = [make_update(i, 1, 100 + i, media_group_id='album') for i in range(5)]
+        # Текст сразу за альбомом должен уйти после альбома, а не раньше
+        updates.append(make_update(5, 1, 200, text='после альбома'))
+        await asyncio.gather(*(
+            ordering(handler, update, {'event_from_user': update.message.from_user}) for update in updates
+        ))
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert delivered == [('media_group', [100, 101, 102, 103, 104]), ('text', [200])]
+    assert main.pending_media_groups == {}
+    assert main.user_media_groups == {}
+
+
+def test_album_flushes_after_wait(monkeypatch):
+    delivered = []
+
+    async def deliver_relay(bot, partner_id, user_id, from_chat_id, message_ids, content_type):
+        delivered.append(list(message_ids))
+
+    monkeypatch.setattr(main, 'deliver_relay', deliver_relay)
+    monkeypatch.setattr(main, 'MEDIA_GROUP_WAIT', 0.05)
+
+    async def run():
+        for message_id in (11, 10):
+            update = make_update(message_id, 3, message_id, media_group_id='second')
+            await main.relay_media_group(None, 4, 3, update.message)
+        assert delivered == []
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert delivered == [[10, 11]]
@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timezone
+
+import bot.main as main
+from bot.database.partitions import partition_name
+
+
+def test_message_ids_stay_unique_across_partitions(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'DB_PATH', str(tmp_path / 'partitions.db'))
+    monkeypatch.setattr(main, 'MESSAGE_ARCHIVE_DIR', str(tmp_path / 'archive'))
+    clock = [datetime(2026, 1, 15, tzinfo=timezone.utc)]
+
+    async def run():
+        db = main.Database()
+        await db.init_db()
+        db.partitions.clock = lambda: clock[0]
+        insert = lambda rows: db.pool.run(db.partitions.insert, rows)
+
+        await insert([('c1', 1, 'раз'), ('c1', 2, 'два'), ('c1', 1, 'три')])
+        clock[0] = datetime(2026, 2, 15, tzinfo=timezone.utc)
+        await insert([('c2', 1, 'четыре'), ('c2', 2, 'пять')])
+        # Февраль опустел (удаление данных) и ушёл в архив вместе с январём
+        await db.pool.execute(f"DELETE FROM {partition_name('2026-02')}")
+        await db.partitions.archive(partition_name('2026-01'))
+        await db.partitions.archive(partition_name('2026-02'))
+        clock[0] = datetime(2026, 4, 15, tzinfo=timezone.utc)
+        await insert([('c3', 1, 'шесть')])
+        rows = await db.pool.fetchall('SELECT id FROM messages ORDER BY id')
+        db.close()
+        return [row['id'] for row in rows]
+
+    assert asyncio.run(run()) == [6]
+
+
+def test_view_ids_are_unique_after_rollover(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'DB_PATH', str(tmp_path / 'rollover.db'))
+    monkeypatch.setattr(main, 'MESSAGE_ARCHIVE_DIR', str(tmp_path / 'archive'))
+    clock = [datetime(2026, 1, 15, tzinfo=timezone.utc)]
+
+    async def run():
+        db = main.Database()
+        await db.init_db()
+        db.partitions.clock = lambda: clock[0]
+        for month in range(1, 4):
+            clock[0] = datetime(2026, month, 15, tzinfo=timezone.utc)
+            await db.pool.run(db.partitions.insert, [(f'c{month}', user_id, 'привет') for user_id in range(5)])
+        rows = await db.pool.fetchall('SELECT id FROM messages')
+        db.close()
+        return [row['id'] for row in rows]
+
+    ids = asyncio.run(run())
+    assert len(ids) == 15 and len(set(ids)) == 15
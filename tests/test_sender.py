@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from bot.utils.sender import PRIORITY_MENU, PRIORITY_RELAY, SendScheduler
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_busy_chats_do_not_block_other_chats():
+    async def scenario():
+        # Один воркер: если бы он ждал лимита чата 1, чат 2 стоял бы за ним
+        scheduler = SendScheduler(global_rate=1000, per_chat_rate=2, per_chat_burst=1, workers=1)
+        scheduler.start()
+        sent = []
+
+        async def send(chat_id, n):
+            sent.append((chat_id, n))
+
+        busy = [asyncio.create_task(scheduler.call(1, lambda n=n: send(1, n))) for n in range(4)]
+        await asyncio.sleep(0.01)
+        started = time.monotonic()
+        await scheduler.call(2, lambda: send(2, 0))
+        elapsed = time.monotonic() - started
+        await asyncio.gather(*busy)
+        await scheduler.stop()
+        return elapsed, sent
+
+    elapsed, sent = run(scenario())
+    assert elapsed < 0.2
+    assert [n for chat_id, n in sent if chat_id == 1] == [0, 1, 2, 3]
+
+
+def test_relay_lane_goes_first():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=1000, per_chat_rate=1000, per_chat_burst=1000, workers=1)
+        order = []
+
+        async def send(label):
+            order.append(label)
+
+        scheduler.start()
+        # Воркер занят, пока в очередь встают остальные
+        first = asyncio.create_task(scheduler.call(1, lambda: asyncio.sleep(0.05)))
+        await asyncio.sleep(0)
+        calls = [
+            scheduler.call(2, lambda: send('menu'), priority=PRIORITY_MENU),
+            scheduler.call(3, lambda: send('relay'), priority=PRIORITY_RELAY),
+        ]
+        await asyncio.gather(first, *calls)
+        await scheduler.stop()
+        return order
+
+    assert run(scenario()) == ['relay', 'menu']
+
+
+def test_retry_after_pauses_global_bucket():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=1000, per_chat_rate=1000, per_chat_burst=1000, workers=4)
+        scheduler.start()
+        attempts = []
+
+        async def flooded():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise TelegramRetryAfter(SendMessage(chat_id=1, text='x'), 'Flood control exceeded', 1)
+            return 'ok'
+
+        async def other():
+            return time.monotonic()
+
+        started = time.monotonic()
+        task = asyncio.create_task(scheduler.call(1, flooded))
+        await asyncio.sleep(0.05)
+        other_sent_at = await scheduler.call(2, other)
+        result = await task
+        await scheduler.stop()
+        return started, attempts, other_sent_at, result, scheduler.stats()
+
+    started, attempts, other_sent_at, result, stats = run(scenario())
+    assert result == 'ok'
+    assert attempts[1] - started >= 0.95
+    # Другой чат тоже ждал, пока действует флуд-лимит
+    assert other_sent_at - started >= 0.95
+    assert stats['retry_after_hits'] == 1 and stats['retries'] == 1
+
+
+def test_call_deadline():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=1000, per_chat_rate=1000, per_chat_burst=1000, workers=1)
+        scheduler.start()
+        with pytest.raises(asyncio.TimeoutError):
+            await scheduler.call(1, lambda: asyncio.sleep(5), timeout=10, deadline=0.1)
+        # Воркер не занят навсегда: следующий вызов проходит
+        never = asyncio.create_task(scheduler.call(2, lambda: asyncio.sleep(0), deadline=1))
+        await never
+        await scheduler.stop(timeout=0)
+        return scheduler.stats()
+
+    stats = run(scenario())
+    assert stats['expired'] == 1